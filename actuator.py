@@ -0,0 +1,490 @@
+"""
+This file has the actuator functionality (one thread owns every access to the GPIO handler and to the servo motors, and
+applies the commands queued by the REST handlers, the jog channel, the trajectories and the duty cycle writers)
+"""
+
+# region imports
+import collections
+import concurrent.futures
+import contextvars
+import functools
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+
+from metrics import metrics_registry
+from globals import console, rest_error_message_handler
+# endregion imports
+
+
+# region ActuatorCommand
+# the command ids are a per-process prefix and a counter (\"uuid4\" reads the system random source on every call)
+COMMAND_ID_PREFIX = uuid.uuid4().hex[:8]
+command_ids = itertools.count(1)
+
+
+class ActuatorCommand(object):
+    """
+    This class holds a queued actuator command and the future completed once it has been applied
+    """
+
+    def __init__(self, name, function, args, due_time=None, is_priority=False, is_preemptible=True):
+        """
+        This constructor initializes the actuator command
+
+        :param name: (String) The command name (used in the metrics)
+        :param function: (Function) The function that is called by the actuator thread
+        :param args: (Tuple) The function arguments
+        :param due_time: (Float) The monotonic time before which the command is not applied (None: right away)
+        :param is_priority: (Boolean) Whether or not the command is applied before the queued ones
+        :param is_preemptible: (Boolean) Whether or not a priority command cancels the command (see \"preempt\")
+        """
+        self.command_id = '%s-%x' % (COMMAND_ID_PREFIX, next(command_ids))
+        self.name = name
+        self.function = function
+        self.args = args
+        self.due_time = due_time
+        self.is_priority = is_priority
+        self.is_preemptible = is_preemptible
+        self.list_preempted_commands = []
+
+        self.status = 'queued'
+        self.error_message = None
+        self.is_timed_out = False
+        self.future = concurrent.futures.Future()
+
+        self.created_time = time.time()
+        self.enqueued_time = time.monotonic()
+        self.applied_time = None
+
+    def cancel(self):
+        """
+        This method cancels the command (if it has not been applied yet)
+
+        :return: Boolean (True or False)
+        """
+        if self.future.cancel():
+            self.status = 'cancelled'
+            return True
+
+        return False
+
+    def wait(self, timeout=None):
+        """
+        This method waits until the command has been applied. A command that times out is cancelled if it has not
+        started yet (nobody would get its result), except for the priority ones (a stop is still applied).
+
+        :param timeout: (Float) The maximum wait, in seconds
+        :return: The result of the command function (False if the command failed, was cancelled or timed out)
+        """
+        try:
+            return self.future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            self.is_timed_out = True
+            if not self.is_priority:
+                self.cancel()
+            self.error_message = 'The command %s has not been applied in %s seconds' % (self.name, str(timeout))
+            return False
+        except concurrent.futures.CancelledError:
+            self.error_message = 'The command %s has been cancelled' % self.name
+            return False
+        except Exception as error_message:
+            self.error_message = str(error_message)
+            return False
+
+    def get_status(self):
+        """
+        This method returns the command status
+
+        :return: (Dictionary) The command id, name, status and error message
+        """
+        return {
+            'command_id': self.command_id,
+            'name': self.name,
+            'status': self.status,
+            'error_message': self.error_message,
+            'created_time': self.created_time,
+            'applied_time': self.applied_time
+        }
+
+
+# endregion ActuatorCommand
+
+
+# region ActuatorHandler
+class ActuatorHandler(object):
+    """
+    This class runs the actuator thread. The commands are applied one at a time, in the order they were queued (the
+    scheduled ones once they are due), so the GPIO accesses never interleave and the request threads never wait for
+    the hardware unless they ask to. The priority commands (the stops) skip the queue: they cancel every preemptible
+    queued command and are applied as soon as the command being applied (if any) returns.
+    """
+
+    def __init__(self, max_commands=1000, timeout=None):
+        """
+        This constructor initializes the actuator handler
+
+        :param max_commands: (Integer) The number of commands kept for status queries
+        :param timeout: (Float) The maximum number of seconds a caller waits for a command to be applied
+                        (Default: the \"ROBOTIC_ARM_ACTUATOR_TIMEOUT\" environment variable, otherwise 5)
+        """
+        try:
+            self.max_commands = max_commands
+            if timeout is None:
+                timeout = float(os.environ.get('ROBOTIC_ARM_ACTUATOR_TIMEOUT', 5))
+            self.timeout = timeout
+
+            # whether or not the last command waited for timed out (per context, as the REST error messages)
+            self.is_timed_out = contextvars.ContextVar('is_timed_out', default=False)
+
+            self.queue = collections.deque()
+            self.priority_queue = collections.deque()
+            self.scheduled_commands = []
+            self.sequence = itertools.count()
+            self.condition = threading.Condition()
+
+            self.dict_commands = collections.OrderedDict()
+            self.thread = None
+            self.current_command = None
+
+            self.queue_depth = metrics_registry.gauge(
+                'robotic_arm_actuator_queue_depth',
+                'The number of commands waiting for the actuator thread',
+                function=lambda: {(): len(self.queue) + len(self.priority_queue) + len(self.scheduled_commands)})
+            self.queue_latency = metrics_registry.histogram(
+                'robotic_arm_actuator_queue_latency_seconds',
+                'The time between queueing a command and applying it (after its due time, for the scheduled ones)',
+                ('command',))
+            self.apply_duration = metrics_registry.histogram(
+                'robotic_arm_actuator_apply_duration_seconds',
+                'The time spent applying a command on the actuator thread',
+                ('command',))
+            self.command_counter = metrics_registry.counter(
+                'robotic_arm_actuator_commands',
+                'The number of commands applied by the actuator thread (per command and result)',
+                ('command', 'result'))
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, 'ActuatorHandler')
+
+    def start(self):
+        """
+        This method starts the actuator thread (if it is not already running)
+
+        :return: Boolean (True or False)
+        """
+        with self.condition:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='actuator', daemon=True)
+                self.thread.start()
+
+        return True
+
+    def is_actuator_thread(self):
+        return threading.current_thread() is self.thread
+
+    def submit(self, name, function, *args):
+        """
+        This method queues a command (it returns right away)
+
+        :param name: (String) The command name
+        :param function: (Function) The function that is called by the actuator thread
+        :param args: The function arguments
+        :return: (ActuatorCommand) The command
+        """
+        return self.enqueue(ActuatorCommand(name, function, args))
+
+    def schedule(self, delay, name, function, *args, is_preemptible=True):
+        """
+        This method queues a command that is applied once \"delay\" seconds have passed
+
+        :param delay: (Float) The delay, in seconds
+        :param name: (String) The command name
+        :param function: (Function) The function that is called by the actuator thread
+        :param args: The function arguments
+        :param is_preemptible: (Boolean) Whether or not a priority command cancels the command (the commands whose
+                               caller has already been answered, e.g. the deferred duty cycle writes, are cancelled by
+                               their owner instead)
+        :return: (ActuatorCommand) The command
+        """
+        return self.enqueue(ActuatorCommand(name, function, args, time.monotonic() + delay,
+                                            is_preemptible=is_preemptible))
+
+    def preempt(self, name, function, *args):
+        """
+        This method queues a priority command, which is applied before any other (e.g. an emergency stop, which should
+        not wait behind the queued motion). Every queued and scheduled command (except the ones that are not
+        preemptible) is taken out of the queue and cancelled once the priority command has been applied.
+
+        :param name: (String) The command name
+        :param function: (Function) The function that is called by the actuator thread
+        :param args: The function arguments
+        :return: (ActuatorCommand) The command
+        """
+        command = ActuatorCommand(name, function, args, is_priority=True)
+        if self.thread is None:
+            self.start()
+
+        with self.condition:
+            command.list_preempted_commands = self.take_queued_commands(is_preemptible_only=True)
+            self.priority_queue.append(command)
+            self.dict_commands[command.command_id] = command
+            self.condition.notify()
+
+        return command
+
+    def take_queued_commands(self, is_preemptible_only=False):
+        """
+        This method empties the queue and the scheduled commands (the caller holds the condition)
+
+        :param is_preemptible_only: (Boolean) Whether or not the scheduled commands that are not preemptible are kept
+        :return: (List) The commands that were queued or scheduled
+        """
+        list_commands = list(self.queue)
+        self.queue.clear()
+
+        # the scheduled commands list is replaced as a whole (see \"get_next_command\")
+        scheduled_commands = []
+        for entry in self.scheduled_commands:
+            if is_preemptible_only and not entry[2].is_preemptible:
+                scheduled_commands.append(entry)
+            else:
+                list_commands.append(entry[2])
+        heapq.heapify(scheduled_commands)
+        self.scheduled_commands = scheduled_commands
+
+        return list_commands
+
+    def cancel_queued_commands(self):
+        """
+        This method cancels the queued and scheduled commands (the priority commands are kept)
+
+        :return: (Integer) The number of cancelled commands
+        """
+        with self.condition:
+            list_commands = self.take_queued_commands()
+
+        return self.cancel_commands(list_commands)
+
+    def cancel_commands(self, list_commands):
+        """
+        This method cancels some commands that are no longer queued. Whoever waits for them gets False, with a \"has
+        been cancelled\" error message.
+
+        :param list_commands: (List) The commands
+        :return: (Integer) The number of cancelled commands
+        """
+        number_of_cancelled_commands = 0
+        for command in list_commands:
+            if command.cancel():
+                self.command_counter.inc((command.name, 'cancelled'))
+                number_of_cancelled_commands += 1
+
+        return number_of_cancelled_commands
+
+    def execute(self, name, function, *args, timeout=None):
+        """
+        This method applies a command and waits for its result (it is applied right away when it is called from the
+        actuator thread itself)
+
+        :param name: (String) The command name
+        :param function: (Function) The function that is called by the actuator thread
+        :param args: The function arguments
+        :param timeout: (Float) The maximum wait, in seconds (Default: the actuator timeout)
+        :return: The result of the function (False if the command failed or timed out)
+        """
+        if self.is_actuator_thread():
+            return function(*args)
+
+        return self.wait(self.submit(name, function, *args), timeout)
+
+    def wait(self, command, timeout=None):
+        """
+        This method waits for the result of a command (its error message becomes the last error message of the caller,
+        see \"has_timed_out\" for the timeouts)
+
+        :param command: (ActuatorCommand) The command
+        :param timeout: (Float) The maximum wait, in seconds (Default: the actuator timeout)
+        :return: The result of the function (False if the command failed, was cancelled or timed out)
+        """
+        result = command.wait(self.timeout if timeout is None else timeout)
+        self.is_timed_out.set(command.is_timed_out)
+        if command.is_timed_out:
+            self.command_counter.inc((command.name, 'timed_out'))
+        if command.error_message is not None:
+            rest_error_message_handler.set_last_error_message(command.error_message)
+
+        return result
+
+    def has_timed_out(self):
+        """
+        This method checks if the last command waited for in the current context timed out
+
+        :return: Boolean (True or False)
+        """
+        return self.is_timed_out.get()
+
+    def reset_timeout(self):
+        """
+        This method forgets the last timeout of the current context (called at the start of every request, since the
+        worker threads are reused)
+
+        :return: Boolean (True or False)
+        """
+        self.is_timed_out.set(False)
+        return True
+
+    def enqueue(self, command):
+        """
+        This method adds a command to the queue (or to the scheduled commands) and wakes the actuator thread up
+
+        :param command: (ActuatorCommand) The command
+        :return: (ActuatorCommand) The command
+        """
+        if self.thread is None:
+            self.start()
+
+        with self.condition:
+            if command.is_priority:
+                self.priority_queue.append(command)
+            elif command.due_time is None:
+                self.queue.append(command)
+            else:
+                heapq.heappush(self.scheduled_commands, (command.due_time, next(self.sequence), command))
+
+            self.dict_commands[command.command_id] = command
+            while len(self.dict_commands) > self.max_commands:
+                self.dict_commands.popitem(last=False)
+
+            self.condition.notify()
+
+        return command
+
+    def get_next_command(self):
+        """
+        This method waits for the next command to apply (the priority commands come first, then the scheduled
+        commands that are due). The deques are thread-safe, so the condition is only taken for the scheduled commands
+        and in order to wait: the actuator thread does not compete for it with the threads that queue commands.
+
+        :return: (ActuatorCommand) The command
+        """
+        while True:
+            try:
+                return self.priority_queue.popleft()
+            except IndexError:
+                pass
+
+            # only this thread removes scheduled commands (the other threads replace the whole list)
+            scheduled_commands = self.scheduled_commands
+            if scheduled_commands and scheduled_commands[0][0] <= time.monotonic():
+                with self.condition:
+                    if self.scheduled_commands and self.scheduled_commands[0][0] <= time.monotonic():
+                        return heapq.heappop(self.scheduled_commands)[2]
+
+            try:
+                return self.queue.popleft()
+            except IndexError:
+                pass
+
+            with self.condition:
+                if self.priority_queue or self.queue:
+                    continue
+
+                if self.scheduled_commands:
+                    timeout = self.scheduled_commands[0][0] - time.monotonic()
+                    if timeout <= 0:
+                        continue
+                else:
+                    timeout = None
+
+                self.condition.wait(timeout)
+
+    def run(self):
+        """
+        This method applies the queued commands (it runs in the actuator thread)
+        """
+        while True:
+            command = self.get_next_command()
+            if not command.future.set_running_or_notify_cancel():
+                continue
+
+            start_time = time.monotonic()
+            ready_time = command.enqueued_time if command.due_time is None else max(command.enqueued_time,
+                                                                                     command.due_time)
+            self.queue_latency.observe(max(start_time - ready_time, 0.0), (command.name,))
+
+            self.current_command = command
+            command.status = 'running'
+            rest_error_message_handler.reset()
+            try:
+                result = command.function(*command.args)
+                command.status = 'failed' if result is False else 'applied'
+                if result is False:
+                    command.error_message = rest_error_message_handler.get_last_error_message()
+                command.future.set_result(result)
+            except Exception as error_message:
+                command.status = 'failed'
+                command.error_message = str(error_message)
+                console.log(error_message, console.LOG_ERROR, self.run.__name__)
+                command.future.set_exception(error_message)
+            finally:
+                self.current_command = None
+                command.applied_time = time.time()
+                self.apply_duration.observe(time.monotonic() - start_time, (command.name,))
+                self.command_counter.inc((command.name, command.status))
+
+            if command.list_preempted_commands:
+                self.cancel_commands(command.list_preempted_commands)
+                command.list_preempted_commands = []
+
+    def get_command(self, command_id):
+        """
+        This method returns the status of a recent command
+
+        :param command_id: (String) The command id
+        :return: (Dictionary) The command status or False
+        """
+        command = self.dict_commands.get(command_id)
+        if command is None:
+            console.log('Unknown command %s.' % str(command_id), console.LOG_WARNING, self.get_command.__name__)
+            return False
+
+        return command.get_status()
+
+    def get_stats(self):
+        """
+        This method returns the actuator statistics
+
+        :return: (Dictionary) The queue depth and the command being applied
+        """
+        current_command = self.current_command
+        return {
+            'is_running': self.thread is not None and self.thread.is_alive(),
+            'queued_commands': len(self.queue),
+            'priority_commands': len(self.priority_queue),
+            'scheduled_commands': len(self.scheduled_commands),
+            'current_command': current_command.name if current_command is not None else None
+        }
+
+
+actuator_handler = ActuatorHandler()
+# endregion ActuatorHandler
+
+
+# region local functions
+def actuator_method(method):
+    """
+    This function decorates a method that accesses the hardware, so that it always runs in the actuator thread (the
+    caller waits for its result)
+
+    :param method: (Function) The method
+    :return: (Function) The decorated method
+    """
+    @functools.wraps(method)
+    def run_on_actuator_thread(*args):
+        return actuator_handler.execute(method.__name__, method, *args)
+
+    return run_on_actuator_thread
+# endregion local functions
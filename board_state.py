@@ -0,0 +1,209 @@
+"""
+This file has the board state functionality (it compares a few features of every square of the rectified board with a
+reference, in order to find the squares in which a piece was moved)
+"""
+
+# region imports
+import threading
+
+import cv2
+import numpy as np
+
+from opencv import openCV_handler
+from globals import console
+# endregion imports
+
+
+# region BoardStateHandler
+class BoardStateHandler(object):
+    """
+    This class computes the mean intensity, the standard deviation and the edge energy of the 64 squares in one
+    vectorized pass and reports the squares whose features moved away from the reference
+    """
+    FEATURES = ('mean_intensity', 'standard_deviation', 'edge_energy')
+
+    def __init__(self, threshold=3.0, feature_scales=(8.0, 6.0, 6.0), margin=0.15):
+        """
+        This constructor initializes the board state handler
+
+        :param threshold: (Float) The normalized feature distance above which a square is reported as changed
+        :param feature_scales: (Tuple) The expected change of every feature caused by noise and lighting (the feature
+                               differences are divided by these values)
+        :param margin: (Float) The part of every square side that is ignored (the square borders and the grid lines)
+        """
+        try:
+            self.threshold = threshold
+            self.feature_scales = np.asarray(feature_scales, dtype=np.float64)
+            self.margin = margin
+
+            self.reference_features = None
+            self.last_features = None
+            self.last_distances = None
+
+            self.number_of_frames = 0
+            self.number_of_changed_frames = 0
+
+            self.listeners = []
+            self.lock = threading.Lock()
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, 'BoardStateHandler')
+
+    def compute_features(self, rectified_image):
+        """
+        This method computes the features of the 64 squares of a rectified board
+
+        :param rectified_image: (numpy.ndarray) The (grayscale or BGR) rectified board
+        :return: (numpy.ndarray) The (8, 8, 3) features (mean intensity, standard deviation, edge energy) or False
+        """
+        try:
+            if rectified_image.ndim == 3:
+                rectified_image = cv2.cvtColor(rectified_image, cv2.COLOR_BGR2GRAY)
+
+            image = rectified_image.astype(np.float32)
+
+            # the image is smoothed first, so the sensor noise does not count as edge energy
+            smooth_image = cv2.GaussianBlur(image, (5, 5), 0)
+            edges = np.abs(cv2.Sobel(smooth_image, cv2.CV_32F, 1, 0)) + \
+                np.abs(cv2.Sobel(smooth_image, cv2.CV_32F, 0, 1))
+
+            squares = openCV_handler.get_rectified_squares(image)
+            edge_squares = openCV_handler.get_rectified_squares(edges)
+            square_size = squares.shape[2]
+
+            border = int(square_size * self.margin)
+            inner = slice(border, square_size - border)
+            squares = squares[:, :, inner, inner]
+            edge_squares = edge_squares[:, :, inner, inner]
+
+            return np.stack((squares.mean(axis=(2, 3)),
+                             squares.std(axis=(2, 3)),
+                             edge_squares.mean(axis=(2, 3))), axis=-1)
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.compute_features.__name__)
+            return False
+
+    def set_reference(self, rectified_image=None, features=None):
+        """
+        This method stores the reference board state (the last computed features if nothing is given)
+
+        :param rectified_image: (numpy.ndarray) The rectified board
+        :param features: (numpy.ndarray) The (8, 8, 3) features
+        :return: Boolean (True or False)
+        """
+        try:
+            if features is None:
+                features = self.compute_features(rectified_image) if rectified_image is not None \
+                    else self.last_features
+
+            if features is None or features is False:
+                console.log('There are no board features to use as reference.', console.LOG_WARNING,
+                            self.set_reference.__name__)
+                return False
+
+            with self.lock:
+                self.reference_features = np.array(features, dtype=np.float64)
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.set_reference.__name__)
+            return False
+
+    def detect_changes(self, rectified_image, update_reference=False):
+        """
+        This method compares the squares of a rectified board with the reference. The first board becomes the
+        reference.
+
+        :param rectified_image: (numpy.ndarray) The rectified board
+        :param update_reference: (Boolean) Whether or not the board becomes the new reference when squares changed
+        :return: (List) The changed squares, the most confident first, or False
+            [{
+                'row': <Integer>,
+                'col': <Integer>,
+                'confidence': <Float> (between 0 and 1),
+                'distance': <Float> (the normalized feature distance)
+            }]
+        """
+        try:
+            features = self.compute_features(rectified_image)
+            if features is False:
+                return False
+
+            with self.lock:
+                self.number_of_frames += 1
+                self.last_features = features
+
+                if self.reference_features is None:
+                    self.reference_features = features
+                    return []
+
+                distances = np.linalg.norm((features - self.reference_features) / self.feature_scales, axis=-1)
+                self.last_distances = distances
+
+                (rows, cols) = np.nonzero(distances > self.threshold)
+                order = np.argsort(-distances[rows, cols], kind='stable')
+                changes = [
+                    {
+                        'row': int(row),
+                        'col': int(col),
+                        'confidence': float(distances[row, col] / (distances[row, col] + self.threshold)),
+                        'distance': float(distances[row, col])
+                    }
+                    for (row, col) in zip(rows[order].tolist(), cols[order].tolist())
+                ]
+
+                if len(changes) > 0:
+                    self.number_of_changed_frames += 1
+                    if update_reference:
+                        self.reference_features = features
+
+            if len(changes) > 0:
+                for listener in list(self.listeners):
+                    listener(changes)
+
+            return changes
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.detect_changes.__name__)
+            return False
+
+    def add_listener(self, listener):
+        """
+        This method registers a function that is called with the changed squares whenever a change is detected (e.g.
+        to wake the full board analysis)
+
+        :param listener: (Function) The function, called as listener(changes)
+        :return: Boolean (True or False)
+        """
+        try:
+            self.listeners.append(listener)
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.add_listener.__name__)
+            return False
+
+    def reset(self):
+        """
+        This method forgets the reference board state
+
+        :return: Boolean (True or False)
+        """
+        with self.lock:
+            self.reference_features = None
+            self.last_features = None
+            self.last_distances = None
+        return True
+
+    def get_stats(self):
+        """
+        This method returns the number of compared frames and how many of them had changed squares
+
+        :return: (Dictionary) The board state statistics
+        """
+        return {
+            'number_of_frames': self.number_of_frames,
+            'number_of_changed_frames': self.number_of_changed_frames,
+            'has_reference': self.reference_features is not None,
+            'threshold': self.threshold
+        }
+
+
+board_state_handler = BoardStateHandler()
+# endregion BoardStateHandler
@@ -3,19 +3,20 @@ This file deals with all the image retrieving part of the project
 """
 
 # region imports
-# noinspection PyUnresolvedReferences
-# import picamera
 import datetime
+import queue
+import threading
+
+import cv2
+import numpy as np
 
 from enum import Enum
+from camera_backend import get_camera, get_raw_buffer_shape
 from globals import console
 # endregion imports
 
 
 # region PiCameraHandler
-picamera = None
-
-
 class PiCameraHandler(object):
     """
     This class is used in order to take an image of the chessboard, or film the chessboard
@@ -26,12 +27,17 @@ class PiCameraHandler(object):
 
     def __init__(self):
         try:
-            self.camera_handler = picamera.PiCamera()
+            self.camera_handler = get_camera()
             self.camera_handler.vflip = True
             self.camera_handler.resolution = (1024, 768)
             self.entity_name = None
             self.file_format = self.FileFormat
 
+            # raw captures go into preallocated buffers (one per format), the images are saved by a writer thread
+            self.dict_buffers = {}
+            self.write_queue = queue.Queue(maxsize=4)
+            self.writer_thread = None
+
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, 'PiCamera')
 
@@ -73,6 +79,95 @@ class PiCameraHandler(object):
             console.log(error_message, console.LOG_ERROR, self.capture_image.__name__)
             return False
 
+    def get_raw_buffer(self, raw_format):
+        """
+        This method returns the preallocated buffer of a raw format (it is reallocated only if the resolution changed)
+
+        :param raw_format: (String) \"bgr\" or \"yuv\"
+        :return: (numpy.ndarray) The buffer
+        """
+        shape = get_raw_buffer_shape(tuple(self.camera_handler.resolution), raw_format)
+        if raw_format not in self.dict_buffers or self.dict_buffers[raw_format].shape != shape:
+            self.dict_buffers[raw_format] = np.empty(shape, dtype=np.uint8)
+
+        return self.dict_buffers[raw_format]
+
+    def capture_array(self, image_format='gray', save_image=False):
+        """
+        This method captures a raw frame from the video port into a reused buffer, without encoding it. The returned
+        image is a view of that buffer, so it is only valid until the next capture in the same format.
+
+        :param image_format: (String) \"gray\" (the Y plane of a YUV capture) or \"bgr\"
+        :param save_image: (Boolean) Whether or not the image is also saved in the \"images\" folder (asynchronously)
+        :return: (numpy.ndarray) The (height, width) or (height, width, 3) image or False
+        """
+        try:
+            if image_format not in ('gray', 'bgr'):
+                console.log('Unknown image format %s. It should be \'gray\' or \'bgr\'.' % str(image_format),
+                            console.LOG_WARNING,
+                            self.capture_array.__name__)
+                return False
+
+            raw_format = 'yuv' if image_format == 'gray' else 'bgr'
+            buffer = self.get_raw_buffer(raw_format)
+            self.camera_handler.capture(buffer, format=raw_format, use_video_port=True)
+
+            (width, height) = self.camera_handler.resolution
+            image = buffer[:height, :width]
+
+            if save_image:
+                self.save_image_async(image)
+
+            return image
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.capture_array.__name__)
+            return False
+
+    def save_image_async(self, image, file_path=None):
+        """
+        This method queues a copy of an image, which is encoded and saved by a background writer thread. If the writer
+        falls behind, the image is not saved.
+
+        :param image: (numpy.ndarray) The image
+        :param file_path: (String) The file path (Default: the \"images\" folder entity name)
+        :return: Boolean (True or False)
+        """
+        try:
+            if file_path is None:
+                self.set_entity_name(self.file_format.IMAGE)
+                file_path = self.entity_name
+
+            if self.writer_thread is None:
+                self.writer_thread = threading.Thread(target=self.write_images, daemon=True)
+                self.writer_thread.start()
+
+            self.write_queue.put_nowait((file_path, image.copy()))
+            return True
+        except queue.Full:
+            console.log('The image writer is busy. The image %s was not saved.' % str(file_path), console.LOG_WARNING,
+                        self.save_image_async.__name__)
+            return False
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.save_image_async.__name__)
+            return False
+
+    def write_images(self):
+        """
+        This method saves the queued images (it runs in the writer thread)
+
+        :return: Boolean (True or False)
+        """
+        while True:
+            (file_path, image) = self.write_queue.get()
+            try:
+                if not cv2.imwrite(file_path, image):
+                    console.log('The image %s could not be saved.' % file_path, console.LOG_WARNING,
+                                self.write_images.__name__)
+            except Exception as error_message:
+                console.log(error_message, console.LOG_ERROR, self.write_images.__name__)
+            finally:
+                self.write_queue.task_done()
+
     def start_recording(self):
         """
         This method starts the video recording in \"h264\" format
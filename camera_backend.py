@@ -0,0 +1,267 @@
+"""
+This file has the camera backends used by the camera handler (the Pi camera or a file-backed stand-in for it)
+"""
+
+# region imports
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from globals import console
+# endregion imports
+
+
+# region FileCamera
+class FileCamera(object):
+    """
+    This class mimics the subset of \"picamera.PiCamera\" used throwout the project. Its frames are read from an image
+    file or a video file, so that the vision code can be run and benchmarked without a Raspberry Pi.
+    """
+
+    def __init__(self, source='./images/debug_chessboard.jpg', framerate=30):
+        """
+        This constructor initializes the file camera
+
+        :param source: (String) The image or video file the frames are read from
+        :param framerate: (Float) The frame rate of \"capture_continuous\" and of the recordings
+        """
+        self.source = source
+        self.resolution = (1024, 768)
+        self.framerate = framerate
+        self.vflip = False
+        self.hflip = False
+
+        self.video_capture = None
+        self.source_image = None
+        self.frame = None
+        self.frame_key = None
+
+        self.dict_recordings = {}
+        self.closed = False
+
+    def read_source_frame(self):
+        """
+        This method reads the next BGR frame of the source (a video is replayed once it ends)
+
+        :return: (numpy.ndarray) The frame
+        """
+        if os.path.splitext(self.source)[1].lower() in ('.jpg', '.jpeg', '.png', '.bmp'):
+            if self.source_image is None:
+                self.source_image = cv2.imread(self.source, cv2.IMREAD_COLOR)
+                if self.source_image is None:
+                    raise IOError('The image %s could not be read' % self.source)
+            return self.source_image
+
+        if self.video_capture is None:
+            self.video_capture = cv2.VideoCapture(self.source)
+
+        (ret, image) = self.video_capture.read()
+        if not ret:
+            self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            (ret, image) = self.video_capture.read()
+            if not ret:
+                raise IOError('The video %s could not be read' % self.source)
+
+        return image
+
+    def get_frame(self):
+        """
+        This method returns the current BGR frame at the camera resolution (the resized still image is cached)
+
+        :return: (numpy.ndarray) The (height, width, 3) frame
+        """
+        image = self.read_source_frame()
+        frame_key = (tuple(self.resolution), self.vflip, self.hflip)
+        if image is self.source_image and self.frame_key == frame_key:
+            return self.frame
+
+        frame = cv2.resize(image, tuple(self.resolution), interpolation=cv2.INTER_AREA)
+        if self.vflip:
+            frame = frame[::-1]
+        if self.hflip:
+            frame = frame[:, ::-1]
+
+        self.frame = np.ascontiguousarray(frame)
+        self.frame_key = frame_key if image is self.source_image else None
+        return self.frame
+
+    def capture(self, output, format=None, use_video_port=False, resize=None, splitter_port=0, quality=85):
+        """
+        This method captures a frame into a file or a stream (encoded) or into a writable NumPy buffer (raw)
+
+        :param output: (String / file object / numpy.ndarray) The file path, the stream or the buffer
+        :param format: (String) \"jpeg\", \"png\", \"bgr\", \"rgb\" or \"yuv\" (Default: from the file extension)
+        :param use_video_port: (Boolean) Ignored (kept for compatibility with \"picamera\")
+        :param resize: (Tuple) The (width, height) the frame is resized to
+        :param splitter_port: (Integer) Ignored (kept for compatibility with \"picamera\")
+        :param quality: (Integer) The JPEG quality
+        :return: Boolean (True or False)
+        """
+        frame = self.get_frame()
+        if resize is not None:
+            frame = cv2.resize(frame, tuple(resize), interpolation=cv2.INTER_AREA)
+
+        if isinstance(output, str):
+            if format is not None and format not in ('jpeg', 'png'):
+                raise ValueError('Unsupported file format %s' % str(format))
+            if not cv2.imwrite(output, frame):
+                raise IOError('The image %s could not be written' % output)
+            return True
+
+        if hasattr(output, 'write'):
+            if format not in ('jpeg', 'png'):
+                raise ValueError('Unsupported stream format %s' % str(format))
+            (ret, encoded_frame) = cv2.imencode('.jpg' if format == 'jpeg' else '.png', frame,
+                                                [cv2.IMWRITE_JPEG_QUALITY, quality] if format == 'jpeg' else [])
+            output.write(encoded_frame.tobytes())
+            return True
+
+        (height, width) = frame.shape[:2]
+        format = 'bgr' if format is None else format
+        if format == 'bgr':
+            np.copyto(output[:height, :width], frame)
+        elif format == 'rgb':
+            np.copyto(output[:height, :width], frame[:, :, ::-1])
+        elif format == 'yuv':
+            # I420, with the width padded to 32 and the height padded to 16 (as the Pi camera does)
+            padded_frame = cv2.copyMakeBorder(frame, 0, -height % 16, 0, -width % 32, cv2.BORDER_REPLICATE)
+            np.copyto(output.reshape(-1, padded_frame.shape[1]),
+                      cv2.cvtColor(padded_frame, cv2.COLOR_BGR2YUV_I420))
+        else:
+            raise ValueError('Unsupported raw format %s' % str(format))
+
+        return True
+
+    def capture_continuous(self, output, format=None, use_video_port=False, resize=None, splitter_port=0, quality=85):
+        """
+        This generator captures a frame into the output (buffer or stream) at the camera frame rate and yields it
+
+        :param output: (numpy.ndarray / file object) The buffer or the stream
+        :param format: (String) The format (see \"capture\")
+        :param use_video_port: (Boolean) Ignored (kept for compatibility with \"picamera\")
+        :param resize: (Tuple) The (width, height) the frames are resized to
+        :param splitter_port: (Integer) Ignored (kept for compatibility with \"picamera\")
+        :param quality: (Integer) The JPEG quality
+        """
+        start_time = time.monotonic()
+        index = 0
+        while not self.closed:
+            delay = start_time + index / self.framerate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            self.capture(output, format, use_video_port, resize, splitter_port, quality)
+            yield output
+            index += 1
+
+    def start_recording(self, output, format=None, splitter_port=1):
+        """
+        This method starts recording the frames into a file (as a stream of JPEG images, whatever the extension)
+
+        :param output: (String) The file path
+        :param format: (String) Ignored (kept for compatibility with \"picamera\")
+        :param splitter_port: (Integer) The video port (one recording per port)
+        :return: Boolean (True or False)
+        """
+        if splitter_port in self.dict_recordings:
+            raise RuntimeError('The camera is already recording on port %d' % splitter_port)
+
+        stop_event = threading.Event()
+        recording_thread = threading.Thread(target=self.record, args=(output, stop_event), daemon=True)
+        self.dict_recordings[splitter_port] = (recording_thread, stop_event)
+        recording_thread.start()
+        return True
+
+    def record(self, output, stop_event):
+        """
+        This method writes the frames of a recording until it is stopped
+
+        :param output: (String) The file path
+        :param stop_event: (threading.Event) The event that stops the recording
+        :return: Boolean (True or False)
+        """
+        with open(output, 'wb') as file_handler:
+            start_time = time.monotonic()
+            index = 0
+            while not stop_event.is_set():
+                file_handler.write(cv2.imencode('.jpg', self.get_frame())[1].tobytes())
+                index += 1
+                stop_event.wait(max(start_time + index / self.framerate - time.monotonic(), 0))
+
+        return True
+
+    def wait_recording(self, timeout=0, splitter_port=1):
+        if splitter_port not in self.dict_recordings:
+            raise RuntimeError('The camera is not recording on port %d' % splitter_port)
+
+        time.sleep(timeout)
+
+    def stop_recording(self, splitter_port=1):
+        if splitter_port not in self.dict_recordings:
+            raise RuntimeError('The camera is not recording on port %d' % splitter_port)
+
+        (recording_thread, stop_event) = self.dict_recordings.pop(splitter_port)
+        stop_event.set()
+        recording_thread.join()
+
+    def close(self):
+        self.closed = True
+        for splitter_port in list(self.dict_recordings):
+            self.stop_recording(splitter_port)
+        if self.video_capture is not None:
+            self.video_capture.release()
+
+
+# endregion FileCamera
+
+
+# region local functions
+def get_raw_buffer_shape(resolution, format='bgr'):
+    """
+    This function returns the shape of the buffer that holds a raw capture (the Pi camera pads the width to 32 and
+    the height to 16 pixels)
+
+    :param resolution: (Tuple) The (width, height) of the camera
+    :param format: (String) \"bgr\", \"rgb\" or \"yuv\" (I420)
+    :return: (Tuple) The buffer shape
+    """
+    (width, height) = resolution
+    (padded_width, padded_height) = (width + (-width % 32), height + (-height % 16))
+
+    if format == 'yuv':
+        return padded_height * 3 // 2, padded_width
+    return padded_height, padded_width, 3
+
+
+def get_camera(camera_name=None):
+    """
+    This function creates the camera selected by the \"ROBOTIC_ARM_CAMERA\" environment variable (\"picamera\" or
+    \"file\"). The file camera reads \"ROBOTIC_ARM_CAMERA_SOURCE\" (Default: the debug chessboard image). If
+    \"picamera\" can not be imported, the file camera is used instead.
+
+    :param camera_name: (String) The camera name (overrides the environment variable)
+    :return: (picamera.PiCamera / FileCamera) The camera
+    """
+    try:
+        if camera_name is None:
+            camera_name = os.environ.get('ROBOTIC_ARM_CAMERA', 'picamera')
+
+        if camera_name == 'file':
+            return FileCamera(os.environ.get('ROBOTIC_ARM_CAMERA_SOURCE', './images/debug_chessboard.jpg'))
+
+        if camera_name != 'picamera':
+            console.log('Unknown camera %s. The \'picamera\' camera will be used.' % str(camera_name),
+                        console.LOG_WARNING,
+                        get_camera.__name__)
+
+        # noinspection PyUnresolvedReferences
+        import picamera
+        return picamera.PiCamera()
+    except ImportError as error_message:
+        console.log('%s. The file camera will be used.' % str(error_message), console.LOG_WARNING,
+                    get_camera.__name__)
+        return FileCamera(os.environ.get('ROBOTIC_ARM_CAMERA_SOURCE', './images/debug_chessboard.jpg'))
+# endregion local functions
@@ -0,0 +1,173 @@
+"""
+This file has the chessboard corner tracker (the corners found by a full detection are followed from frame to frame
+with pyramidal optical flow, instead of searching the whole chessboard again)
+"""
+
+# region imports
+import time
+
+import cv2
+import numpy as np
+
+from opencv import openCV_handler
+from globals import console
+# endregion imports
+
+
+# region CornerTracker
+class CornerTracker(object):
+    """
+    This class tracks the inner chessboard corners between frames. A full \"findChessboardCorners\" detection only runs
+    on the first frame and whenever the tracking residual or the number of lost corners passes its threshold.
+    """
+
+    def __init__(self, pattern_size=(7, 7), max_residual=1.0, max_lost_corners=2, window_size=(21, 21), max_level=3,
+                 subpixel_window_size=(5, 5)):
+        """
+        This constructor initializes the corner tracker
+
+        :param pattern_size: (Tuple) The number of (columns, rows) of inner corners
+        :param max_residual: (Float) The maximum mean forward-backward optical flow error (in pixels)
+        :param max_lost_corners: (Integer) The maximum number of corners that can be lost before a full detection
+        :param window_size: (Tuple) The optical flow search window at every pyramid level
+        :param max_level: (Integer) The number of optical flow pyramid levels
+        :param subpixel_window_size: (Tuple) The half size of the sub-pixel refinement window
+        """
+        self.pattern_size = pattern_size
+        self.max_residual = max_residual
+        self.max_lost_corners = max_lost_corners
+
+        self.optical_flow_parameters = {
+            'winSize': window_size,
+            'maxLevel': max_level,
+            'criteria': (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+        }
+        self.subpixel_window_size = subpixel_window_size
+        self.subpixel_criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01)
+
+        self.previous_image = None
+        self.corners = None
+
+        self.number_of_frames = 0
+        self.number_of_detections = 0
+        self.number_of_failed_frames = 0
+        self.last_residual = None
+        self.last_lost_corners = None
+        self.last_latency = None
+        self.total_latency = 0.0
+
+    def reset(self):
+        """
+        This method forgets the tracked corners, so the next frame runs a full detection
+
+        :return: Boolean (True or False)
+        """
+        self.previous_image = None
+        self.corners = None
+        return True
+
+    def track(self, image):
+        """
+        This method returns the sorted inner corners of a frame, tracking them from the previous frame when possible
+
+        :param image: (numpy.ndarray) The (grayscale or BGR) frame
+        :return: (numpy.ndarray) The (N, 2) sorted corners or False
+        """
+        start_time = time.perf_counter()
+        try:
+            if image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+            corners = False
+            if self.corners is not None and self.previous_image is not None and \
+                    self.previous_image.shape == image.shape:
+                corners = self.track_corners(image)
+
+            if corners is False:
+                self.number_of_detections += 1
+                corners = openCV_handler.detect_chessboard_inner_corners(image, self.pattern_size)
+                if corners is not False:
+                    corners = self.refine_corners(image, corners)
+
+            if corners is False:
+                self.number_of_failed_frames += 1
+                self.reset()
+                return False
+
+            self.previous_image = image
+            self.corners = corners
+            return corners
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.track.__name__)
+            self.reset()
+            return False
+        finally:
+            self.number_of_frames += 1
+            self.last_latency = time.perf_counter() - start_time
+            self.total_latency += self.last_latency
+
+    def track_corners(self, image):
+        """
+        This method moves the previous corners to the new frame with pyramidal Lucas-Kanade optical flow. Every corner
+        is tracked forward and back again, and the distance to its starting point is the tracking residual.
+
+        :param image: (numpy.ndarray) The grayscale frame
+        :return: (numpy.ndarray) The (N, 2) tracked corners or False (if the tracking should not be trusted)
+        """
+        previous_corners = self.corners.astype(np.float32).reshape(-1, 1, 2)
+        (corners, status, _) = cv2.calcOpticalFlowPyrLK(self.previous_image, image, previous_corners, None,
+                                                        **self.optical_flow_parameters)
+        (back_corners, back_status, _) = cv2.calcOpticalFlowPyrLK(image, self.previous_image, corners, None,
+                                                                  **self.optical_flow_parameters)
+
+        residuals = np.linalg.norm((back_corners - previous_corners).reshape(-1, 2), axis=1)
+        is_tracked = (status.ravel() == 1) & (back_status.ravel() == 1) & (residuals <= 2 * self.max_residual)
+
+        self.last_lost_corners = int(np.count_nonzero(~is_tracked))
+        self.last_residual = float(residuals[is_tracked].mean()) if is_tracked.any() else None
+        if self.last_lost_corners > self.max_lost_corners or self.last_residual is None or \
+                self.last_residual > self.max_residual:
+            return False
+
+        corners = corners.reshape(-1, 2).astype(np.float64)
+        if not is_tracked.all():
+            # the lost corners follow the board motion of the tracked ones
+            (homography, _) = cv2.findHomography(self.corners[is_tracked], corners[is_tracked])
+            if homography is None:
+                return False
+            corners[~is_tracked] = cv2.perspectiveTransform(self.corners[~is_tracked].reshape(-1, 1, 2),
+                                                            homography).reshape(-1, 2)
+
+        return self.refine_corners(image, corners)
+
+    def refine_corners(self, image, corners):
+        """
+        This method refines the corners to sub-pixel accuracy
+
+        :param image: (numpy.ndarray) The grayscale frame
+        :param corners: (numpy.ndarray) The (N, 2) corners
+        :return: (numpy.ndarray) The (N, 2) refined corners
+        """
+        corners = np.ascontiguousarray(corners, dtype=np.float32).reshape(-1, 1, 2)
+        corners = cv2.cornerSubPix(image, corners, self.subpixel_window_size, (-1, -1), self.subpixel_criteria)
+        return corners.reshape(-1, 2).astype(np.float64)
+
+    def get_stats(self):
+        """
+        This method returns the tracking statistics
+
+        :return: (Dictionary) The number of frames, the re-detection rate and the per-frame latency
+        """
+        return {
+            'number_of_frames': self.number_of_frames,
+            'number_of_detections': self.number_of_detections,
+            'number_of_failed_frames': self.number_of_failed_frames,
+            'redetection_rate': (self.number_of_detections / self.number_of_frames) if self.number_of_frames else 0,
+            'last_residual': self.last_residual,
+            'last_lost_corners': self.last_lost_corners,
+            'last_latency': self.last_latency,
+            'mean_latency': (self.total_latency / self.number_of_frames) if self.number_of_frames else None
+        }
+
+
+# endregion CornerTracker
@@ -6,14 +6,39 @@ This file is a debug file used in order to test the servo motor and the image pr
 # noinspection PyUnresolvedReferences
 # import RPi.GPIO as GPIO
 import atexit
+import contextlib
+import http.client
+import json
+import os
+import re
+import threading
 import time
+import urllib.request
+
+import cv2
+import numpy as np
 
 from camera import pi_camera_handler
 from opencv import openCV_handler
+from vision_pipeline import VisionPipeline
+from board_state import board_state_handler
+from video_ring_buffer import video_ring_buffer
+from live_stream import live_stream_handler
+from jog_channel import JogClient
+from motor_protocol import MOTOR_NAMES, encode_frame, decode_frame
+from servo import dict_servo_motors, gpio_handler
+from gpio_backend import SimulatedGPIOBackend
+from actuator import actuator_handler
+from obs import methods_handler
+from trajectory import trajectory_handler
+from metrics import Counter, Histogram
 from globals import console
 
 # endregion imports
 
+# the debug menus prompt with "input", so the messages are printed right away instead of by the writer thread
+console.is_asynchronous = False
+
 
 # region PwmHandler
 GPIO = None
@@ -172,7 +197,7 @@ def camera():
     """
     try:
         while True:
-            keyboard_input = input('%s\t Camera functionality (\"image\" / \"video\"): %s' %
+            keyboard_input = input('%s\t Camera functionality (\"image\" / \"video\" / \"clip\"): %s' %
                                    (
                                        console.get_color_code(console.LOG_INFO),
                                        console.get_color_code(console.LOG_DEFAULT)
@@ -186,6 +211,10 @@ def camera():
                 pi_camera_handler.start_recording()
                 pi_camera_handler.set_recording_time_frame(10)
                 pi_camera_handler.stop_recording()
+            elif keyboard_input == 'clip':
+                if not video_ring_buffer.get_stats()['is_recording']:
+                    video_ring_buffer.start(live_stream_handler)
+                console.log(str(video_ring_buffer.trigger('debug')), console.LOG_INFO, camera.__name__)
             else:
                 continue
 
@@ -197,6 +226,42 @@ def camera():
 # endregion camera
 
 
+# region capture benchmark
+def capture_benchmark(repeat=20):
+    """
+    This function compares the time needed to hand a camera frame to OpenCV through a JPEG file in the \"images\"
+    folder with the time needed by the in-memory (raw buffer) handoff
+
+    :param repeat: (Integer) The number of captures timed for every method
+    :return: Boolean (True or False)
+    """
+    try:
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            pi_camera_handler.capture_image()
+            openCV_handler.set_image(cv2.imread(pi_camera_handler.entity_name, cv2.IMREAD_GRAYSCALE))
+        disk_time = (time.perf_counter() - start_time) / repeat
+
+        dict_memory_times = {}
+        for image_format in ('gray', 'bgr'):
+            start_time = time.perf_counter()
+            for _ in range(repeat):
+                openCV_handler.set_image(pi_camera_handler.capture_array(image_format))
+            dict_memory_times[image_format] = (time.perf_counter() - start_time) / repeat
+
+        console.log('Disk round trip: %.1f ms, in-memory gray: %.1f ms, in-memory bgr: %.1f ms' %
+                    (disk_time * 1000, dict_memory_times['gray'] * 1000, dict_memory_times['bgr'] * 1000),
+                    console.LOG_INFO,
+                    capture_benchmark.__name__)
+        return True
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, capture_benchmark.__name__)
+        return False
+
+
+# endregion capture benchmark
+
+
 # region openCV
 def openCV():
     """
@@ -224,6 +289,853 @@ def openCV():
 # endregion openCV
 
 
+# region sort benchmark
+def bubble_sort_chessboard_corners(corners, sort_tolerance=1):
+    """
+    This function is the previous (bubble sort) ordering of the chessboard corners, kept as the benchmark baseline
+
+    :param corners: (numpy.ndarray) The (N, 2) array of corners that needs to be ordered
+    :param sort_tolerance: (Float) The maximum y difference between two corners of the same row
+    :return: (numpy.ndarray) The (N, 2) ordered corners
+    """
+    corners = np.array(corners, dtype=np.float64)
+
+    # sort by rows
+    k = False
+    while k is False:
+        k = True
+        for index in range(0, len(corners) - 1):
+            if corners[index, 1] > corners[index + 1, 1]:
+                corners[[index, index + 1]] = corners[[index + 1, index]]
+                k = False
+
+    # sort by columns
+    k = False
+    while k is False:
+        k = True
+        for index in range(0, len(corners) - 1):
+            if abs(corners[index, 1] - corners[index + 1, 1]) <= sort_tolerance and \
+                    corners[index, 0] > corners[index + 1, 0]:
+                corners[[index, index + 1]] = corners[[index + 1, index]]
+                k = False
+
+    return corners
+
+
+def get_synthetic_chessboard_corners(pattern_size=(7, 7), angle=0, perspective=(0, 0), spacing=40):
+    """
+    This function generates the corners of a synthetic (rotated and perspective distorted) chessboard
+
+    :param pattern_size: (Tuple) The number of (columns, rows) of the grid
+    :param angle: (Float) The rotation of the board, in degrees
+    :param perspective: (Tuple) The (x, y) perspective coefficients of the homography
+    :param spacing: (Float) The square size, in pixels
+    :return: (numpy.ndarray) The (N, 2) corners, ordered row by row
+    """
+    (columns, rows) = pattern_size
+    grid = np.stack(np.meshgrid(np.arange(columns), np.arange(rows)), axis=-1).reshape(-1, 2) * float(spacing)
+    grid -= grid.mean(axis=0)
+
+    angle = np.radians(angle)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)],
+                         [np.sin(angle), np.cos(angle)]])
+    corners = grid @ rotation.T
+
+    homography = np.array([[1, 0, 0],
+                           [0, 1, 0],
+                           [perspective[0], perspective[1], 1]])
+    corners = np.c_[corners, np.ones(len(corners))] @ homography.T
+    return corners[:, :2] / corners[:, 2:] + (400, 300)
+
+
+def sort_benchmark(repeat=100):
+    """
+    This function checks the lattice ordering of the chessboard corners on rotated and perspective distorted
+    synthetic boards and compares its run time with the bubble sort ordering
+
+    :param repeat: (Integer) The number of runs timed for every board
+    :return: Boolean (True or False)
+    """
+    try:
+        random_generator = np.random.default_rng(0)
+        for pattern_size in ((7, 7), (9, 9)):
+            for (angle, perspective) in ((0, (0, 0)), (10, (0, 0)), (-25, (0, 0)), (5, (0.0004, 0.0002))):
+                expected_corners = get_synthetic_chessboard_corners(pattern_size, angle, perspective)
+                corners = expected_corners[random_generator.permutation(len(expected_corners))]
+
+                start_time = time.perf_counter()
+                for _ in range(repeat):
+                    lattice_corners = openCV_handler.assign_corners_to_grid(corners, pattern_size)
+                lattice_time = (time.perf_counter() - start_time) / repeat
+
+                start_time = time.perf_counter()
+                for _ in range(repeat):
+                    bubble_corners = bubble_sort_chessboard_corners(corners, openCV_handler.sort_tolerance)
+                bubble_time = (time.perf_counter() - start_time) / repeat
+
+                is_lattice_correct = lattice_corners is not False and np.allclose(lattice_corners, expected_corners)
+                is_bubble_correct = np.allclose(bubble_corners, expected_corners)
+                console.log('%dx%d board, angle = %s, perspective = %s: lattice %.3f ms (%s), bubble sort %.3f ms (%s)' %
+                            (pattern_size[0], pattern_size[1], str(angle), str(perspective),
+                             lattice_time * 1000, 'ok' if is_lattice_correct else 'wrong',
+                             bubble_time * 1000, 'ok' if is_bubble_correct else 'wrong'),
+                            console.LOG_INFO,
+                            sort_benchmark.__name__)
+
+                # the bubble sort is only a valid reference on the boards it orders correctly (not rotated ones), so
+                # the lattice ordering is checked against the synthetic corners, which every reference must match
+                if not is_lattice_correct or (is_bubble_correct and not np.allclose(lattice_corners, bubble_corners)):
+                    console.log('The lattice ordering of the %dx%d board (angle = %s, perspective = %s) is wrong.' %
+                                (pattern_size[0], pattern_size[1], str(angle), str(perspective)),
+                                console.LOG_ERROR,
+                                sort_benchmark.__name__)
+                    return False
+
+        return True
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, sort_benchmark.__name__)
+        return False
+
+
+# endregion sort benchmark
+
+
+# region detection benchmark
+def get_synthetic_chessboard_image(size=(2048, 1536), angle=0, perspective=(0, 0), square_size=64):
+    """
+    This function renders a synthetic (rotated and perspective distorted) 8x8 chessboard
+
+    :param size: (Tuple) The (width, height) of the image
+    :param angle: (Float) The rotation of the board, in degrees
+    :param perspective: (Tuple) The (x, y) perspective coefficients of the homography (per canonical pixel)
+    :param square_size: (Integer) The square size of the canonical board, in pixels
+    :return: (Tuple) The grayscale image and the (49, 2) inner corners, ordered row by row
+    """
+    margin = square_size
+    board_size = 8 * square_size + 2 * margin
+    squares = (np.indices((8, 8)).sum(axis=0) % 2) * 255
+    board = np.full((board_size, board_size), 255, dtype=np.uint8)
+    board[margin:-margin, margin:-margin] = np.kron(squares, np.ones((square_size, square_size))).astype(np.uint8)
+
+    (width, height) = size
+    zoom = 0.6 * min(width, height) / board_size
+    angle = np.radians(angle)
+    center = np.array([[1, 0, -board_size / 2], [0, 1, -board_size / 2], [0, 0, 1]])
+    transform = np.array([[zoom * np.cos(angle), -zoom * np.sin(angle), width / 2],
+                          [zoom * np.sin(angle), zoom * np.cos(angle), height / 2],
+                          [0, 0, 1]])
+    homography = transform @ np.array([[1, 0, 0], [0, 1, 0], [perspective[0], perspective[1], 1]]) @ center
+
+    image = cv2.warpPerspective(board, homography, size, flags=cv2.INTER_AREA, borderValue=255)
+
+    inner_corners = (np.stack(np.meshgrid(np.arange(1, 8), np.arange(1, 8)), axis=-1).reshape(-1, 2) *
+                     square_size + margin).astype(np.float64)
+    inner_corners = cv2.perspectiveTransform((inner_corners - 0.5).reshape(-1, 1, 2), homography).reshape(-1, 2)
+
+    return image, inner_corners
+
+
+def detection_benchmark(scales=(1.0, 0.5, 0.25, 0.125), roi_sizes=(11, 21, 41), repeat=3):
+    """
+    This function compares the accuracy and the run time of the coarse-to-fine corner detection for several detection
+    scales and refinement window sizes, on \"images/debug_chessboard.jpg\" and on synthetic chessboards
+
+    :param scales: (Tuple) The detection scales
+    :param roi_sizes: (Tuple) The refinement window sizes
+    :param repeat: (Integer) The number of runs timed for every setting
+    :return: Boolean (True or False)
+    """
+    try:
+        debug_image = cv2.imread('./images/debug_chessboard.jpg', cv2.IMREAD_GRAYSCALE)
+
+        # the photo has no ground truth, so its reference is the previous detection (on the 800x600 resized image)
+        resized_image = cv2.resize(debug_image, (openCV_handler.width, openCV_handler.height))
+        debug_corners = openCV_handler.detect_chessboard_inner_corners(resized_image, scale=1.0)
+        if debug_corners is not False:
+            debug_corners = (debug_corners + 0.5) * (debug_image.shape[1] / openCV_handler.width,
+                                                     debug_image.shape[0] / openCV_handler.height) - 0.5
+
+        list_boards = [('debug_chessboard.jpg', debug_image, debug_corners)]
+        for (angle, perspective) in ((0, (0, 0)), (15, (0, 0)), (-10, (0.0004, 0.0002))):
+            (image, inner_corners) = get_synthetic_chessboard_image(angle=angle, perspective=perspective)
+            list_boards.append(('synthetic (angle = %s, perspective = %s)' % (str(angle), str(perspective)),
+                                image, inner_corners))
+
+        for (name, image, expected_corners) in list_boards:
+            for scale in scales:
+                for roi_size in (roi_sizes if scale < 1 else roi_sizes[:1]):
+                    start_time = time.perf_counter()
+                    for _ in range(repeat):
+                        corners = openCV_handler.detect_chessboard_inner_corners(image, scale=scale,
+                                                                                 roi_size=roi_size)
+                    run_time = (time.perf_counter() - start_time) / repeat
+
+                    if corners is False or expected_corners is False:
+                        error = 'not found'
+                    else:
+                        errors = np.linalg.norm(corners - expected_corners, axis=1)
+                        error = 'mean error %.3f px, max error %.3f px' % (errors.mean(), errors.max())
+
+                    console.log('%s %dx%d, scale = %s, roi = %d: %.1f ms, %s' %
+                                (name, image.shape[1], image.shape[0], str(scale), roi_size, run_time * 1000,
+                                 error),
+                                console.LOG_INFO,
+                                detection_benchmark.__name__)
+
+        return True
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, detection_benchmark.__name__)
+        return False
+
+
+# endregion detection benchmark
+
+
+# region stream
+def stream(source='./images', frame_rate=30, duration=10, tracking=True):
+    """
+    This function runs the streaming vision pipeline on a source (\"camera\", an image directory or a video file) and
+    prints the pipeline statistics
+
+    :param source: (String) The frame source
+    :param frame_rate: (Float) The rate at which a local source is replayed
+    :param duration: (Float) The number of seconds the pipeline runs for
+    :param tracking: (Boolean) Whether or not the corners are tracked between frames
+    :return: Boolean (True or False)
+    """
+    try:
+        pipeline = VisionPipeline(source, frame_rate=frame_rate, loop=True, tracking=tracking)
+        if pipeline.start() is False:
+            return False
+
+        # the deadline is checked while waiting, so the pipeline is stopped even if no frame comes out of it
+        end_time = time.monotonic() + duration
+        while not pipeline.is_finished():
+            remaining_time = end_time - time.monotonic()
+            if remaining_time <= 0:
+                break
+
+            pipeline.get_result(timeout=remaining_time)
+
+        pipeline.stop()
+        console.log('Vision pipeline statistics: %s' % str(pipeline.get_stats()), console.LOG_INFO,
+                    stream.__name__)
+        return True
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, stream.__name__)
+        return False
+
+
+# endregion stream
+
+
+# region board
+def board(source='camera', frame_rate=30, duration=60):
+    """
+    This function watches the chessboard and prints the squares that changed since the first frame
+
+    :param source: (String) The frame source (\"camera\", an image directory or a video file)
+    :param frame_rate: (Float) The rate at which a local source is replayed
+    :param duration: (Float) The number of seconds the board is watched for
+    :return: Boolean (True or False)
+    """
+    try:
+        pipeline = VisionPipeline(source, frame_rate=frame_rate, loop=True, tracking=True, rectify=True)
+        if pipeline.start() is False:
+            return False
+
+        end_time = time.monotonic() + duration
+        while not pipeline.is_finished():
+            remaining_time = end_time - time.monotonic()
+            if remaining_time <= 0:
+                break
+
+            frame = pipeline.get_result(timeout=remaining_time)
+            if frame is not None and frame.rectified_image is not None:
+                changes = board_state_handler.detect_changes(frame.rectified_image, update_reference=True)
+                if changes:
+                    console.log('Frame %d: changed squares %s' %
+                                (frame.index, str([(change['row'], change['col'], round(change['confidence'], 2))
+                                                   for change in changes])),
+                                console.LOG_INFO,
+                                board.__name__)
+
+        pipeline.stop()
+        console.log('Board state statistics: %s' % str(board_state_handler.get_stats()), console.LOG_INFO,
+                    board.__name__)
+        return True
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, board.__name__)
+        return False
+
+
+# endregion board
+
+
+# region jog benchmark
+def post_json(url, input_json):
+    """
+    This function sends a JSON POST request and returns the answer
+
+    :param url: (String) The URL
+    :param input_json: (Dictionary) The JSON sent
+    :return: (Dictionary) The JSON answer
+    """
+    request = urllib.request.Request(url, json.dumps(input_json).encode(), {'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def jog_benchmark(host='127.0.0.1', rest_port=9090, jog_port=9091, motor_name='base', repeat=200):
+    """
+    This function compares the latency of the duty cycle updates sent as REST POST requests (\"/api/tools\") with the
+    latency of the ones sent over the jog channel. The server should be started with the simulated GPIO backend
+    (ROBOTIC_ARM_GPIO_BACKEND=simulated).
+
+    :param host: (String) The server address
+    :param rest_port: (Integer) The CherryPy port
+    :param jog_port: (Integer) The jog channel port
+    :param motor_name: (String) The motor that is jogged
+    :param repeat: (Integer) The number of updates timed for every path
+    :return: Boolean (True or False)
+    """
+    try:
+        url = 'http://%s:%d/api/tools' % (host, rest_port)
+        post_json(url, {'motors': [{'name': motor_name, 'duty_cycle': 7.5}], 'gpio_init': True})
+        duty_cycles = [7.5 + 2.5 * np.sin(index / 10) for index in range(repeat)]
+
+        list_rest_latencies = []
+        start_time = time.perf_counter()
+        for duty_cycle in duty_cycles:
+            request_time = time.perf_counter()
+            post_json(url, {'motors': [{'name': motor_name, 'duty_cycle': duty_cycle}], 'duty_cycle': True})
+            list_rest_latencies.append(time.perf_counter() - request_time)
+        rest_rate = repeat / (time.perf_counter() - start_time)
+
+        jog_client = JogClient(host, jog_port)
+        if jog_client.connect() is False:
+            return False
+
+        list_jog_latencies = []
+        start_time = time.perf_counter()
+        for duty_cycle in duty_cycles:
+            request_time = time.perf_counter()
+            jog_client.wait_ack(jog_client.send(motors=[{'name': motor_name, 'duty_cycle': duty_cycle}]))
+            list_jog_latencies.append(time.perf_counter() - request_time)
+        jog_rate = repeat / (time.perf_counter() - start_time)
+
+        # streamed updates (the client does not wait for every acknowledgement)
+        start_time = time.perf_counter()
+        for duty_cycle in duty_cycles:
+            sequence_number = jog_client.send(motors=[{'name': motor_name, 'duty_cycle': duty_cycle}])
+        list_acks = jog_client.wait_ack(sequence_number)
+        stream_rate = repeat / (time.perf_counter() - start_time)
+        jog_client.close()
+
+        for (path, list_latencies, rate) in (('REST POST', list_rest_latencies, rest_rate),
+                                             ('Jog channel', list_jog_latencies, jog_rate)):
+            console.log('%s: p50 %.2f ms, p95 %.2f ms, p99 %.2f ms, %.0f updates/s' %
+                        (path, np.percentile(list_latencies, 50) * 1000, np.percentile(list_latencies, 95) * 1000,
+                         np.percentile(list_latencies, 99) * 1000, rate),
+                        console.LOG_INFO,
+                        jog_benchmark.__name__)
+
+        console.log('Jog channel (streamed): %.0f updates/s, %d acknowledgements for %d updates' %
+                    (stream_rate, len(list_acks), repeat),
+                    console.LOG_INFO,
+                    jog_benchmark.__name__)
+        return True
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, jog_benchmark.__name__)
+        return False
+
+
+# endregion jog benchmark
+
+
+# region command benchmark
+def command_benchmark(repeat=10000):
+    """
+    This function compares the time needed to decode the duty cycles of all the motors from the JSON payload of
+    \"/api/tools\" (parsing and motor name lookups) with the time needed by the binary motor command protocol
+
+    :param repeat: (Integer) The number of updates decoded by every method
+    :return: Boolean (True or False)
+    """
+    try:
+        duty_cycles = {name: 5 + index * 0.5 for (index, name) in enumerate(MOTOR_NAMES)}
+        json_payload = json.dumps({'motors': [{'name': name, 'duty_cycle': duty_cycle}
+                                              for (name, duty_cycle) in duty_cycles.items()],
+                                   'duty_cycle': True}).encode()
+        binary_payload = encode_frame(1, duty_cycles)
+
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            input_json = json.loads(json_payload)
+            for motor in input_json['motors']:
+                (dict_servo_motors[motor['name']], motor['duty_cycle'])
+        json_time = (time.perf_counter() - start_time) / repeat
+
+        list_servo_motors = list(dict_servo_motors.values())
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            (_, _, motor_indices, decoded_duty_cycles) = decode_frame(binary_payload)
+            for (motor_index, duty_cycle) in zip(motor_indices.tolist(), decoded_duty_cycles.tolist()):
+                (list_servo_motors[motor_index], duty_cycle)
+        binary_time = (time.perf_counter() - start_time) / repeat
+
+        console.log('%d motors per update - JSON: %d bytes, %.1f us, binary: %d bytes, %.1f us' %
+                    (len(duty_cycles), len(json_payload), json_time * 1e6, len(binary_payload), binary_time * 1e6),
+                    console.LOG_INFO,
+                    command_benchmark.__name__)
+        return True
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, command_benchmark.__name__)
+        return False
+
+
+# endregion command benchmark
+
+
+# region metrics benchmark
+def metrics_benchmark(repeat=100000):
+    """
+    This function measures the overhead of the request instrumentation: a timed histogram observation and a counter
+    increment. A \"/api/tools\" request records 5 timed observations (the request, its 2 stages, the command and the
+    motor lookups) and 1 counter increment, plus 1 timed observation per PWM write (at most one per motor and PWM
+    period). The per motor counters are read from the duty cycle writers when the metrics are exported.
+
+    :param repeat: (Integer) The number of timed calls
+    :return: Boolean (True or False)
+    """
+    try:
+        histogram = Histogram('benchmark_duration_seconds', 'Benchmark', ('command',))
+        counter = Counter('benchmark', 'Benchmark', ('command',))
+        label_values = ('duty_cycle',)
+
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            observation_start_time = time.perf_counter()
+            histogram.observe(time.perf_counter() - observation_start_time, label_values)
+        observation_time = (time.perf_counter() - start_time) / repeat
+
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            counter.inc(label_values)
+        increment_time = (time.perf_counter() - start_time) / repeat
+
+        console.log('Timed observation: %.2f us, counter increment: %.2f us, overhead per request: %.1f us '
+                    '(+ %.2f us per PWM write)' %
+                    (observation_time * 1e6, increment_time * 1e6, (5 * observation_time + increment_time) * 1e6,
+                     observation_time * 1e6),
+                    console.LOG_INFO,
+                    metrics_benchmark.__name__)
+        return True
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, metrics_benchmark.__name__)
+        return False
+
+
+# endregion metrics benchmark
+
+
+# region logging benchmark
+def logging_benchmark(repeat=20000):
+    """
+    This function compares the cost of a console log call when the message is printed by the calling thread
+    (synchronous), when it is queued for the writer thread (asynchronous) and when it is below the log level (dropped)
+
+    :param repeat: (Integer) The number of messages logged by every method
+    :return: Boolean (True or False)
+    """
+    (is_asynchronous, level) = (console.is_asynchronous, console.level)
+    try:
+        dict_times = {}
+        with open(os.devnull, 'w') as null_file, contextlib.redirect_stdout(null_file):
+            for (name, is_asynchronous_method, method_level) in (('synchronous', False, console.LOG_DEFAULT),
+                                                                 ('asynchronous', True, console.LOG_DEFAULT),
+                                                                 ('dropped', True, console.LOG_WARNING)):
+                console.is_asynchronous = is_asynchronous_method
+                console.set_level(method_level)
+
+                start_time = time.perf_counter()
+                for index in range(repeat):
+                    console.log('Frame %d has been processed', console.LOG_INFO, logging_benchmark.__name__, index)
+                dict_times[name] = (time.perf_counter() - start_time) / repeat
+
+                console.flush(60)
+
+        (console.is_asynchronous, console.level) = (is_asynchronous, level)
+        console.log('Per call - synchronous: %.2f us, asynchronous: %.2f us, dropped: %.2f us' %
+                    (dict_times['synchronous'] * 1e6, dict_times['asynchronous'] * 1e6, dict_times['dropped'] * 1e6),
+                    console.LOG_INFO,
+                    logging_benchmark.__name__)
+        return True
+    except Exception as error_message:
+        (console.is_asynchronous, console.level) = (is_asynchronous, level)
+        console.log(error_message, console.LOG_ERROR, logging_benchmark.__name__)
+        return False
+
+
+# endregion logging benchmark
+
+
+# region error context stress test
+def error_context_stress_test(host='127.0.0.1', port=9090, concurrency=16, repeat=200):
+    """
+    This function checks that concurrent requests never answer with each other's error messages. Every worker sends
+    duty cycle updates for a motor name of its own (that does not exist, so the answer is an error that quotes it),
+    interleaved with valid requests. The server should be started with the simulated GPIO backend.
+
+    :param host: (String) The server address
+    :param port: (Integer) The CherryPy port
+    :param concurrency: (Integer) The number of concurrent workers
+    :param repeat: (Integer) The number of invalid requests sent by every worker
+    :return: Boolean (True if no error message was mismatched, the failed connections are only counted)
+    """
+    try:
+        dict_counters = {'errors': 0, 'mismatched': 0, 'valid': 0, 'unexpected': 0}
+        lock = threading.Lock()
+
+        def run_worker(worker_index):
+            connection = http.client.HTTPConnection(host, port, timeout=10)
+            dict_worker_counters = {'errors': 0, 'mismatched': 0, 'valid': 0, 'unexpected': 0}
+            for index in range(repeat):
+                motor_name = 'stress_%d_%d' % (worker_index, index)
+                try:
+                    connection.request('POST', '/api/tools',
+                                       json.dumps({'motors': [{'name': motor_name, 'duty_cycle': 5}],
+                                                   'duty_cycle': True}),
+                                       {'Content-Type': 'application/json'})
+                    response = connection.getresponse()
+                    body = response.read().decode(errors='replace')
+
+                    dict_worker_counters['errors'] += 1
+                    if response.status != 400 or set(re.findall(r'stress_\d+_\d+', body)) != {motor_name}:
+                        dict_worker_counters['mismatched'] += 1
+
+                    connection.request('GET', '/api/motors')
+                    response = connection.getresponse()
+                    response.read()
+                    dict_worker_counters['valid' if response.status == 200 else 'unexpected'] += 1
+                except (OSError, http.client.HTTPException):
+                    dict_worker_counters['unexpected'] += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection(host, port, timeout=10)
+
+            connection.close()
+            with lock:
+                for (name, value) in dict_worker_counters.items():
+                    dict_counters[name] += value
+
+        list_threads = [threading.Thread(target=run_worker, args=(worker_index,))
+                        for worker_index in range(concurrency)]
+        start_time = time.perf_counter()
+        for thread in list_threads:
+            thread.start()
+        for thread in list_threads:
+            thread.join()
+
+        console.log('%d workers, %.1f s - error answers: %d (mismatched: %d), valid answers: %d (unexpected: %d)' %
+                    (concurrency, time.perf_counter() - start_time, dict_counters['errors'],
+                     dict_counters['mismatched'], dict_counters['valid'], dict_counters['unexpected']),
+                    console.LOG_INFO if dict_counters['mismatched'] == 0 else console.LOG_WARNING,
+                    error_context_stress_test.__name__)
+        return dict_counters['mismatched'] == 0
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, error_context_stress_test.__name__)
+        return False
+
+
+# endregion error context stress test
+
+
+# region strict JSON test
+def strict_json_test(host='127.0.0.1', port=9090, paths=('/api/server', '/api/motors', '/api/tools', '/api/commands',
+                                                             '/api/clips', '/api/stream?stats=1')):
+    """
+    This function checks that the JSON endpoints answer strict JSON (\"NaN\" and \"Infinity\" are rejected, as by the
+    browsers and most JSON decoders)
+
+    :param host: (String) The server address
+    :param port: (Integer) The CherryPy port
+    :param paths: (Tuple) The endpoints read
+    :return: Boolean (True or False)
+    """
+    def reject_constant(constant):
+        raise ValueError('Invalid JSON constant %s' % constant)
+
+    try:
+        list_errors = []
+        connection = http.client.HTTPConnection(host, port, timeout=10)
+        for path in paths:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            body = response.read().decode(errors='replace')
+            if response.status != 200:
+                list_errors.append('%s: status %d' % (path, response.status))
+                continue
+
+            try:
+                json.loads(body, parse_constant=reject_constant)
+            except ValueError as error_message:
+                list_errors.append('%s: %s' % (path, str(error_message)))
+        connection.close()
+
+        if list_errors:
+            console.log('Invalid JSON answers: %s' % '; '.join(list_errors), console.LOG_ERROR,
+                        strict_json_test.__name__)
+            return False
+
+        console.log('%d endpoints answered strict JSON.' % len(paths), console.LOG_INFO, strict_json_test.__name__)
+        return True
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, strict_json_test.__name__)
+        return False
+
+
+# endregion strict JSON test
+
+
+# region emergency stop benchmark
+def emergency_stop_benchmark(repeat=20, concurrency=4, queue_depth=1000):
+    """
+    This function measures the time-to-stop (from the stop request to the last PWM \"stop\" call) while the actuator
+    queue is flooded with motion commands and a trajectory is playing, on the simulated GPIO backend. The stop is
+    measured twice: queued behind the motion commands (as a plain actuator command) and through the priority lane
+    (\"methods_handler.emergency_stop\").
+
+    :param repeat: (Integer) The number of stops measured for every lane
+    :param concurrency: (Integer) The number of threads that queue motion commands
+    :param queue_depth: (Integer) The number of motion commands kept in the actuator queue
+    :return: Boolean (True or False)
+    """
+    (backend, level) = (gpio_handler.backend, console.level)
+    try:
+        simulated_backend = SimulatedGPIOBackend()
+        gpio_handler.set_backend(simulated_backend)
+        # the motion commands that follow a stop fail (with a warning) until the motors are initialized again
+        console.set_level('error')
+
+        motors_list = [{'name': name, 'duty_cycle': 5} for name in dict_servo_motors]
+        cleanup_commands = [('gpio_cleanup', methods_handler.stop_motors)]
+
+        def flood(stop_event):
+            index = 0
+            while not stop_event.is_set():
+                if actuator_handler.get_stats()['queued_commands'] >= queue_depth:
+                    time.sleep(0.0005)
+                    continue
+
+                index += 1
+                methods_handler.submit_json({
+                    'motors': [{'name': motor['name'], 'duty_cycle': 5 + index % 50 / 10} for motor in motors_list],
+                    'duty_cycle': True
+                })
+
+        list_results = []
+        for lane in ('queued', 'priority'):
+            list_stop_times = []
+            list_queue_depths = []
+            number_of_late_writes = 0
+            for _ in range(repeat):
+                methods_handler.interpret_json({'motors': motors_list, 'gpio_init': True})
+                trajectory_handler.start_trajectory({'moves': [{'name': motors_list[0]['name'], 'duty_cycle': 9,
+                                                                'max_velocity': 2, 'max_acceleration': 10}]})
+
+                stop_event = threading.Event()
+                list_threads = [threading.Thread(target=flood, args=(stop_event,), daemon=True)
+                                for _ in range(concurrency)]
+                for thread in list_threads:
+                    thread.start()
+                while actuator_handler.get_stats()['queued_commands'] < queue_depth:
+                    time.sleep(0.001)
+
+                list_queue_depths.append(actuator_handler.get_stats()['queued_commands'])
+                simulated_backend.timeline.clear()
+                start_time = time.monotonic()
+                if lane == 'priority':
+                    methods_handler.emergency_stop()
+                else:
+                    trajectory_handler.stop_trajectories()
+                    actuator_handler.execute('gpio_cleanup', methods_handler.run_commands, cleanup_commands,
+                                             motors_list)
+                list_stop_times.append(simulated_backend.timeline.get_entries('stop')[-1]['timestamp'] - start_time)
+
+                stop_event.set()
+                for thread in list_threads:
+                    thread.join()
+                actuator_handler.cancel_queued_commands()
+                actuator_handler.execute('benchmark_sync', lambda: True)
+
+                # no duty cycle may reach the PWM layer once the motors have been stopped
+                last_stop_time = simulated_backend.timeline.get_entries('stop')[-1]['timestamp']
+                number_of_late_writes += len([entry for entry in simulated_backend.timeline.get_entries(
+                    'change_duty_cycle') if entry['timestamp'] > last_stop_time])
+
+            list_results.append((lane, np.array(list_stop_times) * 1e3, int(np.mean(list_queue_depths)),
+                                 number_of_late_writes))
+
+        # the stop of some motors (and the cancelled commands) must not stall the deferred writes of the other motors
+        (stopped_motor_name, motor_name) = (motors_list[0]['name'], motors_list[1]['name'])
+        duty_cycle_writer = dict_servo_motors[motor_name].duty_cycle_writer
+        period = 1 / dict_servo_motors[motor_name].frequency
+        methods_handler.interpret_json({'motors': motors_list, 'gpio_init': True})
+        list_partial_stop_errors = []
+        for (duty_cycle, stop) in ((6, 'gpio_cleanup'), (7, 'cancel_queued_commands')):
+            time.sleep(2 * period)
+            for delta in (0.5, 0):
+                methods_handler.interpret_json({'motors': [{'name': motor_name, 'duty_cycle': duty_cycle - delta}],
+                                                'duty_cycle': True})
+
+            # the second write is deferred: the stop of another motor keeps it, a cancellation drops it
+            if stop == 'gpio_cleanup':
+                methods_handler.interpret_json({'motors': [{'name': stopped_motor_name}], 'gpio_cleanup': True})
+                expected_duty_cycles = [duty_cycle, duty_cycle + 1]
+            else:
+                actuator_handler.cancel_queued_commands()
+                expected_duty_cycles = [duty_cycle - 0.5, duty_cycle + 1]
+
+            time.sleep(2 * period)
+            applied_duty_cycles = [actuator_handler.execute('benchmark_sync',
+                                                            lambda: duty_cycle_writer.applied_duty_cycle)]
+            # the next write of the motor must still reach the PWM handler
+            methods_handler.interpret_json({'motors': [{'name': motor_name, 'duty_cycle': duty_cycle + 1}],
+                                            'duty_cycle': True})
+            time.sleep(2 * period)
+            applied_duty_cycles.append(actuator_handler.execute('benchmark_sync',
+                                                                lambda: duty_cycle_writer.applied_duty_cycle))
+            if applied_duty_cycles != expected_duty_cycles:
+                list_partial_stop_errors.append('%s: applied duty cycles %s, expected %s' %
+                                                (stop, str(applied_duty_cycles), str(expected_duty_cycles)))
+        methods_handler.emergency_stop()
+
+        (gpio_handler.backend, console.level) = (backend, level)
+        for (lane, stop_times, mean_queue_depth, number_of_late_writes) in list_results:
+            console.log('%s stop: p50 %.2f ms, p95 %.2f ms, max %.2f ms (queue depth %d, %d writes after the stop)' %
+                        (lane.capitalize(), np.percentile(stop_times, 50), np.percentile(stop_times, 95),
+                         stop_times.max(), mean_queue_depth, number_of_late_writes),
+                        console.LOG_INFO,
+                        emergency_stop_benchmark.__name__)
+
+        if list_partial_stop_errors:
+            console.log('The deferred writes of the motors that were not stopped have been lost (%s).' %
+                        '; '.join(list_partial_stop_errors),
+                        console.LOG_ERROR,
+                        emergency_stop_benchmark.__name__)
+            return False
+
+        console.log('Partial stop: the deferred writes of the other motors have been applied.', console.LOG_INFO,
+                    emergency_stop_benchmark.__name__)
+        return True
+    except Exception as error_message:
+        (gpio_handler.backend, console.level) = (backend, level)
+        console.log(error_message, console.LOG_ERROR, emergency_stop_benchmark.__name__)
+        return False
+
+
+def saturated_stop_benchmark(host='127.0.0.1', port=9090, jog_port=9091, repeat=20, concurrency=None):
+    """
+    This function measures the time-to-answer of a stop while every REST worker is busy with duty cycle updates (the
+    server should be started with the simulated GPIO backend). The \"DELETE\" request waits for a free worker, the
+    stop message of the jog channel does not.
+
+    :param host: (String) The server address
+    :param port: (Integer) The CherryPy port
+    :param jog_port: (Integer) The jog channel port
+    :param repeat: (Integer) The number of stops measured for every path
+    :param concurrency: (Integer) The number of clients that send duty cycle updates (Default: 4 per REST worker)
+    :return: Boolean (True or False)
+    """
+    try:
+        connection = http.client.HTTPConnection(host, port, timeout=10)
+        connection.request('GET', '/api/server')
+        server_stats = json.loads(connection.getresponse().read())
+        connection.request('GET', '/api/motors')
+        motor_names = list(json.loads(connection.getresponse().read()).keys())
+        connection.close()
+        if concurrency is None:
+            concurrency = 4 * server_stats['min_threads']
+
+        stop_event = threading.Event()
+        motors_json = json.dumps({'motors': [{'name': name, 'duty_cycle': 7} for name in motor_names],
+                                  'gpio_init': True, 'duty_cycle': True})
+
+        def flood():
+            flood_connection = http.client.HTTPConnection(host, port, timeout=30)
+            while not stop_event.is_set():
+                try:
+                    flood_connection.request('POST', '/api/tools', motors_json, {'Content-Type': 'application/json'})
+                    flood_connection.getresponse().read()
+                except (OSError, http.client.HTTPException):
+                    flood_connection.close()
+                    flood_connection = http.client.HTTPConnection(host, port, timeout=30)
+            flood_connection.close()
+
+        jog_client = JogClient(host, jog_port)
+        if jog_client.connect() is False:
+            return False
+
+        list_threads = [threading.Thread(target=flood, daemon=True) for _ in range(concurrency)]
+        for thread in list_threads:
+            thread.start()
+        time.sleep(1)
+
+        dict_stop_times = {'rest': [], 'jog': []}
+        list_queued_connections = []
+        list_errors = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            stop_connection = http.client.HTTPConnection(host, port, timeout=30)
+            try:
+                stop_connection.request('DELETE', '/api/tools')
+                response = stop_connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    list_errors.append('DELETE: %d' % response.status)
+            except (OSError, http.client.HTTPException) as error_message:
+                list_errors.append('DELETE: %s' % str(error_message))
+            finally:
+                stop_connection.close()
+            dict_stop_times['rest'].append(time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            list_acks = jog_client.wait_ack(jog_client.send_stop())
+            dict_stop_times['jog'].append(time.perf_counter() - start_time)
+            list_errors.extend('jog: %s' % error['error'] for ack in list_acks for error in ack['errors'])
+
+            stats_connection = http.client.HTTPConnection(host, port, timeout=30)
+            stats_connection.request('GET', '/api/server')
+            list_queued_connections.append(json.loads(stats_connection.getresponse().read())['queued_connections'])
+            stats_connection.close()
+
+        stop_event.set()
+        for thread in list_threads:
+            thread.join()
+        jog_client.close()
+
+        for (path, name) in (('rest', 'DELETE /api/tools'), ('jog', 'Jog channel stop')):
+            stop_times = np.array(dict_stop_times[path]) * 1e3
+            console.log('%s: p50 %.2f ms, p95 %.2f ms, max %.2f ms (%d clients, %.1f queued connections on average)' %
+                        (name, np.percentile(stop_times, 50), np.percentile(stop_times, 95), stop_times.max(),
+                         concurrency, np.mean(list_queued_connections)),
+                        console.LOG_INFO,
+                        saturated_stop_benchmark.__name__)
+
+        if list_errors:
+            console.log('Some stops failed (%s).' % '; '.join(list_errors), console.LOG_ERROR,
+                        saturated_stop_benchmark.__name__)
+            return False
+
+        return True
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, saturated_stop_benchmark.__name__)
+        return False
+
+
+# endregion emergency stop benchmark
+
+
 # region main
 def main():
     """
@@ -235,7 +1147,20 @@ def main():
         keyboard_input = input('%s\t Debug Component ('
                                '\"servo\" / '
                                '\"camera\" / '
-                               '\"opencv\"): %s' % (
+                               '\"opencv\" / '
+                               '\"sort\" / '
+                               '\"stream\" / '
+                               '\"detection\" / '
+                               '\"board\" / '
+                               '\"capture\" / '
+                               '\"jog\" / '
+                               '\"command\" / '
+                               '\"metrics\" / '
+                               '\"logging\" / '
+                               '\"errors\" / '
+                               '\"json\" / '
+                               '\"stop\" / '
+                               '\"saturated\"): %s' % (
                                    console.get_color_code(console.LOG_INFO),
                                    console.get_color_code(console.LOG_DEFAULT)
                                )
@@ -249,6 +1174,32 @@ def main():
             camera()
         elif keyboard_input == 'opencv':
             openCV()
+        elif keyboard_input == 'sort':
+            sort_benchmark()
+        elif keyboard_input == 'stream':
+            stream()
+        elif keyboard_input == 'detection':
+            detection_benchmark()
+        elif keyboard_input == 'board':
+            board()
+        elif keyboard_input == 'capture':
+            capture_benchmark()
+        elif keyboard_input == 'jog':
+            jog_benchmark()
+        elif keyboard_input == 'command':
+            command_benchmark()
+        elif keyboard_input == 'metrics':
+            metrics_benchmark()
+        elif keyboard_input == 'logging':
+            logging_benchmark()
+        elif keyboard_input == 'errors':
+            error_context_stress_test()
+        elif keyboard_input == 'json':
+            strict_json_test()
+        elif keyboard_input == 'stop':
+            emergency_stop_benchmark()
+        elif keyboard_input == 'saturated':
+            saturated_stop_benchmark()
         else:
             return False
 
@@ -2,9 +2,18 @@
 This file has flags and methods that are used all throwout the project
 """
 # region imports
+import atexit
+import collections
+import contextvars
+import os
+import queue
+import threading
 import traceback
 import sys
 import ntpath
+import time
+
+from metrics import log_duration
 
 
 # endregion imports
@@ -13,28 +22,41 @@ import ntpath
 # region RestErrorMessageHandler
 class RestErrorMessageHandler(object):
     """
-    This class is used in order to send the error_message back to the client throw the REST server
+    This class is used in order to send the error_message back to the client throw the REST server. The last error
+    message is kept per context (every CherryPy worker thread has its own), so concurrent requests never read each
+    other's errors.
     """
 
     def __init__(self):
-        self.last_error_message = None
+        self.last_error_message = contextvars.ContextVar('last_error_message', default=None)
 
     def set_last_error_message(self, error_message):
         """
-        Description: This method sets saves the last given error message into the \'last_error_message\' local variable
+        Description: This method sets saves the last given error message into the \'last_error_message\' context
+        variable
 
         :param error_message: The last error message given
         :return: Boolean (True or False)
         """
-        self.last_error_message = error_message
+        self.last_error_message.set(error_message)
 
     def get_last_error_message(self):
         """
-        Description: This method returns the last given error_message
+        Description: This method returns the last given error_message (of the current request)
 
         :return: Boolean (True or False)
         """
-        return self.last_error_message
+        return self.last_error_message.get()
+
+    def reset(self):
+        """
+        Description: This method forgets the last error message (called at the start of every request, since the
+        worker threads are reused)
+
+        :return: Boolean (True or False)
+        """
+        self.last_error_message.set(None)
+        return True
 
 
 rest_error_message_handler = RestErrorMessageHandler()
@@ -47,10 +69,22 @@ rest_error_message_handler = RestErrorMessageHandler()
 class Console(object):
     """
     This class is used in order to print color coded messages:
-    -
+    - the messages below the log level are dropped before they are formatted
+    - the other ones are queued and formatted, printed and kept in a bounded history by a background writer thread
+      (so the request threads never wait for the terminal)
     """
 
-    def __init__(self):
+    def __init__(self, level=None, is_asynchronous=None, max_queue_size=10000, max_records=1000):
+        """
+        This constructor initializes the console
+
+        :param level: (String) The log level: \"error\", \"warning\", \"success\", \"info\" or \"default\"
+                      (Default: the \"ROBOTIC_ARM_LOG_LEVEL\" environment variable, otherwise \"default\")
+        :param is_asynchronous: (Boolean) Whether or not the messages are printed by the writer thread
+                                (Default: the \"ROBOTIC_ARM_LOG_ASYNC\" environment variable, otherwise True)
+        :param max_queue_size: (Integer) The maximum number of queued messages (the next ones are dropped)
+        :param max_records: (Integer) The number of records kept in the history
+        """
         self._traceback_step = -2
 
         # region console log flags
@@ -71,49 +105,89 @@ class Console(object):
         self._CODE_DEFAULT = '\033[1;39;49m'
         # endregion messages color codes
 
-    def log(self, message, priority=None, location=None):
+        if level is None:
+            level = os.environ.get('ROBOTIC_ARM_LOG_LEVEL', 'default')
+        if is_asynchronous is None:
+            is_asynchronous = os.environ.get('ROBOTIC_ARM_LOG_ASYNC', '1') != '0'
+
+        self.level = self.LOG_DEFAULT
+        self.set_level(level)
+        self.is_asynchronous = is_asynchronous
+
+        self.max_queue_size = max_queue_size
+        self.queue = queue.SimpleQueue()
+        self.records = collections.deque(maxlen=max_records)
+        self.number_of_records = 0
+        self.number_of_dropped_records = 0
+        self.writer_thread = None
+        self.writer_lock = threading.Lock()
+
+    def set_level(self, level):
+        """
+        This method sets the log level (the messages with a lower priority are dropped)
+
+        :param level: (String / Integer) The level name or flag
+        :return: Boolean (True or False)
+        """
+        dict_levels = {
+            'error': self.LOG_ERROR,
+            'warning': self.LOG_WARNING,
+            'success': self.LOG_SUCCESS,
+            'info': self.LOG_INFO,
+            'default': self.LOG_DEFAULT
+        }
+        if isinstance(level, str):
+            if level.lower() not in dict_levels:
+                return False
+            level = dict_levels[level.lower()]
+
+        self.level = level
+        return True
+
+    def log(self, message, priority=None, location=None, *args):
         """
         Function used to return color coded error messages, along with the location
 
-        :param message: message (String)
+        :param message: message (String), formatted with \"args\" (if any) only if the message is not dropped
         :param location:  message location (String)
         :param priority: the message type (Integer)
+        :param args: the message arguments
         :return: Boolean (True of False)
         """
-        try:
-            message = str(message).capitalize()
+        if (self.LOG_DEFAULT if priority is None else priority) > self.level and priority not in (self.LOG_ERROR,
+                                                                                                    self.LOG_WARNING):
+            return True
 
-            if sys.exc_info()[-1] is not None:
-                line_number = str(sys.exc_info()[-1].tb_lineno)
-            else:
-                line_number = ''
+        start_time = time.perf_counter()
+        try:
+            exception_traceback = sys.exc_info()[-1]
+            line_number = str(exception_traceback.tb_lineno) if exception_traceback is not None else ''
 
             if location is None:
                 location = ''
 
-            rest_error_message = '{rest_error_message}'
-            if priority == self.LOG_ERROR:
-                print('%s\t Error (%s:%s):%s %s' % (self._CODE_RED, location, line_number, self._CODE_WHITE, message))
-                rest_error_message = ('Error(%s): %s' % (location, message))
-            elif priority == self.LOG_WARNING:
-                print('%s\t Warning (%s:%s):%s %s' % (
-                    self._CODE_YELLOW, location, line_number, self._CODE_WHITE, message))
-                rest_error_message = ('Warning(%s): %s' % (location, message))
+            if priority in (self.LOG_ERROR, self.LOG_WARNING):
+                # the REST handlers answer with the last error or warning, so it is formatted right away
+                rest_error_message = '%s(%s): %s' % ('Error' if priority == self.LOG_ERROR else 'Warning', location,
+                                                     self.format_message(message, args))
+                rest_error_message_handler.set_last_error_message(rest_error_message)
 
-            elif priority == self.LOG_SUCCESS:
-                print(
-                    '%s\t Success (%s:%s):%s %s' % (self._CODE_GREEN, location, line_number, self._CODE_WHITE, message))
-                rest_error_message = ('Success(%s): %s' % (location, message))
+                if priority > self.level:
+                    return True
 
-            elif priority == self.LOG_INFO:
-                print('%s\t Info (%s:%s):%s %s' % (self._CODE_BLUE, location, line_number, self._CODE_WHITE, message))
-                rest_error_message = ('Info(%s): %s' % (location, message))
+            record = (time.time(), priority, location, line_number, message, args)
+            if not self.is_asynchronous:
+                self.write_records([record])
+                return True
 
-            elif priority is None:
-                print('%s\t %s' % (self._CODE_WHITE, message))
-                rest_error_message = message
+            if self.writer_thread is None:
+                self.start()
 
-            rest_error_message_handler.set_last_error_message(rest_error_message)
+            if self.queue.qsize() >= self.max_queue_size:
+                self.number_of_dropped_records += 1
+                return False
+
+            self.queue.put(record)
             return True
 
         except Exception as error_message:
@@ -121,6 +195,154 @@ class Console(object):
             rest_error_message = ('Error (console_log): %s' % error_message)
             rest_error_message_handler.set_last_error_message(rest_error_message)
             return False
+        finally:
+            log_duration.observe(time.perf_counter() - start_time, (self.get_priority_name(priority),))
+
+    @staticmethod
+    def format_message(message, args=()):
+        """
+        This method formats a message (the way it is printed)
+
+        :param message: The message
+        :param args: The message arguments
+        :return: (String) The message
+        """
+        message = str(message) % args if args else str(message)
+        return message.capitalize()
+
+    def start(self):
+        """
+        This method starts the writer thread (and stops it at exit)
+
+        :return: Boolean (True or False)
+        """
+        with self.writer_lock:
+            if self.writer_thread is None:
+                self.writer_thread = threading.Thread(target=self.write, daemon=True)
+                self.writer_thread.start()
+                atexit.register(self.stop)
+
+        return True
+
+    def stop(self):
+        """
+        This method prints the queued messages, the next ones are printed right away (it is called at exit, so that
+        the messages logged by the other exit handlers are not lost)
+
+        :return: Boolean (True or False)
+        """
+        is_flushed = self.flush()
+        self.is_asynchronous = False
+        return is_flushed
+
+    def write(self):
+        """
+        This method prints the queued records, every available record at once (it runs in the writer thread)
+        """
+        while True:
+            list_records = [self.queue.get()]
+            while len(list_records) < 1000:
+                try:
+                    list_records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            list_events = [record for record in list_records if isinstance(record, threading.Event)]
+            self.write_records([record for record in list_records if not isinstance(record, threading.Event)])
+            for event in list_events:
+                event.set()
+
+    def write_records(self, list_records):
+        """
+        This method formats and prints some records and adds them to the history
+
+        :param list_records: (List) The (time, priority, location, line number, message, arguments) records
+        :return: Boolean (True or False)
+        """
+        list_lines = []
+        for (record_time, priority, location, line_number, message, args) in list_records:
+            try:
+                message = self.format_message(message, args)
+            except Exception as error_message:
+                message = '%s (%s)' % (str(message), str(error_message))
+
+            if priority is None:
+                list_lines.append('%s\t %s' % (self._CODE_WHITE, message))
+            else:
+                list_lines.append('%s\t %s (%s:%s):%s %s' % (self.get_color_code(priority),
+                                                             self.get_priority_name(priority).capitalize(),
+                                                             location, line_number, self._CODE_WHITE, message))
+
+            self.records.append({
+                'time': record_time,
+                'priority': self.get_priority_name(priority),
+                'location': location,
+                'line_number': line_number,
+                'message': message
+            })
+            self.number_of_records += 1
+
+        try:
+            sys.stdout.write('\n'.join(list_lines) + '\n')
+            sys.stdout.flush()
+        except (OSError, ValueError):
+            return False
+
+        return True
+
+    def flush(self, timeout=5):
+        """
+        This method waits until the queued messages have been printed
+
+        :param timeout: (Float) The maximum wait, in seconds
+        :return: Boolean (True or False)
+        """
+        if self.writer_thread is None or not self.writer_thread.is_alive():
+            return True
+
+        event = threading.Event()
+        self.queue.put(event)
+        return event.wait(timeout)
+
+    def get_records(self, level=None, limit=100):
+        """
+        This method returns the last records of the history
+
+        :param level: (String) The minimum priority (Default: all the records)
+        :param limit: (Integer) The maximum number of records
+        :return: (List) The records (oldest first)
+        """
+        list_records = list(self.records)
+        if level is not None:
+            list_names = ['error', 'warning', 'success', 'info', 'default']
+            list_records = [record for record in list_records
+                            if list_names.index(record['priority']) <= list_names.index(level.lower())]
+
+        return list_records[-limit:] if limit > 0 else []
+
+    def get_stats(self):
+        return {
+            'level': self.get_priority_name(self.level),
+            'is_asynchronous': self.is_asynchronous,
+            'queued_records': self.queue.qsize(),
+            'number_of_records': self.number_of_records,
+            'number_of_dropped_records': self.number_of_dropped_records
+        }
+
+    def get_priority_name(self, priority=None):
+        """
+        This method returns the name of a LOG priority (used as a metrics label and in the history)
+
+        :param priority: The log priority
+        :return: (String) The priority name
+        """
+        return {
+            self.LOG_ERROR: 'error',
+            self.LOG_WARNING: 'warning',
+            self.LOG_SUCCESS: 'success',
+            self.LOG_INFO: 'info',
+            self.LOG_DEFAULT: 'default'
+        }.get(priority, 'default')
 
     def get_color_code(self, priority=None):
         """
@@ -0,0 +1,338 @@
+"""
+This file has the GPIO backends used by the GPIO handler (the Raspberry Pi GPIO pins or a simulation of them)
+"""
+
+# region imports
+import abc
+import array
+import json
+import os
+import threading
+import time
+
+from globals import console
+# endregion imports
+
+
+# region GPIOBackend
+class GPIOBackend(abc.ABC):
+    """
+    This class describes the subset of the \"RPi.GPIO\" interface used throwout the project
+    """
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+
+    @abc.abstractmethod
+    def setmode(self, mode):
+        """
+        This method sets the pin numbering mode (\"BOARD\" or \"BCM\")
+        """
+
+    @abc.abstractmethod
+    def setup(self, pin, mode):
+        """
+        This method sets a pin as an input (\"IN\") or an output (\"OUT\") pin
+        """
+
+    @abc.abstractmethod
+    def cleanup(self):
+        """
+        This method resets every pin used by the project
+        """
+
+    @abc.abstractmethod
+    def PWM(self, pin, frequency):
+        """
+        This method returns the PWM object of a pin (with \"start\", \"ChangeDutyCycle\", \"ChangeFrequency\" and
+        \"stop\" methods)
+        """
+
+
+class RPiGPIOBackend(GPIOBackend):
+    """
+    This class forwards every call to the \"RPi.GPIO\" module (only available on the Raspberry Pi)
+    """
+
+    def __init__(self):
+        # noinspection PyUnresolvedReferences
+        import RPi.GPIO as GPIO
+
+        self.gpio = GPIO
+        self.BOARD = GPIO.BOARD
+        self.BCM = GPIO.BCM
+        self.OUT = GPIO.OUT
+        self.IN = GPIO.IN
+
+    def setmode(self, mode):
+        return self.gpio.setmode(mode)
+
+    def setup(self, pin, mode):
+        return self.gpio.setup(pin, mode)
+
+    def cleanup(self):
+        return self.gpio.cleanup()
+
+    def PWM(self, pin, frequency):
+        return self.gpio.PWM(pin, frequency)
+
+
+# endregion GPIOBackend
+
+
+# region PWMTimeline
+class PWMTimeline(object):
+    """
+    This class records the GPIO calls in a compact, array-backed timeline (one entry per call)
+    """
+    OPERATIONS = ('setmode', 'setup', 'cleanup', 'pwm', 'start', 'change_duty_cycle', 'change_frequency', 'stop')
+
+    def __init__(self):
+        self.timestamps = array.array('d')
+        self.operations = array.array('B')
+        self.pins = array.array('h')
+        self.values = array.array('d')
+
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.operations)
+
+    def record(self, timestamp, operation, pin=-1, value=0.0):
+        """
+        This method appends a GPIO call to the timeline
+
+        :param timestamp: (Float) The monotonic time of the call (in seconds)
+        :param operation: (String) The operation name (one of \"OPERATIONS\")
+        :param pin: (Integer) The GPIO physical pin number (-1 if the call is not related to a pin)
+        :param value: (Float) The call argument (the mode, duty cycle or frequency)
+        :return: Boolean (True or False)
+        """
+        with self.lock:
+            self.timestamps.append(timestamp)
+            self.operations.append(self.OPERATIONS.index(operation))
+            self.pins.append(pin)
+            self.values.append(value)
+
+        return True
+
+    def clear(self):
+        """
+        This method removes every recorded call
+
+        :return: Boolean (True or False)
+        """
+        with self.lock:
+            del self.timestamps[:]
+            del self.operations[:]
+            del self.pins[:]
+            del self.values[:]
+
+        return True
+
+    def get_entries(self, operation=None, pin=None):
+        """
+        This method returns the recorded calls in a more easily accessible format
+
+        :param operation: (String) Only return the calls of this operation (Optional)
+        :param pin: (Integer) Only return the calls for this pin (Optional)
+        :return: (List) A list of dictionaries
+            [{
+                'timestamp': <Float>,
+                'operation': <String>,
+                'pin': <Integer>,
+                'value': <Float>
+            }]
+        """
+        with self.lock:
+            entries = zip(self.timestamps.tolist(), self.operations.tolist(), self.pins.tolist(), self.values.tolist())
+
+        return [{
+            'timestamp': timestamp,
+            'operation': self.OPERATIONS[operation_index],
+            'pin': entry_pin,
+            'value': value
+        } for (timestamp, operation_index, entry_pin, value) in entries
+            if (operation is None or self.OPERATIONS[operation_index] == operation) and (pin is None or entry_pin == pin)]
+
+    def save(self, file_path):
+        """
+        This method saves the timeline as JSON, so that the timelines of different releases can be compared
+
+        :param file_path: (String) The path of the JSON file
+        :return: Boolean (True or False)
+        """
+        try:
+            with open(file_path, 'w') as file_handler:
+                json.dump(self.get_entries(), file_handler)
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.save.__name__)
+            return False
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        This method loads a timeline previously saved with \"save\"
+
+        :param file_path: (String) The path of the JSON file
+        :return: (PWMTimeline) The loaded timeline or False
+        """
+        try:
+            timeline = cls()
+            with open(file_path) as file_handler:
+                for entry in json.load(file_handler):
+                    timeline.record(entry['timestamp'], entry['operation'], entry['pin'], entry['value'])
+
+            return timeline
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, cls.load.__name__)
+            return False
+
+    def diff(self, other_timeline):
+        """
+        This method compares the calls (ignoring the timestamps) of two timelines
+
+        :param other_timeline: (PWMTimeline) The timeline this one is compared against
+        :return: (List) The indexes and entries of the calls that differ
+            [{
+                'index': <Integer>,
+                'current': <Dictionary> (None if this timeline is shorter),
+                'other': <Dictionary> (None if the other timeline is shorter)
+            }]
+        """
+        current_entries = self.get_entries()
+        other_entries = other_timeline.get_entries()
+
+        differences = []
+        for index in range(max(len(current_entries), len(other_entries))):
+            current_entry = current_entries[index] if index < len(current_entries) else None
+            other_entry = other_entries[index] if index < len(other_entries) else None
+
+            if current_entry is None or other_entry is None or \
+                    (current_entry['operation'], current_entry['pin'], current_entry['value']) != \
+                    (other_entry['operation'], other_entry['pin'], other_entry['value']):
+                differences.append({
+                    'index': index,
+                    'current': current_entry,
+                    'other': other_entry
+                })
+
+        return differences
+
+
+# endregion PWMTimeline
+
+
+# region SimulatedGPIOBackend
+class SimulatedPWM(object):
+    """
+    This class mimics the \"RPi.GPIO.PWM\" object and records every call into the backend timeline
+    """
+
+    def __init__(self, backend, pin, frequency):
+        self.backend = backend
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = 0
+        self.is_running = False
+
+        self.backend.record('pwm', pin, frequency)
+
+    def start(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+        self.is_running = True
+        self.backend.record('start', self.pin, duty_cycle)
+
+    def ChangeDutyCycle(self, duty_cycle):
+        if not 0 <= duty_cycle <= 100:
+            raise ValueError('dutycycle must have a value from 0.0 to 100.0')
+
+        self.duty_cycle = duty_cycle
+        self.backend.record('change_duty_cycle', self.pin, duty_cycle)
+
+    def ChangeFrequency(self, frequency):
+        if frequency <= 0:
+            raise ValueError('frequency must be greater than 0.0')
+
+        self.frequency = frequency
+        self.backend.record('change_frequency', self.pin, frequency)
+
+    def stop(self):
+        self.is_running = False
+        self.backend.record('stop', self.pin)
+
+
+class SimulatedGPIOBackend(GPIOBackend):
+    """
+    This class simulates the GPIO pins, so that the server can be run and benchmarked without a Raspberry Pi
+    """
+
+    def __init__(self, clock=None):
+        """
+        This constructor initializes the simulated backend
+
+        :param clock: (Function) The clock used for the timeline timestamps, in seconds (Default: time.monotonic). A
+                      virtual clock can be given in order to get reproducible timelines.
+        """
+        self.clock = clock if clock is not None else time.monotonic
+        self.timeline = PWMTimeline()
+
+        self.mode = None
+        self.dict_pin_modes = {}
+
+    def record(self, operation, pin=-1, value=0.0):
+        return self.timeline.record(self.clock(), operation, pin, value)
+
+    def setmode(self, mode):
+        self.mode = mode
+        self.record('setmode', value=mode)
+
+    def setup(self, pin, mode):
+        if self.mode is None:
+            raise RuntimeError('Please set pin numbering mode using GPIO.setmode(GPIO.BOARD) or GPIO.setmode(GPIO.BCM)')
+
+        self.dict_pin_modes[pin] = mode
+        self.record('setup', pin, mode)
+
+    def cleanup(self):
+        self.mode = None
+        self.dict_pin_modes = {}
+        self.record('cleanup')
+
+    def PWM(self, pin, frequency):
+        return SimulatedPWM(self, pin, frequency)
+
+
+# endregion SimulatedGPIOBackend
+
+
+# region local functions
+def get_gpio_backend(backend_name=None):
+    """
+    This function creates the GPIO backend selected by the \"ROBOTIC_ARM_GPIO_BACKEND\" environment variable (\"rpi\"
+    or \"simulated\"). If \"RPi.GPIO\" can not be imported, the simulated backend is used instead.
+
+    :param backend_name: (String) The backend name (overrides the environment variable)
+    :return: (GPIOBackend) The GPIO backend
+    """
+    try:
+        if backend_name is None:
+            backend_name = os.environ.get('ROBOTIC_ARM_GPIO_BACKEND', 'rpi')
+
+        if backend_name == 'simulated':
+            return SimulatedGPIOBackend()
+
+        if backend_name != 'rpi':
+            console.log('Unknown GPIO backend %s. The \'rpi\' backend will be used.' % str(backend_name),
+                        console.LOG_WARNING,
+                        get_gpio_backend.__name__)
+
+        return RPiGPIOBackend()
+    except ImportError as error_message:
+        console.log('%s. The simulated GPIO backend will be used.' % str(error_message), console.LOG_WARNING,
+                    get_gpio_backend.__name__)
+        return SimulatedGPIOBackend()
+# endregion local functions
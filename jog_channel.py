@@ -0,0 +1,659 @@
+"""
+This file has the jog channel functionality (a WebSocket server, next to the CherryPy server, that streams the manual
+control messages straight to the servo motors and acknowledges them in batches)
+"""
+
+# region imports
+import base64
+import hashlib
+import json
+import os
+import select
+import socket
+import socketserver
+import struct
+import threading
+import urllib.parse
+
+from servo import dict_servo_motors
+from actuator import actuator_handler
+from obs import methods_handler
+from globals import console, rest_error_message_handler
+# endregion imports
+
+
+# region WebSocket
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_MESSAGE_TOO_BIG = 1009
+
+
+class WebSocketConnection(object):
+    """
+    This class reads and writes the WebSocket (RFC 6455) frames of a connected socket
+    """
+
+    def __init__(self, connection_socket, is_client=False, max_message_size=65536):
+        """
+        This constructor initializes the WebSocket connection
+
+        :param connection_socket: (socket.socket) The connected socket (after the handshake)
+        :param is_client: (Boolean) Whether or not the frames that are sent should be masked (client side)
+        :param max_message_size: (Integer) The maximum size of a received frame or message payload, in bytes (the
+                                 connection is closed beyond it, so a peer cannot make it buffer any amount of data)
+        """
+        self.socket = connection_socket
+        self.is_client = is_client
+        self.max_message_size = max_message_size
+        self.buffer = bytearray()
+        self.fragments = []
+        self.write_lock = threading.Lock()
+
+    def parse_frame(self):
+        """
+        This method removes one complete frame from the read buffer
+
+        :return: (Tuple) The frame (fin, opcode, payload, is_masked), None if the buffer does not hold a complete frame
+                 or False if the frame is larger than the maximum message size
+        """
+        if len(self.buffer) < 2:
+            return None
+
+        (first_byte, second_byte) = self.buffer[0], self.buffer[1]
+        payload_length = second_byte & 0x7F
+        offset = 2
+        if payload_length == 126:
+            if len(self.buffer) < 4:
+                return None
+            payload_length = struct.unpack_from('!H', self.buffer, 2)[0]
+            offset = 4
+        elif payload_length == 127:
+            if len(self.buffer) < 10:
+                return None
+            payload_length = struct.unpack_from('!Q', self.buffer, 2)[0]
+            offset = 10
+
+        if payload_length > self.max_message_size:
+            return False
+
+        is_masked = second_byte & 0x80
+        mask = None
+        if is_masked:
+            if len(self.buffer) < offset + 4:
+                return None
+            mask = bytes(self.buffer[offset:offset + 4])
+            offset += 4
+
+        if len(self.buffer) < offset + payload_length:
+            return None
+
+        payload = bytes(self.buffer[offset:offset + payload_length])
+        del self.buffer[:offset + payload_length]
+
+        if mask is not None:
+            payload = (int.from_bytes(payload, 'big') ^
+                       int.from_bytes((mask * (payload_length // 4 + 1))[:payload_length], 'big')
+                       ).to_bytes(payload_length, 'big')
+
+        return bool(first_byte & 0x80), first_byte & 0x0F, payload, mask is not None
+
+    def has_pending_frame(self):
+        """
+        This method checks, without blocking, whether or not another frame can be read right away
+
+        :return: Boolean (True or False)
+        """
+        if self.parse_frame_length() is not None:
+            return True
+
+        (readable_sockets, _, _) = select.select([self.socket], [], [], 0)
+        return len(readable_sockets) > 0
+
+    def parse_frame_length(self):
+        """
+        This method checks whether or not the read buffer holds a complete frame
+
+        :return: (Integer) The length of the first frame or None
+        """
+        if len(self.buffer) < 2:
+            return None
+
+        payload_length = self.buffer[1] & 0x7F
+        offset = 2 + (2 if payload_length == 126 else 8 if payload_length == 127 else 0)
+        if len(self.buffer) < offset:
+            return None
+
+        if payload_length == 126:
+            payload_length = struct.unpack_from('!H', self.buffer, 2)[0]
+        elif payload_length == 127:
+            payload_length = struct.unpack_from('!Q', self.buffer, 2)[0]
+
+        frame_length = offset + (4 if self.buffer[1] & 0x80 else 0) + payload_length
+        return frame_length if len(self.buffer) >= frame_length else None
+
+    def receive_message(self):
+        """
+        This method reads the next data message (the control frames are answered on the way)
+
+        :return: (Tuple) The opcode and the payload of the message, or None once the connection is closed
+        """
+        while True:
+            frame = self.parse_frame()
+            if frame is False:
+                self.send_frame(OPCODE_CLOSE, struct.pack('!H', CLOSE_MESSAGE_TOO_BIG))
+                return None
+            if frame is None:
+                data = self.socket.recv(65536)
+                if len(data) == 0:
+                    return None
+                self.buffer.extend(data)
+                continue
+
+            (fin, opcode, payload, is_masked) = frame
+            # a client masks all its frames and a server none of them (RFC 6455 section 5.1)
+            if is_masked == self.is_client:
+                self.send_frame(OPCODE_CLOSE, struct.pack('!H', CLOSE_PROTOCOL_ERROR))
+                return None
+            if opcode == OPCODE_CLOSE:
+                self.send_frame(OPCODE_CLOSE, payload[:2])
+                return None
+            if opcode == OPCODE_PING:
+                self.send_frame(OPCODE_PONG, payload)
+                continue
+            if opcode == OPCODE_PONG:
+                continue
+
+            self.fragments.append((opcode, payload))
+            if sum(len(fragment_payload) for (_, fragment_payload) in self.fragments) > self.max_message_size:
+                self.send_frame(OPCODE_CLOSE, struct.pack('!H', CLOSE_MESSAGE_TOO_BIG))
+                return None
+            if not fin:
+                continue
+
+            message_opcode = self.fragments[0][0]
+            message = b''.join(fragment_payload for (_, fragment_payload) in self.fragments)
+            self.fragments = []
+            return message_opcode, message
+
+    def send_frame(self, opcode, payload):
+        """
+        This method sends one (unfragmented) frame
+
+        :param opcode: (Integer) The frame opcode
+        :param payload: (Bytes) The frame payload
+        :return: Boolean (True or False)
+        """
+        header = bytearray([0x80 | opcode])
+        mask_bit = 0x80 if self.is_client else 0
+        if len(payload) < 126:
+            header.append(mask_bit | len(payload))
+        elif len(payload) < 65536:
+            header.append(mask_bit | 126)
+            header.extend(struct.pack('!H', len(payload)))
+        else:
+            header.append(mask_bit | 127)
+            header.extend(struct.pack('!Q', len(payload)))
+
+        if self.is_client:
+            mask = os.urandom(4)
+            header.extend(mask)
+            payload = (int.from_bytes(payload, 'big') ^
+                       int.from_bytes((mask * (len(payload) // 4 + 1))[:len(payload)], 'big')
+                       ).to_bytes(len(payload), 'big')
+
+        with self.write_lock:
+            self.socket.sendall(bytes(header) + payload)
+        return True
+
+    def send_text(self, text):
+        return self.send_frame(OPCODE_TEXT, text.encode())
+
+
+def get_websocket_accept_key(key):
+    """
+    This function computes the \"Sec-WebSocket-Accept\" header of the handshake answer
+
+    :param key: (String) The \"Sec-WebSocket-Key\" header of the client
+    :return: (String) The accept key
+    """
+    return base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+
+
+def read_http_headers(connection_socket, buffer):
+    """
+    This function reads an HTTP head (request or response) from a socket
+
+    :param connection_socket: (socket.socket) The socket
+    :param buffer: (bytearray) The bytes read so far (the bytes after the head are left in it)
+    :return: (Tuple) The first line and the headers (lower case names) or None
+    """
+    while b'\r\n\r\n' not in buffer:
+        data = connection_socket.recv(4096)
+        if len(data) == 0 or len(buffer) > 16384:
+            return None
+        buffer.extend(data)
+
+    (head, _, rest) = bytes(buffer).partition(b'\r\n\r\n')
+    del buffer[:]
+    buffer.extend(rest)
+
+    lines = head.decode('latin-1').split('\r\n')
+    dict_headers = {}
+    for line in lines[1:]:
+        (name, _, value) = line.partition(':')
+        dict_headers[name.strip().lower()] = value.strip()
+
+    return lines[0], dict_headers
+
+
+# endregion WebSocket
+
+
+# region JogChannelHandler
+class JogRequestHandler(socketserver.BaseRequestHandler):
+    """
+    This class serves one jog channel connection
+    """
+
+    def handle(self):
+        jog_channel_handler = self.server.jog_channel_handler
+        buffer = bytearray()
+
+        http_head = read_http_headers(self.request, buffer)
+        if http_head is None:
+            return
+
+        (_, dict_headers) = http_head
+        if dict_headers.get('upgrade', '').lower() != 'websocket' or 'sec-websocket-key' not in dict_headers:
+            self.request.sendall(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            return
+
+        # the browsers send the origin of the page: any page could otherwise jog the arm through a local browser
+        if 'origin' in dict_headers and not jog_channel_handler.is_allowed_origin(dict_headers['origin'],
+                                                                                  dict_headers.get('host', '')):
+            self.request.sendall(b'HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            return
+
+        self.request.sendall(('HTTP/1.1 101 Switching Protocols\r\n'
+                              'Upgrade: websocket\r\n'
+                              'Connection: Upgrade\r\n'
+                              'Sec-WebSocket-Accept: %s\r\n\r\n'
+                              % get_websocket_accept_key(dict_headers['sec-websocket-key'])).encode())
+
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        websocket = WebSocketConnection(self.request)
+        websocket.buffer.extend(buffer)
+
+        jog_channel_handler.serve(websocket)
+
+
+class JogChannelServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class JogChannelHandler(object):
+    """
+    This class runs the jog channel server. Every message sets the duty cycle of some motors or jogs them one step,
+    and all the messages that arrived together are acknowledged with a single answer. A stop message stops every motor
+    without needing a free REST worker (the \"DELETE\" request waits for one when the REST server is saturated).
+    """
+
+    def __init__(self, max_batch_size=64, allowed_origins=None):
+        """
+        This constructor initializes the jog channel handler
+
+        :param max_batch_size: (Integer) The maximum number of messages acknowledged by one answer
+        :param allowed_origins: (List) The origins (e.g. \"http://raspberrypi:9090\") of the pages allowed to connect
+                                (Default: the \"ROBOTIC_ARM_JOG_ORIGINS\" environment variable, comma separated,
+                                otherwise the pages served by the same host as the jog channel)
+        """
+        try:
+            self.max_batch_size = max_batch_size
+            if allowed_origins is None and os.environ.get('ROBOTIC_ARM_JOG_ORIGINS'):
+                allowed_origins = [origin.strip() for origin in os.environ['ROBOTIC_ARM_JOG_ORIGINS'].split(',')]
+            self.allowed_origins = allowed_origins
+
+            self.server = None
+            self.server_thread = None
+
+            self.number_of_connections = 0
+            self.number_of_messages = 0
+            self.number_of_batches = 0
+            self.number_of_errors = 0
+            self.lock = threading.Lock()
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, 'JogChannelHandler')
+
+    def start(self, host='127.0.0.1', port=9091):
+        """
+        This method starts the jog channel server in a background thread
+
+        :param host: (String) The address the server listens on (\"0.0.0.0\" accepts the remote clients)
+        :param port: (Integer) The port the server listens on
+        :return: Boolean (True or False)
+        """
+        try:
+            if self.server is not None:
+                console.log('The jog channel has already been started.', console.LOG_WARNING, self.start.__name__)
+                return False
+
+            self.server = JogChannelServer((host, port), JogRequestHandler)
+            self.server.jog_channel_handler = self
+            self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+            self.server_thread.start()
+
+            console.log('The jog channel is listening on ws://%s:%d' % (host, port), console.LOG_INFO,
+                        self.start.__name__)
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.start.__name__)
+            return False
+
+    def is_allowed_origin(self, origin, host):
+        """
+        This method checks the origin of a browser connection
+
+        :param origin: (String) The \"Origin\" header
+        :param host: (String) The \"Host\" header (the jog channel address used by the page)
+        :return: Boolean (True or False)
+        """
+        if self.allowed_origins is not None:
+            return origin.rstrip('/') in [allowed_origin.rstrip('/') for allowed_origin in self.allowed_origins]
+
+        # by default, only the pages of the same host (the REST server) are allowed, whatever their port
+        origin_host = urllib.parse.urlsplit(origin).hostname
+        return origin_host is not None and origin_host == urllib.parse.urlsplit('//' + host).hostname
+
+    def stop(self):
+        """
+        This method stops the jog channel server
+
+        :return: Boolean (True or False)
+        """
+        try:
+            if self.server is not None:
+                self.server.shutdown()
+                self.server.server_close()
+                self.server = None
+                self.server_thread = None
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.stop.__name__)
+            return False
+
+    def serve(self, websocket):
+        """
+        This method applies the messages of a connection until it is closed. The messages that are already waiting
+        are applied together and acknowledged with one answer:
+            {
+                'ack': <Integer> (the last sequence number),
+                'count': <Integer> (the number of messages),
+                'errors': [{'seq': <Integer>, 'error': <String>}]
+            }
+
+        :param websocket: (WebSocketConnection) The connection
+        :return: Boolean (True or False)
+        """
+        with self.lock:
+            self.number_of_connections += 1
+
+        try:
+            while True:
+                last_sequence_number = None
+                list_errors = []
+                count = 0
+
+                while count < self.max_batch_size:
+                    message = websocket.receive_message()
+                    if message is None:
+                        return True
+
+                    result = self.apply_stop_message(message[1])
+                    if result is None:
+                        result = actuator_handler.execute('jog_message', self.apply_message, message[1])
+                    # the message has not been applied in time (its sequence number is unknown)
+                    (sequence_number, error) = result if result is not False else \
+                        (None, rest_error_message_handler.get_last_error_message())
+                    last_sequence_number = sequence_number if sequence_number is not None else last_sequence_number
+                    if error is not None:
+                        list_errors.append({'seq': sequence_number, 'error': error})
+                    count += 1
+
+                    if not websocket.has_pending_frame():
+                        break
+
+                with self.lock:
+                    self.number_of_messages += count
+                    self.number_of_batches += 1
+                    self.number_of_errors += len(list_errors)
+
+                websocket.send_text(json.dumps({'ack': last_sequence_number, 'count': count, 'errors': list_errors}))
+        except (ConnectionError, OSError):
+            return False
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.serve.__name__)
+            return False
+        finally:
+            with self.lock:
+                self.number_of_connections -= 1
+
+    @staticmethod
+    def apply_stop_message(payload):
+        """
+        This method applies a stop message, through the priority lane (see \"Methods.emergency_stop\")
+
+        :param payload: (Bytes) The JSON message
+            {
+                'seq': <Integer>,
+                'stop': <Boolean>
+            }
+        :return: (Tuple) The sequence number and the error (None if every motor has been stopped) or None if the
+                 message is not a stop
+        """
+        # the jog messages are not parsed twice (they are parsed by the actuator thread)
+        if b'"stop"' not in payload:
+            return None
+
+        sequence_number = None
+        try:
+            message = json.loads(payload)
+            if not message.get('stop'):
+                return None
+
+            sequence_number = message.get('seq')
+            if methods_handler.emergency_stop() is False:
+                return sequence_number, rest_error_message_handler.get_last_error_message() or \
+                    'The motors could not be stopped'
+
+            return sequence_number, None
+        except Exception as error_message:
+            return sequence_number, str(error_message)
+
+    @staticmethod
+    def apply_message(payload):
+        """
+        This method applies one jog channel message
+
+        :param payload: (Bytes) The JSON message
+            {
+                'seq': <Integer>,
+                'motors': [{'name': <String>, 'duty_cycle': <Number>}] (Optional),
+                'jog': [{'name': <String>, 'direction': <String> (\"left\" or \"right\")}] (Optional)
+            }
+        :return: (Tuple) The sequence number and the error (None if the message was applied)
+        """
+        sequence_number = None
+        try:
+            message = json.loads(payload)
+            sequence_number = message.get('seq')
+
+            for motor in message.get('motors', []):
+                servo_motor = dict_servo_motors.get(motor['name'])
+                if servo_motor is None:
+                    return sequence_number, 'Unknown motor %s' % str(motor['name'])
+
+                duty_cycle = float(motor['duty_cycle'])
+                if not 0 <= duty_cycle <= 100:
+                    return sequence_number, 'Invalid duty cycle %s' % str(duty_cycle)
+
+                if servo_motor.set_gpio_pin_duty_cycle(duty_cycle) is False:
+                    return sequence_number, 'The motor %s could not be updated' % motor['name']
+
+            for motor in message.get('jog', []):
+                servo_motor = dict_servo_motors.get(motor['name'])
+                if servo_motor is None:
+                    return sequence_number, 'Unknown motor %s' % str(motor['name'])
+
+                if motor['direction'] == 'left':
+                    is_moved = servo_motor.rotate_left()
+                elif motor['direction'] == 'right':
+                    is_moved = servo_motor.rotate_right()
+                else:
+                    return sequence_number, 'Unknown direction %s' % str(motor['direction'])
+
+                if is_moved is False:
+                    return sequence_number, 'The motor %s could not be jogged' % motor['name']
+
+            return sequence_number, None
+        except Exception as error_message:
+            return sequence_number, str(error_message)
+
+    def get_stats(self):
+        """
+        This method returns the jog channel statistics
+
+        :return: (Dictionary) The number of open connections, of messages, of acknowledgements and of errors
+        """
+        with self.lock:
+            return {
+                'number_of_connections': self.number_of_connections,
+                'number_of_messages': self.number_of_messages,
+                'number_of_batches': self.number_of_batches,
+                'number_of_errors': self.number_of_errors
+            }
+
+
+jog_channel_handler = JogChannelHandler()
+# endregion JogChannelHandler
+
+
+# region JogClient
+class JogClient(object):
+    """
+    This class is a minimal jog channel client (used by the latency benchmark and by automated controllers)
+    """
+
+    def __init__(self, host='127.0.0.1', port=9091, timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.websocket = None
+        self.sequence_number = 0
+
+    def connect(self):
+        """
+        This method opens the connection and performs the WebSocket handshake
+
+        :return: Boolean (True or False)
+        """
+        try:
+            connection_socket = socket.create_connection((self.host, self.port), self.timeout)
+            connection_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            key = base64.b64encode(os.urandom(16)).decode()
+            connection_socket.sendall(('GET / HTTP/1.1\r\n'
+                                       'Host: %s:%d\r\n'
+                                       'Upgrade: websocket\r\n'
+                                       'Connection: Upgrade\r\n'
+                                       'Sec-WebSocket-Key: %s\r\n'
+                                       'Sec-WebSocket-Version: 13\r\n\r\n' % (self.host, self.port, key)).encode())
+
+            buffer = bytearray()
+            http_head = read_http_headers(connection_socket, buffer)
+            if http_head is None or ' 101 ' not in http_head[0] or \
+                    http_head[1].get('sec-websocket-accept') != get_websocket_accept_key(key):
+                connection_socket.close()
+                console.log('The jog channel handshake failed.', console.LOG_WARNING, self.connect.__name__)
+                return False
+
+            self.websocket = WebSocketConnection(connection_socket, is_client=True)
+            self.websocket.buffer.extend(buffer)
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.connect.__name__)
+            return False
+
+    def send(self, motors=None, jog=None):
+        """
+        This method sends one message (it does not wait for the acknowledgement)
+
+        :param motors: (List) The duty cycles [{'name': <String>, 'duty_cycle': <Number>}]
+        :param jog: (List) The jog steps [{'name': <String>, 'direction': <String>}]
+        :return: (Integer) The sequence number of the message
+        """
+        self.sequence_number += 1
+        message = {'seq': self.sequence_number}
+        if motors is not None:
+            message['motors'] = motors
+        if jog is not None:
+            message['jog'] = jog
+
+        self.websocket.send_text(json.dumps(message))
+        return self.sequence_number
+
+    def send_stop(self):
+        """
+        This method sends a stop message (every motor is stopped, see \"JogChannelHandler.apply_stop_message\")
+
+        :return: (Integer) The sequence number of the message
+        """
+        self.sequence_number += 1
+        self.websocket.send_text(json.dumps({'seq': self.sequence_number, 'stop': True}))
+        return self.sequence_number
+
+    def receive_ack(self):
+        """
+        This method waits for the next acknowledgement
+
+        :return: (Dictionary) The acknowledgement or None if the connection was closed
+        """
+        message = self.websocket.receive_message()
+        return json.loads(message[1]) if message is not None else None
+
+    def wait_ack(self, sequence_number):
+        """
+        This method waits until a message has been acknowledged
+
+        :param sequence_number: (Integer) The sequence number
+        :return: (List) The acknowledgements received
+        """
+        list_acks = []
+        while True:
+            ack = self.receive_ack()
+            if ack is None:
+                return list_acks
+
+            list_acks.append(ack)
+            if ack['ack'] is not None and ack['ack'] >= sequence_number:
+                return list_acks
+
+    def close(self):
+        try:
+            self.websocket.send_frame(OPCODE_CLOSE, struct.pack('!H', 1000))
+            self.websocket.socket.close()
+        except OSError:
+            pass
+        return True
+
+
+# endregion JogClient
@@ -0,0 +1,251 @@
+"""
+This file has the live stream functionality (one producer thread encodes every camera frame once, and every viewer of
+the MJPEG stream, as well as the video ring buffer, reads the same JPEG bytes)
+"""
+
+# region imports
+import io
+import threading
+import time
+
+from globals import console
+# endregion imports
+
+
+# region LiveStreamHandler
+class LiveStreamHandler(object):
+    """
+    This class shares the latest JPEG frame between all the viewers. Every viewer waits for a sequence number newer
+    than the last one it sent, so a slow viewer skips frames instead of queueing them.
+    """
+    BOUNDARY = 'frame'
+
+    def __init__(self, camera_handler=None, frame_rate=10, resolution=(640, 480), quality=70, idle_timeout=10,
+                 splitter_port=2):
+        """
+        This constructor initializes the live stream handler
+
+        :param camera_handler: (picamera.PiCamera / FileCamera) The camera (Default: the \"camera\" module camera,
+                               opened by the first viewer)
+        :param frame_rate: (Float) The number of frames encoded per second
+        :param resolution: (Tuple) The (width, height) of the streamed frames
+        :param quality: (Integer) The JPEG quality
+        :param idle_timeout: (Float) The number of seconds the producer keeps running without viewers or listeners
+        :param splitter_port: (Integer) The camera video port used by the producer (the port 0 is used by the image
+                              captures and the vision pipeline, the ports 1 and 3 by the recordings)
+        """
+        try:
+            self.camera_handler = camera_handler
+            self.frame_rate = frame_rate
+            self.resolution = resolution
+            self.quality = quality
+            self.idle_timeout = idle_timeout
+            self.splitter_port = splitter_port
+
+            self.frame = None
+            self.sequence_number = 0
+            self.condition = threading.Condition()
+
+            self.number_of_viewers = 0
+            self.number_of_sent_frames = 0
+            self.list_listeners = []
+            self.last_viewer_time = time.monotonic()
+
+            self.producer_thread = None
+            self.stop_event = threading.Event()
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, 'LiveStreamHandler')
+
+    def get_camera_handler(self):
+        """
+        This method returns the camera used by the producer
+
+        :return: (picamera.PiCamera / FileCamera) The camera
+        """
+        if self.camera_handler is None:
+            from camera import pi_camera_handler
+            self.camera_handler = pi_camera_handler.camera_handler
+
+        return self.camera_handler
+
+    def add_listener(self, listener):
+        """
+        This method registers a function called with every encoded frame and starts the producer. The producer does
+        not stop while it has listeners.
+
+        :param listener: (Function) The function called with the (monotonic capture time, JPEG bytes) of every frame
+        :return: Boolean (True or False)
+        """
+        with self.condition:
+            self.list_listeners.append(listener)
+
+        return self.start()
+
+    def remove_listener(self, listener):
+        """
+        This method unregisters a frame listener
+
+        :param listener: (Function) The function registered with "add_listener"
+        :return: Boolean (True or False)
+        """
+        with self.condition:
+            if listener not in self.list_listeners:
+                return False
+
+            self.list_listeners.remove(listener)
+            self.last_viewer_time = time.monotonic()
+            return True
+
+    def start(self):
+        """
+        This method starts the producer thread (if it is not already running)
+
+        :return: Boolean (True or False)
+        """
+        try:
+            with self.condition:
+                if self.producer_thread is not None and self.producer_thread.is_alive():
+                    return True
+
+                self.stop_event.clear()
+                self.last_viewer_time = time.monotonic()
+                self.producer_thread = threading.Thread(target=self.produce, daemon=True)
+                self.producer_thread.start()
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.start.__name__)
+            return False
+
+    def stop(self):
+        """
+        This method stops the producer thread
+
+        :return: Boolean (True or False)
+        """
+        try:
+            self.stop_event.set()
+            with self.condition:
+                self.condition.notify_all()
+
+            if self.producer_thread is not None:
+                self.producer_thread.join()
+                self.producer_thread = None
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.stop.__name__)
+            return False
+
+    def produce(self):
+        """
+        This method encodes the camera frames and hands them to the listeners (it runs in the producer thread). It stops
+        by itself once nobody has watched the stream for \"idle_timeout\" seconds and there are no listeners.
+
+        :return: Boolean (True or False)
+        """
+        try:
+            stream = io.BytesIO()
+            frame_period = 1 / self.frame_rate
+            next_time = time.monotonic()
+
+            for _ in self.get_camera_handler().capture_continuous(stream, format='jpeg', use_video_port=True,
+                                                                  resize=self.resolution,
+                                                                  splitter_port=self.splitter_port,
+                                                                  quality=self.quality):
+                (captured_time, frame) = (time.monotonic(), stream.getvalue())
+                with self.condition:
+                    self.frame = frame
+                    self.sequence_number += 1
+                    self.condition.notify_all()
+
+                    list_listeners = list(self.list_listeners)
+                    is_idle = self.number_of_viewers == 0 and len(list_listeners) == 0 and \
+                        time.monotonic() - self.last_viewer_time > self.idle_timeout
+
+                for listener in list_listeners:
+                    try:
+                        listener(captured_time, frame)
+                    except Exception as error_message:
+                        console.log(error_message, console.LOG_ERROR, self.produce.__name__)
+
+                stream.seek(0)
+                stream.truncate()
+
+                if is_idle or self.stop_event.is_set():
+                    break
+
+                next_time = max(next_time + frame_period, time.monotonic())
+                if self.stop_event.wait(next_time - time.monotonic()):
+                    break
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.produce.__name__)
+            return False
+        finally:
+            with self.condition:
+                self.condition.notify_all()
+
+    def get_frame(self, last_sequence_number=0, timeout=5):
+        """
+        This method waits for a frame newer than the last one a viewer received
+
+        :param last_sequence_number: (Integer) The sequence number of the last frame received by the viewer
+        :param timeout: (Float) The maximum wait, in seconds
+        :return: (Tuple) The sequence number and the JPEG bytes of the latest frame or False
+        """
+        with self.condition:
+            is_new_frame = self.condition.wait_for(
+                lambda: self.sequence_number > last_sequence_number or self.stop_event.is_set() or
+                self.producer_thread is None or not self.producer_thread.is_alive(),
+                timeout)
+
+            if not is_new_frame or self.sequence_number <= last_sequence_number:
+                return False
+
+            return self.sequence_number, self.frame
+
+    def generate_stream(self):
+        """
+        This generator yields the parts of a \"multipart/x-mixed-replace\" response, one per new frame, until the viewer
+        disconnects or the producer stops
+        """
+        with self.condition:
+            self.number_of_viewers += 1
+
+        try:
+            self.start()
+
+            sequence_number = 0
+            while not self.stop_event.is_set():
+                latest_frame = self.get_frame(sequence_number)
+                if latest_frame is False:
+                    break
+
+                (sequence_number, frame) = latest_frame
+                self.number_of_sent_frames += 1
+                yield ('--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n'
+                       % (self.BOUNDARY, len(frame))).encode() + frame + b'\r\n'
+        finally:
+            with self.condition:
+                self.number_of_viewers -= 1
+                self.last_viewer_time = time.monotonic()
+
+    def get_stats(self):
+        """
+        This method returns the live stream statistics
+
+        :return: (Dictionary) The number of viewers, of encoded frames and of sent frames
+        """
+        return {
+            'is_running': self.producer_thread is not None and self.producer_thread.is_alive(),
+            'number_of_viewers': self.number_of_viewers,
+            'number_of_listeners': len(self.list_listeners),
+            'number_of_encoded_frames': self.sequence_number,
+            'number_of_sent_frames': self.number_of_sent_frames
+        }
+
+
+live_stream_handler = LiveStreamHandler()
+# endregion LiveStreamHandler
@@ -0,0 +1,432 @@
+"""
+This file is a load generator for the REST API. It should be run against a server started with the simulated backends:
+    ROBOTIC_ARM_GPIO_BACKEND=simulated ROBOTIC_ARM_CAMERA=file python3 main.py
+    python3 load_test.py --concurrency 8 --duration 30 --mix duty_cycle=90,get=10 --output results.json
+"""
+
+# region imports
+import argparse
+import datetime
+import http.client
+import json
+import random
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+from globals import console
+# endregion imports
+
+
+# region operations
+def get_operation_request(operation, motor_names, random_generator):
+    """
+    This function returns the request sent for an operation of the payload mix
+
+    :param operation: (String) \"duty_cycle\", \"gpio_init\", \"gpio_cleanup\", \"get\" or \"<METHOD>:<path>\" (any
+                      other endpoint, e.g. \"GET:/api/motors\")
+    :param motor_names: (List) The motors the payloads refer to
+    :param random_generator: (random.Random) The random generator of the worker
+    :return: (Tuple) The method, the path and the body (None for the requests without a body)
+    """
+    if operation == 'duty_cycle':
+        return 'POST', '/api/tools', {
+            'motors': [{'name': name, 'duty_cycle': round(random_generator.uniform(2.5, 12.5), 2)}
+                       for name in motor_names],
+            'duty_cycle': True
+        }
+
+    if operation in ('gpio_init', 'gpio_cleanup'):
+        return 'POST', '/api/tools', {'motors': [{'name': name} for name in motor_names], operation: True}
+
+    if operation == 'get':
+        return 'GET', '/api/tools', None
+
+    (method, _, path) = operation.partition(':')
+    if not path.startswith('/'):
+        raise ValueError('Unknown operation %s' % operation)
+
+    return method.upper(), path, None
+
+
+def parse_mix(mix):
+    """
+    This function parses the payload mix (\"<operation>=<weight>,...\")
+
+    :param mix: (String) The payload mix
+    :return: (Tuple) The operations and their weights
+    """
+    list_operations = []
+    list_weights = []
+    for item in mix.split(','):
+        (operation, _, weight) = item.strip().rpartition('=')
+        list_operations.append(operation)
+        list_weights.append(float(weight))
+
+    return list_operations, list_weights
+
+
+# endregion operations
+
+
+# region LoadTest
+class LoadTest(object):
+    """
+    This class drives the REST API with a number of concurrent workers (each one keeps its connection alive) and
+    samples the CherryPy thread pool while the test is running
+    """
+
+    def __init__(self, url='http://127.0.0.1:9090', concurrency=4, rate=0, duration=10, mix='duty_cycle=90,get=10',
+                 motor_names=None, timeout=10, seed=0):
+        """
+        This constructor initializes the load test
+
+        :param url: (String) The server URL
+        :param concurrency: (Integer) The number of concurrent workers
+        :param rate: (Float) The total number of requests per second (0: as fast as possible). With a fixed rate, the
+                     latency is measured from the time the request was due, so a slow server is not hidden by the
+                     workers waiting for it
+        :param duration: (Float) The number of seconds the load is applied for
+        :param mix: (String) The payload mix (\"<operation>=<weight>,...\")
+        :param motor_names: (List) The motors the payloads refer to (Default: all of them, read from \"/api/motors\")
+        :param timeout: (Float) The request timeout, in seconds
+        :param seed: (Integer) The seed of the random payloads
+        """
+        parsed_url = urllib.parse.urlparse(url)
+        self.host = parsed_url.hostname
+        self.port = parsed_url.port or 80
+        self.url = url
+
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.mix = mix
+        (self.list_operations, self.list_weights) = parse_mix(mix)
+        self.motor_names = motor_names
+        self.timeout = timeout
+        self.seed = seed
+
+        self.list_results = []
+        self.list_pool_samples = []
+        self.lock = threading.Lock()
+        self.request_index = 0
+        self.start_time = None
+        self.end_time = None
+        self.stop_event = threading.Event()
+
+    def request(self, connection, method, path, body=None):
+        """
+        This method sends one request over a persistent connection
+
+        :param connection: (http.client.HTTPConnection) The connection
+        :param method: (String) The HTTP method
+        :param path: (String) The path
+        :param body: (Dictionary) The JSON body
+        :return: (Tuple) The status code and the response body
+        """
+        if body is None:
+            connection.request(method, path)
+        else:
+            connection.request(method, path, json.dumps(body), {'Content-Type': 'application/json'})
+
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    def get_due_time(self):
+        """
+        This method returns the time the next request is due (None once the test is over)
+
+        :return: (Float) The due time
+        """
+        with self.lock:
+            due_time = self.start_time + (self.request_index / self.rate if self.rate > 0 else 0)
+            self.request_index += 1
+
+        if due_time >= self.end_time:
+            return None
+
+        return max(due_time, time.perf_counter()) if self.rate <= 0 else due_time
+
+    def run_worker(self, worker_index):
+        """
+        This method sends the requests of a worker until the end of the test
+
+        :param worker_index: (Integer) The worker index (used for its random seed)
+        :return: Boolean (True or False)
+        """
+        random_generator = random.Random(self.seed + worker_index)
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        list_results = []
+
+        while not self.stop_event.is_set():
+            due_time = self.get_due_time()
+            if due_time is None or time.perf_counter() >= self.end_time:
+                break
+
+            delay = due_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            operation = random_generator.choices(self.list_operations, self.list_weights)[0]
+            (method, path, body) = get_operation_request(operation, self.motor_names, random_generator)
+
+            try:
+                (status, _) = self.request(connection, method, path, body)
+                error = None if status < 400 else 'HTTP %d' % status
+            except (OSError, http.client.HTTPException) as error_message:
+                error = type(error_message).__name__
+                connection.close()
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+            list_results.append((operation, due_time, time.perf_counter() - due_time, error))
+
+        connection.close()
+        with self.lock:
+            self.list_results.extend(list_results)
+
+        return True
+
+    def sample_thread_pool(self, period=0.1):
+        """
+        This method samples the CherryPy thread pool (\"/api/server\") until the end of the test
+
+        :param period: (Float) The sampling period, in seconds
+        :return: Boolean (True or False)
+        """
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        while not self.stop_event.wait(period):
+            try:
+                (status, body) = self.request(connection, 'GET', '/api/server')
+                if status == 200:
+                    self.list_pool_samples.append(json.loads(body))
+            except (OSError, http.client.HTTPException, ValueError):
+                connection.close()
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+        connection.close()
+        return True
+
+    def load_motor_names(self):
+        """
+        This method reads the motor names from the server (\"/api/motors\") when they were not given, the load
+        generator does not import the servo module (it would create the GPIO backend and the actuator thread)
+
+        :return: (List) The motor names
+        """
+        if self.motor_names is not None:
+            return self.motor_names
+
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            (status, body) = self.request(connection, 'GET', '/api/motors')
+            if status != 200:
+                raise ValueError('The motors could not be listed (HTTP %d)' % status)
+
+            self.motor_names = list(json.loads(body).keys())
+            return self.motor_names
+        finally:
+            connection.close()
+
+    def setup(self):
+        """
+        This method initializes the motors before the load is applied (so that the duty cycle updates can succeed)
+
+        :return: Boolean (True or False)
+        """
+        self.load_motor_names()
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            (status, body) = self.request(connection, *get_operation_request('gpio_init', self.motor_names, None))
+            if status >= 400:
+                console.log('The motors could not be initialized: %s' % body.decode(errors='replace'),
+                            console.LOG_WARNING, self.setup.__name__)
+                return False
+
+            return True
+        finally:
+            connection.close()
+
+    def run(self):
+        """
+        This method runs the load test
+
+        :return: (Dictionary) The report (see \"get_report\")
+        """
+        self.load_motor_names()
+        self.list_results = []
+        self.list_pool_samples = []
+        self.request_index = 0
+        self.stop_event.clear()
+
+        self.start_time = time.perf_counter()
+        self.end_time = self.start_time + self.duration
+
+        sampler_thread = threading.Thread(target=self.sample_thread_pool, daemon=True)
+        sampler_thread.start()
+
+        list_worker_threads = [threading.Thread(target=self.run_worker, args=(worker_index,), daemon=True)
+                               for worker_index in range(self.concurrency)]
+        for worker_thread in list_worker_threads:
+            worker_thread.start()
+        for worker_thread in list_worker_threads:
+            worker_thread.join()
+
+        elapsed_time = time.perf_counter() - self.start_time
+        self.stop_event.set()
+        sampler_thread.join()
+
+        return self.get_report(elapsed_time)
+
+    @staticmethod
+    def get_latency_summary(list_results, elapsed_time):
+        """
+        This method summarizes a list of results
+
+        :param list_results: (List) The (operation, due time, latency, error) results
+        :param elapsed_time: (Float) The length of the test, in seconds
+        :return: (Dictionary) The throughput, the latency percentiles (in milliseconds) and the error rate
+        """
+        latencies = np.array([latency for (_, _, latency, _) in list_results]) * 1000
+        number_of_errors = sum(1 for (_, _, _, error) in list_results if error is not None)
+
+        summary = {
+            'requests': len(list_results),
+            'errors': number_of_errors,
+            'error_rate': number_of_errors / len(list_results) if list_results else 0,
+            'throughput': len(list_results) / elapsed_time if elapsed_time > 0 else 0
+        }
+        if len(latencies) > 0:
+            summary.update({
+                'latency_mean_ms': float(latencies.mean()),
+                'latency_p50_ms': float(np.percentile(latencies, 50)),
+                'latency_p95_ms': float(np.percentile(latencies, 95)),
+                'latency_p99_ms': float(np.percentile(latencies, 99)),
+                'latency_max_ms': float(latencies.max())
+            })
+
+        return summary
+
+    def get_report(self, elapsed_time):
+        """
+        This method builds the report of the last run
+
+        :param elapsed_time: (Float) The length of the test, in seconds
+        :return: (Dictionary) The configuration, the overall and per operation summaries, the errors and the thread
+                 pool statistics
+        """
+        dict_errors = {}
+        for (_, _, _, error) in self.list_results:
+            if error is not None:
+                dict_errors[error] = dict_errors.get(error, 0) + 1
+
+        thread_pool = {'samples': len(self.list_pool_samples)}
+        if self.list_pool_samples:
+            # the sampling request itself keeps one thread busy
+            busy_threads = np.array([sample['busy_threads'] - 1 for sample in self.list_pool_samples])
+            number_of_threads = np.array([sample['number_of_threads'] for sample in self.list_pool_samples])
+            queued_connections = np.array([sample['queued_connections'] for sample in self.list_pool_samples])
+            thread_pool.update({
+                'number_of_threads': int(number_of_threads.max()),
+                'busy_threads_mean': float(busy_threads.mean()),
+                'busy_threads_max': int(busy_threads.max()),
+                'queued_connections_mean': float(queued_connections.mean()),
+                'queued_connections_max': int(queued_connections.max()),
+                'saturation': float(np.mean((busy_threads + 1 >= number_of_threads) | (queued_connections > 0)))
+            })
+
+        return {
+            'created_time': datetime.datetime.now().isoformat(),
+            'config': {
+                'url': self.url,
+                'concurrency': self.concurrency,
+                'rate': self.rate,
+                'duration': self.duration,
+                'mix': self.mix,
+                'motors': self.motor_names,
+                'seed': self.seed
+            },
+            'elapsed_time': elapsed_time,
+            'summary': self.get_latency_summary(self.list_results, elapsed_time),
+            'operations': {operation: self.get_latency_summary([result for result in self.list_results
+                                                                if result[0] == operation], elapsed_time)
+                           for operation in self.list_operations},
+            'errors': dict_errors,
+            'thread_pool': thread_pool
+        }
+
+
+# endregion LoadTest
+
+
+# region main
+def log_report(report):
+    """
+    This function prints the summary of a report
+
+    :param report: (Dictionary) The report
+    :return: Boolean (True or False)
+    """
+    for (name, summary) in [('all', report['summary'])] + list(report['operations'].items()):
+        if summary['requests'] == 0:
+            continue
+
+        console.log('%-16s %6d requests, %8.1f req/s, p50 %7.2f ms, p95 %7.2f ms, p99 %7.2f ms, errors %.2f%%' %
+                    (name, summary['requests'], summary['throughput'], summary['latency_p50_ms'],
+                     summary['latency_p95_ms'], summary['latency_p99_ms'], summary['error_rate'] * 100),
+                    console.LOG_INFO,
+                    log_report.__name__)
+
+    console.log('Thread pool: %s' % str(report['thread_pool']), console.LOG_INFO, log_report.__name__)
+    if report['errors']:
+        console.log('Errors: %s' % str(report['errors']), console.LOG_WARNING, log_report.__name__)
+
+    return True
+
+
+def main():
+    """
+    This function parses the command line arguments and runs the load test
+
+    :return: Boolean (True or False)
+    """
+    try:
+        parser = argparse.ArgumentParser(description='Load generator for the robotic arm REST API')
+        parser.add_argument('--url', default='http://127.0.0.1:9090', help='the server URL')
+        parser.add_argument('--concurrency', type=int, default=4, help='the number of concurrent workers')
+        parser.add_argument('--rate', type=float, default=0,
+                            help='the total number of requests per second (0: as fast as possible)')
+        parser.add_argument('--duration', type=float, default=10, help='the length of the test, in seconds')
+        parser.add_argument('--mix', default='duty_cycle=90,get=10',
+                            help='the payload mix: <operation>=<weight>,... where the operation is duty_cycle, '
+                                 'gpio_init, gpio_cleanup, get or <METHOD>:<path> (e.g. GET:/api/motors)')
+        parser.add_argument('--motors', help='the motors used by the payloads, comma separated (default: all the motors '
+                                             'of the server)')
+        parser.add_argument('--no-setup', action='store_true', help='do not initialize the motors before the test')
+        parser.add_argument('--seed', type=int, default=0, help='the seed of the random payloads')
+        parser.add_argument('--output', help='the JSON file the report is written to')
+        arguments = parser.parse_args()
+
+        load_test = LoadTest(arguments.url, arguments.concurrency, arguments.rate, arguments.duration, arguments.mix,
+                             arguments.motors.split(',') if arguments.motors else None, seed=arguments.seed)
+        if not arguments.no_setup:
+            load_test.setup()
+
+        report = load_test.run()
+        log_report(report)
+
+        if arguments.output is not None:
+            with open(arguments.output, 'w') as file_handler:
+                json.dump(report, file_handler, indent=4)
+            console.log('The report has been saved to %s' % arguments.output, console.LOG_SUCCESS, main.__name__)
+
+        return True
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, main.__name__)
+        return False
+
+
+if __name__ == '__main__':
+    main()
+# endregion main
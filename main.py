@@ -6,11 +6,21 @@ This file is the main part of the Project. This is the file that is being execut
 # region imports
 import cherrypy
 import atexit
+import os
 import sys
 
 from globals import console
+from gpio_backend import SimulatedGPIOBackend
+from servo import gpio_handler
+from trajectory import trajectory_handler
+from board_state import board_state_handler
+from video_ring_buffer import video_ring_buffer
+from live_stream import live_stream_handler
+from jog_channel import jog_channel_handler
+from motor_protocol import motor_command_server
 
-from rest import Root, Methods, ExitCherryPyServer
+from rest import Root, Methods, Commands, Motors, Trajectories, Recordings, Clips, Stream, MediaFolder, \
+    Logs, Metrics, Server, ExitCherryPyServer
 # endregion imports
 
 
@@ -28,13 +38,34 @@ def main():
         cherrypy.config.update({
             # 'server.socket_host': '127.0.0.1',
             'server.socket_host': '0.0.0.0',
-            'server.socket_port': 9090
+            'server.socket_port': 9090,
+            'server.thread_pool': int(os.environ.get('ROBOTIC_ARM_THREAD_POOL', 16)),
+            'tools.request_metrics.on': True,
+            'tools.error_context.on': True
         })
 
         cherrypy.tree.mount(Root(), '/')
         cherrypy.tree.mount(Methods(), '/api/tools', conf)
+        cherrypy.tree.mount(Commands(), '/api/commands', conf)
+        cherrypy.tree.mount(Motors(), '/api/motors', conf)
+        cherrypy.tree.mount(Trajectories(), '/api/trajectories', conf)
+        cherrypy.tree.mount(Recordings(), '/api/recordings', conf)
+        cherrypy.tree.mount(Clips(), '/api/clips', conf)
+        cherrypy.tree.mount(Stream(), '/api/stream', conf)
+        cherrypy.tree.mount(Logs(), '/api/logs', conf)
+        cherrypy.tree.mount(Metrics(), '/api/metrics', conf)
+        cherrypy.tree.mount(Server(), '/api/server', conf)
+        cherrypy.tree.mount(MediaFolder('./images'), '/images', conf)
+        cherrypy.tree.mount(MediaFolder('./videos'), '/videos', conf)
         cherrypy.tree.mount(ExitCherryPyServer(), '/api/exit', conf)
 
+        if os.environ.get('ROBOTIC_ARM_RING_BUFFER', '0') == '1':
+            start_video_ring_buffer()
+
+        jog_channel_handler.start(os.environ.get('ROBOTIC_ARM_JOG_HOST', '127.0.0.1'),
+                                  int(os.environ.get('ROBOTIC_ARM_JOG_PORT', 9091)))
+        motor_command_server.start(os.environ.get('ROBOTIC_ARM_COMMAND_ADDRESS', '127.0.0.1:9092'))
+
         cherrypy.engine.start()
         cherrypy.engine.block()
 
@@ -43,9 +74,32 @@ def main():
         return False
 
 
+def start_video_ring_buffer():
+    """
+    This function starts recording the last seconds of video in memory. A clip is saved when a move is detected on the
+    board, when a trajectory fails on a motor or when it is requested over REST (\"/api/clips\").
+
+    :return: Boolean (True or False)
+    """
+    try:
+        board_state_handler.add_listener(lambda changes: video_ring_buffer.trigger('move'))
+        trajectory_handler.add_fault_listener(lambda job: video_ring_buffer.trigger('motor_fault'))
+
+        return video_ring_buffer.start(live_stream_handler)
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, start_video_ring_buffer.__name__)
+        return False
+
+
 @atexit.register
 def at_exit_file():
     console.log('The cherrypy server has been shut down.', console.LOG_SUCCESS, at_exit_file.__name__)
+    if isinstance(gpio_handler.backend, SimulatedGPIOBackend) and 'ROBOTIC_ARM_GPIO_TIMELINE' in os.environ:
+        gpio_handler.backend.timeline.save(os.environ['ROBOTIC_ARM_GPIO_TIMELINE'])
+    video_ring_buffer.stop()
+    live_stream_handler.stop()
+    jog_channel_handler.stop()
+    motor_command_server.stop()
     cherrypy.engine.stop()
     cherrypy.engine.exit()
 
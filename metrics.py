@@ -0,0 +1,287 @@
+"""
+This file has the metrics functionality (counters and fixed-bucket histograms, exported in the Prometheus text format)
+
+The hot paths time their stages with \"time.perf_counter()\" and call \"observe\" / \"inc\", which only take a lock and
+update a few numbers (see \"debug.metrics_benchmark\" for the overhead).
+"""
+
+# region imports
+import bisect
+import threading
+# endregion imports
+
+
+# region metrics
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def format_labels(label_names, label_values, extra_label=None):
+    """
+    This function formats the labels of a sample (\"{name=\"value\",...}\")
+
+    :param label_names: (Tuple) The label names
+    :param label_values: (Tuple) The label values
+    :param extra_label: (Tuple) An extra (name, value) label (e.g. the \"le\" label of the histogram buckets)
+    :return: (String) The formatted labels
+    """
+    list_labels = ['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                   for (name, value) in zip(label_names, label_values)]
+    if extra_label is not None:
+        list_labels.append('%s="%s"' % extra_label)
+
+    return '{%s}' % ','.join(list_labels) if list_labels else ''
+
+
+def format_value(value):
+    """
+    This function formats a sample value (\"+Inf\" for the infinite bucket bound)
+
+    :param value: (Number) The value
+    :return: (String) The formatted value
+    """
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    """
+    This class counts events (one value per combination of labels). A counter can also read its values from a function
+    when it is exported, so that the counters that are already kept elsewhere cost nothing on the hot path.
+    """
+
+    def __init__(self, name, description, label_names=(), function=None):
+        """
+        This constructor initializes the counter
+
+        :param name: (String) The metric name
+        :param description: (String) The metric description (the \"HELP\" line)
+        :param label_names: (Tuple) The label names
+        :param function: (Function) Returns the current values ({label values: value})
+        """
+        self.name = name
+        # the samples of a counter are named \"<name>_total\" and its HELP and TYPE lines name the same family
+        self.family_name = name + '_total'
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.metric_type = 'counter'
+        self.function = function
+
+        self.dict_values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, label_values=(), value=1):
+        """
+        This method increments the counter
+
+        :param label_values: (Tuple) The label values (in the order of the label names)
+        :param value: (Number) The increment
+        :return: Boolean (True or False)
+        """
+        with self.lock:
+            self.dict_values[label_values] = self.dict_values.get(label_values, 0) + value
+
+        return True
+
+    def get_value(self, label_values=()):
+        with self.lock:
+            return self.dict_values.get(label_values, 0)
+
+    def get_samples(self):
+        """
+        This method returns the samples of the counter
+
+        :return: (List) The (name, labels, value) samples
+        """
+        return [(self.family_name, format_labels(self.label_names, label_values), value)
+                for (label_values, value) in sorted(self.get_values().items())]
+
+    def get_values(self):
+        if self.function is not None:
+            return self.function()
+
+        with self.lock:
+            return dict(self.dict_values)
+
+
+class Gauge(Counter):
+    """
+    This class holds values that go up and down (or reads them from a function when it is exported)
+    """
+
+    def __init__(self, name, description, label_names=(), function=None):
+        super(Gauge, self).__init__(name, description, label_names, function)
+        self.family_name = name
+        self.metric_type = 'gauge'
+
+    def set(self, value, label_values=()):
+        with self.lock:
+            self.dict_values[label_values] = value
+
+        return True
+
+    def get_samples(self):
+        return [(self.family_name, format_labels(self.label_names, label_values), value)
+                for (label_values, value) in sorted(self.get_values().items())]
+
+
+class Histogram(object):
+    """
+    This class counts the observed values (e.g. durations in seconds) in fixed buckets
+    """
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        """
+        This constructor initializes the histogram
+
+        :param name: (String) The metric name
+        :param description: (String) The metric description (the \"HELP\" line)
+        :param label_names: (Tuple) The label names
+        :param buckets: (Tuple) The sorted upper bounds of the buckets (the \"+Inf\" bucket is added)
+        """
+        self.name = name
+        self.family_name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.metric_type = 'histogram'
+        self.buckets = tuple(buckets)
+
+        # label values: [bucket counts (not cumulative), sum, count]
+        self.dict_values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, label_values=()):
+        """
+        This method adds a value to the histogram
+
+        :param value: (Float) The observed value
+        :param label_values: (Tuple) The label values (in the order of the label names)
+        :return: Boolean (True or False)
+        """
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            values = self.dict_values.get(label_values)
+            if values is None:
+                values = self.dict_values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+            values[0][bucket_index] += 1
+            values[1] += value
+            values[2] += 1
+
+        return True
+
+    def get_count(self, label_values=()):
+        with self.lock:
+            values = self.dict_values.get(label_values)
+            return values[2] if values is not None else 0
+
+    def get_samples(self):
+        """
+        This method returns the samples of the histogram (cumulative buckets, sum and count)
+
+        :return: (List) The (name, labels, value) samples
+        """
+        with self.lock:
+            list_items = [(label_values, list(values[0]), values[1], values[2])
+                          for (label_values, values) in sorted(self.dict_values.items())]
+
+        list_samples = []
+        for (label_values, bucket_counts, values_sum, count) in list_items:
+            cumulative_count = 0
+            for (upper_bound, bucket_count) in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative_count += bucket_count
+                list_samples.append((self.name + '_bucket',
+                                     format_labels(self.label_names, label_values, ('le', format_value(upper_bound))),
+                                     cumulative_count))
+
+            labels = format_labels(self.label_names, label_values)
+            list_samples.append((self.name + '_sum', labels, values_sum))
+            list_samples.append((self.name + '_count', labels, count))
+
+        return list_samples
+
+
+class MetricsRegistry(object):
+    """
+    This class holds all the metrics of the server and exports them in the Prometheus text format
+    """
+
+    def __init__(self):
+        self.dict_metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        This method registers a metric (a metric that is already registered under the same name is returned instead)
+
+        :param metric: (Counter / Gauge / Histogram) The metric
+        :return: (Counter / Gauge / Histogram) The registered metric
+        """
+        with self.lock:
+            return self.dict_metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, description, label_names=(), function=None):
+        return self.register(Counter(name, description, label_names, function))
+
+    def gauge(self, name, description, label_names=(), function=None):
+        return self.register(Gauge(name, description, label_names, function))
+
+    def histogram(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, description, label_names, buckets))
+
+    def get_metrics_text(self):
+        """
+        This method exports all the metrics in the Prometheus text format (version 0.0.4)
+
+        :return: (String) The metrics
+        """
+        with self.lock:
+            list_metrics = sorted(self.dict_metrics.values(), key=lambda metric: metric.name)
+
+        list_lines = []
+        for metric in list_metrics:
+            list_lines.append('# HELP %s %s' % (metric.family_name, metric.description.replace('\n', ' ')))
+            list_lines.append('# TYPE %s %s' % (metric.family_name, metric.metric_type))
+            for (name, labels, value) in metric.get_samples():
+                list_lines.append('%s%s %s' % (name, labels, format_value(value)))
+
+        return '\n'.join(list_lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+# endregion metrics
+
+
+# region server metrics
+request_duration = metrics_registry.histogram(
+    'robotic_arm_http_request_duration_seconds',
+    'The time spent answering a REST request (from the start of the handling to the end of the response)',
+    ('path', 'method', 'status'))
+request_stage_duration = metrics_registry.histogram(
+    'robotic_arm_http_request_stage_duration_seconds',
+    'The time spent in a stage of a REST request (\"body\": reading and decoding the JSON body, \"handler\": the '
+    'page handler)',
+    ('path', 'stage'))
+command_duration = metrics_registry.histogram(
+    'robotic_arm_command_duration_seconds',
+    'The time spent interpreting a motor command of \"/api/tools\"',
+    ('command',))
+command_counter = metrics_registry.counter(
+    'robotic_arm_commands',
+    'The number of motor commands of \"/api/tools\" (per command type and result)',
+    ('command', 'result'))
+motor_lookup_duration = metrics_registry.histogram(
+    'robotic_arm_motor_lookup_duration_seconds',
+    'The time spent looking the motors of a command up by name')
+duty_cycle_write_duration = metrics_registry.histogram(
+    'robotic_arm_duty_cycle_write_duration_seconds',
+    'The time spent in the PWM \"ChangeDutyCycle\" calls (per GPIO pin)',
+    ('pin',))
+log_duration = metrics_registry.histogram(
+    'robotic_arm_log_duration_seconds',
+    'The time spent in the console log calls (per priority)',
+    ('priority',))
+# endregion server metrics
+
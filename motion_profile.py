@@ -0,0 +1,209 @@
+"""
+This file has the motion profile functionality (precomputed duty cycle samples for smooth servo motor movements)
+"""
+
+# region imports
+import collections
+import threading
+
+import numpy as np
+
+from globals import console
+# endregion imports
+
+
+# region MotionProfileHandler
+class MotionProfileHandler(object):
+    """
+    This class generates the duty cycle samples of a movement, one sample per PWM update, in a single vectorized pass
+    """
+
+    def __init__(self, max_cached_profiles=256, decimals=4):
+        """
+        This constructor initializes the motion profile handler
+
+        :param max_cached_profiles: (Integer) The number of profiles kept in the cache
+        :param decimals: (Integer) The number of decimals the parameters are rounded to when used as a cache key
+        """
+        try:
+            self.PROFILE_TRAPEZOIDAL = 'trapezoidal'
+            self.PROFILE_MINIMUM_JERK = 'minimum_jerk'
+
+            self.max_cached_profiles = max_cached_profiles
+            self.decimals = decimals
+
+            self.dict_profiles = collections.OrderedDict()
+            self.lock = threading.Lock()
+
+            self.cache_hits = 0
+            self.cache_misses = 0
+
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, 'MotionProfileHandler')
+
+    def get_profile(self, start_duty_cycle, target_duty_cycle, max_velocity, max_acceleration,
+                    profile_type='trapezoidal', rate=50):
+        """
+        This method returns the duty cycle samples needed to move from the start to the target duty cycle. Identical
+        movements share the same (read-only) buffer.
+
+        :param start_duty_cycle: (Float) The current duty cycle
+        :param target_duty_cycle: (Float) The duty cycle that should be reached
+        :param max_velocity: (Float) The maximum velocity (duty cycle units per second)
+        :param max_acceleration: (Float) The maximum acceleration (duty cycle units per second squared)
+        :param profile_type: (String) The profile type (\"trapezoidal\" or \"minimum_jerk\")
+        :param rate: (Float) The PWM update rate in Hz
+        :return: (numpy.ndarray) The duty cycle samples (the last one is the target duty cycle) or False
+        """
+        try:
+            if max_velocity <= 0 or max_acceleration <= 0 or rate <= 0:
+                console.log('The maximum velocity, maximum acceleration and rate should be positive.',
+                            console.LOG_WARNING,
+                            self.get_profile.__name__)
+                return False
+
+            key = (round(start_duty_cycle, self.decimals),
+                   round(target_duty_cycle, self.decimals),
+                   round(max_velocity, self.decimals),
+                   round(max_acceleration, self.decimals),
+                   profile_type,
+                   rate)
+
+            with self.lock:
+                if key in self.dict_profiles:
+                    self.dict_profiles.move_to_end(key)
+                    self.cache_hits += 1
+                    return self.dict_profiles[key]
+
+            if profile_type == self.PROFILE_TRAPEZOIDAL:
+                distances = self.get_trapezoidal_distances(abs(key[1] - key[0]), key[2], key[3], rate)
+            elif profile_type == self.PROFILE_MINIMUM_JERK:
+                distances = self.get_minimum_jerk_distances(abs(key[1] - key[0]), key[2], key[3], rate)
+            else:
+                console.log('Unknown profile type %s' % str(profile_type), console.LOG_WARNING,
+                            self.get_profile.__name__)
+                return False
+
+            profile = key[0] + np.sign(key[1] - key[0]) * distances
+            profile[-1] = key[1]
+            profile.flags.writeable = False
+
+            with self.lock:
+                self.cache_misses += 1
+                self.dict_profiles[key] = profile
+                while len(self.dict_profiles) > self.max_cached_profiles:
+                    self.dict_profiles.popitem(last=False)
+
+            return profile
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.get_profile.__name__)
+            return False
+
+    def get_duration(self, distance, max_velocity, max_acceleration, profile_type='trapezoidal'):
+        """
+        This method returns the duration of a movement, without computing its samples (e.g. in order to bound it first)
+
+        :param distance: (Float) The absolute distance (in duty cycle units)
+        :param max_velocity: (Float) The maximum velocity
+        :param max_acceleration: (Float) The maximum acceleration
+        :param profile_type: (String) The profile type (\"trapezoidal\" or \"minimum_jerk\")
+        :return: (Float) The duration in seconds or False
+        """
+        try:
+            if not max_velocity > 0 or not max_acceleration > 0:
+                console.log('The maximum velocity and maximum acceleration should be positive.', console.LOG_WARNING,
+                            self.get_duration.__name__)
+                return False
+
+            if profile_type == self.PROFILE_TRAPEZOIDAL:
+                # the maximum velocity is only reached if the movement is long enough (otherwise it is triangular)
+                acceleration_time = min(max_velocity / max_acceleration, np.sqrt(distance / max_acceleration))
+                peak_velocity = max_acceleration * acceleration_time
+                cruise_time = (distance - peak_velocity * acceleration_time) / peak_velocity if peak_velocity > 0 else 0
+                return 2 * acceleration_time + cruise_time
+
+            if profile_type == self.PROFILE_MINIMUM_JERK:
+                return max(1.875 * distance / max_velocity,
+                           np.sqrt((10 / np.sqrt(3)) * distance / max_acceleration))
+
+            console.log('Unknown profile type %s' % str(profile_type), console.LOG_WARNING, self.get_duration.__name__)
+            return False
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.get_duration.__name__)
+            return False
+
+    @staticmethod
+    def get_sample_times(duration, rate):
+        """
+        This method returns the time of every PWM update of a movement (the last one is exactly at the end)
+
+        :param duration: (Float) The movement duration in seconds
+        :param rate: (Float) The PWM update rate in Hz
+        :return: (numpy.ndarray) The sample times
+        """
+        number_of_samples = int(np.ceil(duration * rate)) + 1
+        return np.minimum(np.arange(number_of_samples) / rate, duration)
+
+    def get_trapezoidal_distances(self, distance, max_velocity, max_acceleration, rate):
+        """
+        This method computes the travelled distance of a trapezoidal velocity profile (constant acceleration, constant
+        velocity, constant deceleration). Short movements never reach the maximum velocity and become triangular.
+
+        :param distance: (Float) The absolute distance (in duty cycle units)
+        :param max_velocity: (Float) The maximum velocity
+        :param max_acceleration: (Float) The maximum acceleration
+        :param rate: (Float) The PWM update rate in Hz
+        :return: (numpy.ndarray) The travelled distance for every sample
+        """
+        acceleration_time = max_velocity / max_acceleration
+        if max_acceleration * acceleration_time ** 2 > distance:
+            acceleration_time = np.sqrt(distance / max_acceleration)
+        peak_velocity = max_acceleration * acceleration_time
+
+        acceleration_distance = 0.5 * max_acceleration * acceleration_time ** 2
+        cruise_time = (distance - 2 * acceleration_distance) / peak_velocity if peak_velocity > 0 else 0
+        duration = 2 * acceleration_time + cruise_time
+
+        t = self.get_sample_times(duration, rate)
+        return np.select(
+            [t < acceleration_time, t < acceleration_time + cruise_time],
+            [0.5 * max_acceleration * t ** 2, acceleration_distance + peak_velocity * (t - acceleration_time)],
+            distance - 0.5 * max_acceleration * (duration - t) ** 2
+        )
+
+    def get_minimum_jerk_distances(self, distance, max_velocity, max_acceleration, rate):
+        """
+        This method computes the travelled distance of a minimum-jerk profile (10*s^3 - 15*s^4 + 6*s^5). The duration
+        is the shortest one for which the peak velocity (1.875 * d / T) and the peak acceleration
+        (5.7735 * d / T^2) respect the given limits.
+
+        :param distance: (Float) The absolute distance (in duty cycle units)
+        :param max_velocity: (Float) The maximum velocity
+        :param max_acceleration: (Float) The maximum acceleration
+        :param rate: (Float) The PWM update rate in Hz
+        :return: (numpy.ndarray) The travelled distance for every sample
+        """
+        duration = self.get_duration(distance, max_velocity, max_acceleration, self.PROFILE_MINIMUM_JERK)
+
+        t = self.get_sample_times(duration, rate)
+        s = t / duration if duration > 0 else np.ones_like(t)
+        return distance * s ** 3 * (10 - 15 * s + 6 * s ** 2)
+
+    def clear_cache(self):
+        """
+        This method removes every cached profile
+
+        :return: Boolean (True or False)
+        """
+        try:
+            with self.lock:
+                self.dict_profiles.clear()
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.clear_cache.__name__)
+            return False
+
+
+motion_profile_handler = MotionProfileHandler()
+# endregion MotionProfileHandler
@@ -0,0 +1,347 @@
+"""
+This file has the binary motor command protocol (fixed-layout datagrams that carry the duty cycles of many motors, sent
+over a local UDP or Unix socket by the automated controllers)
+
+Every datagram has a header followed by one entry per motor (little endian):
+    header: magic (2 bytes, b'RA'), version (uint8), number of entries (uint8), sequence number (uint32),
+            timestamp (uint64, microseconds since the epoch)
+    entry:  motor index (uint8, the position of the motor in \"dict_servo_motors\"), reserved (uint8),
+            duty cycle (uint16, 0 - 65535 mapped on 0 - 100%)
+"""
+
+# region imports
+import collections
+import os
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from servo import dict_servo_motors
+from actuator import actuator_handler
+from globals import console
+# endregion imports
+
+
+# region protocol
+PROTOCOL_MAGIC = b'RA'
+PROTOCOL_VERSION = 1
+
+HEADER_STRUCT = struct.Struct('<2sBBIQ')
+ENTRY_DTYPE = np.dtype([('motor_index', '<u1'), ('reserved', '<u1'), ('duty_cycle', '<u2')])
+
+DUTY_CYCLE_SCALE = 65535 / 100
+MAX_DATAGRAM_SIZE = HEADER_STRUCT.size + 255 * ENTRY_DTYPE.itemsize
+
+MOTOR_NAMES = list(dict_servo_motors.keys())
+
+
+def encode_frame(sequence_number, duty_cycles, timestamp=None):
+    """
+    This function encodes the duty cycles of some motors into a datagram
+
+    :param sequence_number: (Integer) The sequence number of the datagram (it wraps around at 2 ** 32)
+    :param duty_cycles: (Dictionary) The motor names (or indices) and their duty cycles
+    :param timestamp: (Integer) The send time, in microseconds since the epoch (Default: now)
+    :return: (Bytes) The datagram
+    """
+    entries = np.zeros(len(duty_cycles), dtype=ENTRY_DTYPE)
+    entries['motor_index'] = [MOTOR_NAMES.index(motor) if isinstance(motor, str) else motor
+                              for motor in duty_cycles.keys()]
+    entries['duty_cycle'] = np.round(np.clip(np.array(list(duty_cycles.values()), dtype=np.float64), 0, 100) *
+                                     DUTY_CYCLE_SCALE)
+
+    if timestamp is None:
+        timestamp = time.time_ns() // 1000
+
+    return HEADER_STRUCT.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, len(entries), sequence_number & 0xFFFFFFFF,
+                              timestamp) + entries.tobytes()
+
+
+def decode_frame(data):
+    """
+    This function decodes a datagram (the entries are read in bulk, without copying them)
+
+    :param data: (Bytes / memoryview) The datagram
+    :return: (Tuple) The sequence number, the timestamp, the motor indices and the duty cycles, or None if the datagram
+             is not valid
+    """
+    if len(data) < HEADER_STRUCT.size:
+        return None
+
+    (magic, version, number_of_entries, sequence_number, timestamp) = HEADER_STRUCT.unpack_from(data)
+    if magic != PROTOCOL_MAGIC or version != PROTOCOL_VERSION or \
+            len(data) != HEADER_STRUCT.size + number_of_entries * ENTRY_DTYPE.itemsize:
+        return None
+
+    entries = np.frombuffer(data, dtype=ENTRY_DTYPE, count=number_of_entries, offset=HEADER_STRUCT.size)
+    return sequence_number, timestamp, entries['motor_index'], entries['duty_cycle'] / DUTY_CYCLE_SCALE
+
+
+def is_newer_sequence_number(sequence_number, last_sequence_number):
+    """
+    This function compares two sequence numbers (serial number arithmetic, so the wrap around at 2 ** 32 is handled)
+
+    :param sequence_number: (Integer) The received sequence number
+    :param last_sequence_number: (Integer) The last applied sequence number
+    :return: Boolean (True or False)
+    """
+    return 0 < (sequence_number - last_sequence_number) & 0xFFFFFFFF < 0x80000000
+
+
+def parse_address(address):
+    """
+    This function parses a socket address: \"host:port\" for UDP, anything else is a Unix socket path
+
+    :param address: (String / Tuple) The address
+    :return: (Tuple) The socket family and the address
+    """
+    if isinstance(address, tuple):
+        return socket.AF_INET, address
+
+    (host, separator, port) = address.rpartition(':')
+    if separator and port.isdigit():
+        return socket.AF_INET, (host, int(port))
+
+    return socket.AF_UNIX, address
+
+
+# endregion protocol
+
+
+# region MotorCommandServer
+class MotorCommandServer(object):
+    """
+    This class applies the duty cycles of the received datagrams. Every sender has its own sequence numbers, the
+    datagrams that are older than the last one applied (reordered) or than \"max_age\" seconds (stale) are dropped.
+    Only the last sequence numbers of the \"max_senders\" most recent senders are kept.
+    """
+
+    def __init__(self, max_age=0.25, max_senders=256):
+        """
+        This constructor initializes the motor command server
+
+        :param max_age: (Float) The maximum age of a datagram, in seconds (None disables the check, e.g. for senders
+                        whose clock is not synchronized with the server)
+        :param max_senders: (Integer) The maximum number of senders whose last sequence number is kept
+        """
+        try:
+            self.max_age = max_age
+            self.max_senders = max_senders
+
+            self.socket = None
+            self.socket_path = None
+            self.server_thread = None
+            self.stop_event = threading.Event()
+
+            self.list_servo_motors = list(dict_servo_motors.values())
+            self.dict_last_sequence_numbers = collections.OrderedDict()
+
+            self.number_of_datagrams = 0
+            self.number_of_updates = 0
+            self.number_of_reordered_datagrams = 0
+            self.number_of_stale_datagrams = 0
+            self.number_of_invalid_datagrams = 0
+            self.number_of_failed_updates = 0
+            self.number_of_timed_out_datagrams = 0
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, 'MotorCommandServer')
+
+    def start(self, address='127.0.0.1:9092'):
+        """
+        This method binds the socket and starts receiving the datagrams in a background thread
+
+        :param address: (String / Tuple) \"host:port\" for UDP, otherwise the path of a Unix datagram socket
+        :return: Boolean (True or False)
+        """
+        try:
+            if self.server_thread is not None:
+                console.log('The motor command server has already been started.', console.LOG_WARNING,
+                            self.start.__name__)
+                return False
+
+            (family, socket_address) = parse_address(address)
+            self.socket = socket.socket(family, socket.SOCK_DGRAM)
+            if family == socket.AF_UNIX:
+                if os.path.exists(socket_address):
+                    os.remove(socket_address)
+                self.socket_path = socket_address
+            self.socket.bind(socket_address)
+            self.socket.settimeout(0.5)
+
+            self.stop_event.clear()
+            self.server_thread = threading.Thread(target=self.serve, daemon=True)
+            self.server_thread.start()
+
+            console.log('The motor command server is listening on %s' % str(address), console.LOG_INFO,
+                        self.start.__name__)
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.start.__name__)
+            return False
+
+    def stop(self):
+        """
+        This method stops the motor command server
+
+        :return: Boolean (True or False)
+        """
+        try:
+            self.stop_event.set()
+            if self.server_thread is not None:
+                self.server_thread.join()
+                self.server_thread = None
+
+            if self.socket is not None:
+                self.socket.close()
+                self.socket = None
+
+            if self.socket_path is not None and os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+                self.socket_path = None
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.stop.__name__)
+            return False
+
+    def serve(self):
+        """
+        This method receives the datagrams into a preallocated buffer (it runs in the server thread)
+
+        :return: Boolean (True or False)
+        """
+        buffer = bytearray(MAX_DATAGRAM_SIZE)
+        view = memoryview(buffer)
+        while not self.stop_event.is_set():
+            try:
+                (size, sender) = self.socket.recvfrom_into(buffer)
+            except socket.timeout:
+                continue
+            except OSError as error_message:
+                if not self.stop_event.is_set():
+                    console.log(error_message, console.LOG_ERROR, self.serve.__name__)
+                return False
+
+            self.apply_datagram(view[:size], sender)
+
+        return True
+
+    def apply_datagram(self, data, sender=None):
+        """
+        This method decodes a datagram and applies its duty cycles, unless it is reordered or stale
+
+        :param data: (Bytes / memoryview) The datagram
+        :param sender: (Tuple / String) The sender address (each sender has its own sequence numbers)
+        :return: Boolean (True or False)
+        """
+        self.number_of_datagrams += 1
+        frame = decode_frame(data)
+        if frame is None:
+            self.number_of_invalid_datagrams += 1
+            return False
+
+        (sequence_number, timestamp, motor_indices, duty_cycles) = frame
+
+        last_sequence_number = self.dict_last_sequence_numbers.get(sender)
+        if last_sequence_number is not None and not is_newer_sequence_number(sequence_number, last_sequence_number):
+            self.number_of_reordered_datagrams += 1
+            return False
+
+        if self.max_age is not None and time.time_ns() // 1000 - timestamp > self.max_age * 1e6:
+            self.number_of_stale_datagrams += 1
+            return False
+
+        # the least recently seen senders are forgotten first (their late datagrams are still dropped as stale)
+        self.dict_last_sequence_numbers[sender] = sequence_number
+        self.dict_last_sequence_numbers.move_to_end(sender)
+        while len(self.dict_last_sequence_numbers) > self.max_senders:
+            self.dict_last_sequence_numbers.popitem(last=False)
+
+        if actuator_handler.execute('motor_command', self.apply_duty_cycles, motor_indices.tolist(),
+                                    duty_cycles.tolist()) is False:
+            if actuator_handler.has_timed_out():
+                self.number_of_timed_out_datagrams += 1
+            return False
+
+        return True
+
+    def apply_duty_cycles(self, motor_indices, duty_cycles):
+        """
+        This method applies the duty cycles of a datagram (it runs in the actuator thread)
+
+        :param motor_indices: (List) The motor indices (see \"MOTOR_NAMES\")
+        :param duty_cycles: (List) The duty cycles
+        :return: Boolean (True or False)
+        """
+        for (motor_index, duty_cycle) in zip(motor_indices, duty_cycles):
+            if motor_index >= len(self.list_servo_motors) or \
+                    self.list_servo_motors[motor_index].set_gpio_pin_duty_cycle(duty_cycle) is False:
+                self.number_of_failed_updates += 1
+            else:
+                self.number_of_updates += 1
+
+        return True
+
+    def get_stats(self):
+        """
+        This method returns the motor command server statistics
+
+        :return: (Dictionary) The number of datagrams (received, reordered, stale, invalid, timed out) and of motor
+                 updates
+        """
+        return {
+            'number_of_senders': len(self.dict_last_sequence_numbers),
+            'number_of_datagrams': self.number_of_datagrams,
+            'number_of_updates': self.number_of_updates,
+            'number_of_reordered_datagrams': self.number_of_reordered_datagrams,
+            'number_of_stale_datagrams': self.number_of_stale_datagrams,
+            'number_of_invalid_datagrams': self.number_of_invalid_datagrams,
+            'number_of_failed_updates': self.number_of_failed_updates,
+            'number_of_timed_out_datagrams': self.number_of_timed_out_datagrams
+        }
+
+
+motor_command_server = MotorCommandServer()
+# endregion MotorCommandServer
+
+
+# region MotorCommandClient
+class MotorCommandClient(object):
+    """
+    This class sends the duty cycles to the motor command server (used by the automated controllers)
+    """
+
+    def __init__(self, address='127.0.0.1:9092'):
+        """
+        This constructor initializes the motor command client
+
+        :param address: (String / Tuple) The server address (see \"MotorCommandServer.start\")
+        """
+        (family, self.address) = parse_address(address)
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        self.sequence_number = 0
+
+        if family == socket.AF_UNIX:
+            # a Unix datagram socket needs an address of its own to be told apart from the other senders
+            self.socket.bind('\0robotic_arm_%d_%d' % (os.getpid(), id(self)))
+
+    def send(self, duty_cycles):
+        """
+        This method sends the duty cycles of some motors in one datagram
+
+        :param duty_cycles: (Dictionary) The motor names (or indices) and their duty cycles
+        :return: (Integer) The sequence number of the datagram
+        """
+        self.sequence_number = (self.sequence_number + 1) & 0xFFFFFFFF
+        self.socket.sendto(encode_frame(self.sequence_number, duty_cycles), self.address)
+        return self.sequence_number
+
+    def close(self):
+        self.socket.close()
+        return True
+
+
+# endregion MotorCommandClient
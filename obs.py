@@ -3,7 +3,12 @@ Description: This file has the OBS functionality (works alongside REST API)
 """
 
 # region imports
+import time
+
 from servo import dict_servo_motors, gpio_handler
+from actuator import actuator_handler
+from trajectory import trajectory_handler
+from metrics import command_duration, command_counter, motor_lookup_duration
 from globals import console
 # endregion imports
 
@@ -15,11 +20,90 @@ class Methods(object):
     """
     def interpret_json(self, input_json):
         """
-        This method interprets the json received from REST API
+        This method interprets the json received from REST API (the commands are applied by the actuator thread, this
+        method waits for their result)
+
+        :param input_json: (Dictionary) The JSON received that contains all the necessary data
+        :return: Boolean (True or False)
+        """
+        try:
+            command = self.queue_json(input_json)
+            if command is False:
+                return False
+
+            return actuator_handler.wait(command)
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR)
+            return False
+
+    def submit_json(self, input_json):
+        """
+        This method queues the commands of the json received from REST API, without waiting for them to be applied
+
+        :param input_json: (Dictionary) The JSON received that contains all the necessary data
+        :return: (String) The command id (see \"get_command_status\") or False
+        """
+        try:
+            command = self.queue_json(input_json)
+            if command is False:
+                return False
+
+            return command.command_id
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR)
+            return False
+
+    def queue_json(self, input_json):
+        """
+        This method validates the json received from REST API and queues its commands for the actuator thread. A
+        \"gpio_cleanup\" takes the priority lane: the trajectories are stopped, the queued commands (e.g. the pending
+        duty cycle writes) are cancelled and the stop is applied right after the command being applied. The other
+        commands of the JSON (e.g. its own duty cycles) are not part of the stop, they are queued after it.
 
         :param input_json: (Dictionary) The JSON received that contains all the necessary data
+        :return: (ActuatorCommand) The queued command (the last one) or False
+        """
+        try:
+            list_commands = self.get_commands(input_json)
+            if list_commands is False:
+                return False
+
+            list_stop_commands = [(command, method) for (command, method) in list_commands if command == 'gpio_cleanup']
+            if list_stop_commands:
+                trajectory_handler.stop_trajectories()
+                stop_command = actuator_handler.preempt('gpio_cleanup', self.run_commands, list_stop_commands,
+                                                        input_json['motors'])
+
+                list_commands = [(command, method) for (command, method) in list_commands if command != 'gpio_cleanup']
+                if not list_commands:
+                    return stop_command
+
+                return actuator_handler.submit('interpret_json', self.run_commands_after, stop_command, list_commands,
+                                               input_json['motors'])
+
+            return actuator_handler.submit('interpret_json', self.run_commands, list_commands, input_json['motors'])
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR)
+            return False
+
+    def emergency_stop(self):
+        """
+        This method stops every motor through the priority lane (see \"queue_json\") and waits until it is done
+
         :return: Boolean (True or False)
         """
+        return self.interpret_json({
+            'motors': [{'name': name} for name in dict_servo_motors],
+            'gpio_cleanup': True
+        })
+
+    def get_commands(self, input_json):
+        """
+        This method validates the json received from REST API and returns its commands, in the order they are run
+
+        :param input_json: (Dictionary) The JSON received that contains all the necessary data
+        :return: (List) The (command name, method) tuples or False
+        """
         try:
             mandatory_keys = {'motors'}
             if not mandatory_keys.issubset(input_json.keys()):
@@ -27,24 +111,67 @@ class Methods(object):
                             % str(mandatory_keys), console.LOG_WARNING)
                 return False
 
-            motors_list = input_json['motors']
+            list_commands = []
             if self.validate_key('gpio_init', input_json) is True:
-                if self.initialize_motors(motors_list) is False:
-                    return False
+                list_commands.append(('gpio_init', self.initialize_motors))
 
             if self.validate_key('gpio_cleanup', input_json):
-                if self.stop_motors(motors_list) is False:
-                    return False
+                list_commands.append(('gpio_cleanup', self.stop_motors))
 
             if self.validate_key('duty_cycle', input_json):
-                if self.change_duty_cycle(motors_list) is False:
-                    return False
+                list_commands.append(('duty_cycle', self.change_duty_cycle))
 
-            return True
+            return list_commands
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR)
             return False
 
+    def run_commands(self, list_commands, motors_list):
+        """
+        This method runs the commands of a JSON, stopping at the first one that fails (it runs in the actuator thread)
+
+        :param list_commands: (List) The (command name, method) tuples
+        :param motors_list: (List) The motors list of the JSON
+        :return: Boolean (True or False)
+        """
+        for (command, method) in list_commands:
+            if self.run_command(command, method, motors_list) is False:
+                return False
+
+        return True
+
+    def run_commands_after(self, stop_command, list_commands, motors_list):
+        """
+        This method runs the commands of a JSON that are queued after its stop, unless the stop failed (it runs in the
+        actuator thread, the stop has been applied before since it took the priority lane)
+
+        :param stop_command: (ActuatorCommand) The stop of the JSON
+        :param list_commands: (List) The other (command name, method) tuples
+        :param motors_list: (List) The motors list of the JSON
+        :return: Boolean (True or False)
+        """
+        if stop_command.status != 'applied':
+            return False
+
+        return self.run_commands(list_commands, motors_list)
+
+    @staticmethod
+    def run_command(command, method, motors_list):
+        """
+        This method runs a command of the JSON and records its duration and result in the metrics
+
+        :param command: (String) The command name (\"gpio_init\", \"gpio_cleanup\" or \"duty_cycle\")
+        :param method: (Function) The method that runs the command
+        :param motors_list: (List) The motors list of the JSON
+        :return: Boolean (True or False)
+        """
+        start_time = time.perf_counter()
+        is_successful = method(motors_list) is not False
+        command_duration.observe(time.perf_counter() - start_time, (command,))
+        command_counter.inc((command, 'success' if is_successful else 'failure'))
+
+        return is_successful
+
     def validate_key(self, key, input_json):
         """
         This method is used in order to validate whether or not a key exists and is True
@@ -97,6 +224,7 @@ class Methods(object):
                 dict_servo_motors[motor['name']].stop_pwm_handler()
 
             gpio_handler.cleanup()
+            return True
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR)
             return False
@@ -109,10 +237,46 @@ class Methods(object):
         :return: Boolean (True or False)
         """
         try:
-            for motor in motors_list:
-                dict_servo_motors[motor['name']].set_gpio_pin_duty_cycle(motor['duty_cycle'])
+            start_time = time.perf_counter()
+            list_servo_motors = [dict_servo_motors[motor['name']] for motor in motors_list]
+            motor_lookup_duration.observe(time.perf_counter() - start_time)
 
-            return True
+            is_successful = True
+            for (servo_motor, motor) in zip(list_servo_motors, motors_list):
+                # the write fails for a motor that is not initialized (e.g. after an emergency stop)
+                if servo_motor.set_gpio_pin_duty_cycle(motor['duty_cycle']) is False:
+                    is_successful = False
+
+            return is_successful
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR)
+            return False
+
+    @staticmethod
+    def get_command_status(command_id=None):
+        """
+        This method returns the status of a queued command (or the actuator statistics, if no command id is given)
+
+        :param command_id: (String) The command id
+        :return: (Dictionary) The command status or False
+        """
+        try:
+            if command_id is None:
+                return actuator_handler.get_stats()
+
+            return actuator_handler.get_command(command_id)
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR)
+            return False
+
+    def get_motors_status(self):
+        """
+        This method returns the state of all the motors (including the duty cycle writer counters)
+
+        :return: (Dictionary) The motor names and their state
+        """
+        try:
+            return {name: servo_motor.get_status() for (name, servo_motor) in dict_servo_motors.items()}
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR)
             return False
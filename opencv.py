@@ -5,6 +5,8 @@ This file deals with all the image processing part of the project
 # region imports
 import datetime
 import cv2
+import numpy as np
+
 from globals import console
 
 
@@ -28,13 +30,26 @@ class OpenCVHandler(object):
 
             self.image = None
 
-            self.inner_corners = []
-            self.outer_corners = []
-            self.all_corners = []
+            self.inner_corners = np.empty((0, 2))
+            self.outer_corners = np.empty((0, 2))
+            self.all_corners = np.empty((0, 2))
+            self.lattice = np.empty((0, 0, 2))
 
-            self.chessboard_positions = []
+            self.chessboard_positions = np.empty((0, 8, 4, 2))
 
             self.sort_tolerance = 1
+
+            # coarse-to-fine corner detection (a detection scale of 1 searches the full resolution image)
+            self.detection_scale = 1.0
+            self.roi_size = 11
+
+            # top-down rectification of the board (the homography is only recomputed when the board moves)
+            self.rectified_size = 800
+            self.homography_tolerance = 1.0
+            self.board_homography = None
+            self.board_homography_corners = None
+            self.number_of_homography_updates = 0
+            self.rectified_image = None
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, 'OpenCVHandler')
 
@@ -58,6 +73,28 @@ class OpenCVHandler(object):
             console.log(error_message, console.LOG_ERROR, self.set_debug_mode.__name__)
             return False
 
+    def set_image(self, image, title='Camera chessboard'):
+        """
+        This method loads an image that is already in memory (e.g. a raw camera capture) instead of reading it from
+        the disk. The image is converted and resized into a new array, so the capture buffer can be reused right away.
+
+        :param image: (numpy.ndarray) The grayscale or BGR image
+        :param title: (String) The window title used by \"show_image\"
+        :return: Boolean (True or False)
+        """
+        try:
+            if image.ndim == 3 and not self.is_RGB:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+            self.image_path = None
+            self.title = title
+            self.image = cv2.resize(image, (self.width, self.height), interpolation=cv2.INTER_AREA)
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.set_image.__name__)
+            return False
+
     def show_image(self):
         """
         This method is used to show an the image image uploaded into the "self.image" handler using openCV
@@ -65,9 +102,9 @@ class OpenCVHandler(object):
         :return: Boolean (True or False)
         """
         try:
-            for corner in self.all_corners:
+            for (x, y) in self.all_corners.tolist():
                 cv2.circle(self.image,
-                           (int(corner['x']), int(corner['y'])),
+                           (int(x), int(y)),
                            3,
                            (255, 0, 0),
                            -1)
@@ -92,22 +129,79 @@ class OpenCVHandler(object):
         :return: Boolean (True or False)
         """
         try:
-            self.inner_corners = []
-            (ret, corners) = cv2.findChessboardCorners(self.image, (7, 7))
-
-            for corner in corners:
-                (x, y) = corner.ravel()
-                self.inner_corners.append({
-                    'x': x,
-                    'y': y
-                })
+            corners = self.detect_chessboard_inner_corners(self.image)
+            if corners is False:
+                return False
 
-            self.sort_chessboard_corners(self.inner_corners, 'inner_corners')
+            self.inner_corners = corners
             return True
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, self.find_chessboard_inner_corners.__name__)
             return False
 
+    def detect_chessboard_inner_corners(self, image, pattern_size=(7, 7), scale=None, roi_size=None):
+        """
+        This method finds and sorts the inner chessboard corners of an image, without changing the handler state (so
+        it can be used by the streaming pipeline on any frame)
+
+        :param image: (numpy.ndarray) The (grayscale or BGR) image
+        :param pattern_size: (Tuple) The number of (columns, rows) of inner corners
+        :param scale: (Float) The detection scale (Default: \"self.detection_scale\")
+        :param roi_size: (Integer) The side of the refinement window (Default: \"self.roi_size\")
+        :return: (numpy.ndarray) The (N, 2) sorted corners or False
+        """
+        try:
+            scale = self.detection_scale if scale is None else scale
+            if scale < 1:
+                corners = self.detect_chessboard_corners_coarse_to_fine(image, pattern_size, scale,
+                                                                        self.roi_size if roi_size is None else roi_size)
+                if corners is not False:
+                    corners = self.assign_corners_to_grid(corners, pattern_size)
+                if corners is not False:
+                    return corners
+
+                # the full resolution search is the fallback
+
+            (ret, corners) = cv2.findChessboardCorners(image, pattern_size)
+            if not ret:
+                console.log('The chessboard inner corners could not be found', console.LOG_WARNING,
+                            self.detect_chessboard_inner_corners.__name__)
+                return False
+
+            return self.assign_corners_to_grid(corners.reshape(-1, 2), pattern_size)
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.detect_chessboard_inner_corners.__name__)
+            return False
+
+    @staticmethod
+    def detect_chessboard_corners_coarse_to_fine(image, pattern_size, scale, roi_size):
+        """
+        This method searches the chessboard on a downscaled copy of the image, maps the corners back to the full
+        resolution and refines every corner inside a (roi_size x roi_size) window of the full resolution image
+
+        :param image: (numpy.ndarray) The (grayscale or BGR) image
+        :param pattern_size: (Tuple) The number of (columns, rows) of inner corners
+        :param scale: (Float) The detection scale (e.g. 0.25)
+        :param roi_size: (Integer) The side of the refinement window, in full resolution pixels (at least 2 / scale)
+        :return: (numpy.ndarray) The (N, 2) unsorted corners or False
+        """
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        small_image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        (ret, corners) = cv2.findChessboardCorners(small_image, pattern_size)
+        if not ret:
+            return False
+
+        # the pixel centers of the two images are shifted by half a pixel
+        corners = ((corners.reshape(-1, 2) + 0.5) / scale - 0.5).astype(np.float32)
+        # the window has to cover at least one pixel of the downscaled image
+        half_size = max(int(roi_size) // 2, int(np.ceil(1 / scale)), 2)
+        corners = cv2.cornerSubPix(image, corners.reshape(-1, 1, 2), (half_size, half_size), (-1, -1),
+                                   (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01))
+
+        return corners.reshape(-1, 2).astype(np.float64)
+
     def find_chessboard_outer_corners(self):
         """
         This method finds the position of the outer corners chessboard corners
@@ -115,102 +209,25 @@ class OpenCVHandler(object):
         :return: Boolean (True or False)
         """
         try:
-            self.outer_corners = []
-
-            x_mean = []
-            y_mean = []
-
-            first_index = 0
-            last_index = 6
-
-            for i in range(7):
-                x = []
-                y = []
-
-                x_dif = []
-                y_dif = []
-
-                for j in range(7):
-                    x.append(self.inner_corners[i * 7 + j]['x'])
-                    y.append(self.inner_corners[i + j * 7]['y'])
-
-                for j in range(6):
-                    x_dif.append(abs(x[j + 1] - x[j]))
-                    y_dif.append(abs(y[j + 1] - y[j]))
-
-                x_mean.append(sum(x_dif) / len(x_dif))
-                y_mean.append(sum(y_dif) / len(y_dif))
-
-            # append the 4 extreme corners of the board
-            self.outer_corners.append({
-                'x': self.inner_corners[first_index]['x'] - x_mean[first_index],
-                'y': self.inner_corners[first_index]['y'] - y_mean[first_index]
-            })
-            self.outer_corners.append({
-                'x': self.inner_corners[first_index + last_index]['x'] + x_mean[first_index],
-                'y': self.inner_corners[first_index + last_index]['y'] - y_mean[last_index]
-            })
-            self.outer_corners.append({
-                'x': self.inner_corners[last_index * 7]['x'] - x_mean[last_index],
-                'y': self.inner_corners[last_index * 7]['y'] + y_mean[first_index]
-            })
-            self.outer_corners.append({
-                'x': self.inner_corners[last_index * 8]['x'] + x_mean[last_index],
-                'y': self.inner_corners[last_index * 8]['y'] + y_mean[last_index]
-            })
-
-            # append the first row
-            for i in range(7):
-                self.outer_corners.append({
-                    'x': self.inner_corners[i]['x'],
-                    'y': self.inner_corners[i]['y'] - y_mean[i]
-                })
-                self.outer_corners.append({
-                    'x': self.inner_corners[i * 7]['x'] - x_mean[i],
-                    'y': self.inner_corners[i * 7]['y']
-                })
-                self.outer_corners.append({
-                    'x': self.inner_corners[i * 7 + last_index]['x'] + x_mean[i],
-                    'y': self.inner_corners[i * 7 + last_index]['y']
-                })
-                self.outer_corners.append({
-                    'x': self.inner_corners[i + last_index * 7]['x'],
-                    'y': self.inner_corners[i + last_index * 7]['y'] + y_mean[i]
-                })
-
-            self.sort_chessboard_corners(self.outer_corners, 'outer_corners')
-            for corner in self.outer_corners:
-                corner['x'] = round(corner['x'], 4)
-                corner['y'] = round(corner['y'], 4)
+            self.lattice = self.get_chessboard_lattice(self.inner_corners)
+
+            border_mask = np.ones((9, 9), dtype=bool)
+            border_mask[1:-1, 1:-1] = False
+            self.outer_corners = self.lattice[border_mask]
 
             return True
         except Exception as error_message:
-            console.log(error_message, console.LOG_ERROR, self.find_chessboard_inner_corners.__name__)
+            console.log(error_message, console.LOG_ERROR, self.find_chessboard_outer_corners.__name__)
             return False
 
     def find_chessboard_all_corners(self):
         """
-        This method takes the inner corners and outer corners found previously and appends them into the same list
+        This method takes the inner corners and outer corners found previously and puts them into the same array
 
         :return: Boolean (True or False)
         """
         try:
-            # append first row
-            for i in range(9):
-                self.all_corners.append(self.outer_corners[i])
-
-            # append every row except the last one
-            for i in range(7):
-                self.all_corners.append(self.outer_corners[9 + 2 * i])
-
-                for j in range(7):
-                    self.all_corners.append(self.inner_corners[i * 7 + j])
-
-                self.all_corners.append(self.outer_corners[9 + 2 * i + 1])
-
-            for i in range(9):
-                self.all_corners.append(self.outer_corners[i + 23])
-
+            self.all_corners = self.lattice.reshape(-1, 2)
             return True
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, self.find_chessboard_all_corners.__name__)
@@ -220,31 +237,26 @@ class OpenCVHandler(object):
         """
         This function sorts the chessboard inner corners from the top-left corner to the bottom-right corner
 
-        :param corners: (List) The list of corners that needs to be ordered accordingly
+        :param corners: (numpy.ndarray) The (49, 2) or (81, 2) array of corners that needs to be ordered accordingly
         :param list_label: (String) The list of corners which was sorted ('inner_corners' or 'outer_corners')
         :return: Boolean (True or False)
         """
         try:
-            # sort by rows
-            k = False
-            while k is False:
-                k = True
-                for index in range(0, len(corners) - 1):
-                    if corners[index]['y'] > corners[index + 1]['y']:
-                        (corners[index], corners[index + 1]) = \
-                            (corners[index + 1], corners[index])
-                        k = False
-
-            # sort by columns
-            k = False
-            while k is False:
-                k = True
-                for index in range(0, len(corners) - 1):
-                    if abs(corners[index]['y'] - corners[index + 1]['y']) <= self.sort_tolerance and \
-                            corners[index]['x'] > corners[index + 1]['x']:
-                        (corners[index], corners[index + 1]) = \
-                            (corners[index + 1], corners[index])
-                        k = False
+            dict_pattern_sizes = {
+                49: (7, 7),
+                81: (9, 9)
+            }
+
+            if len(corners) not in dict_pattern_sizes:
+                console.log('Invalid number of corners %d. It should be one of %s.' %
+                            (len(corners), str(sorted(dict_pattern_sizes))),
+                            console.LOG_WARNING,
+                            self.sort_chessboard_corners.__name__)
+                return False
+
+            corners = self.assign_corners_to_grid(corners, dict_pattern_sizes[len(corners)])
+            if corners is False:
+                return False
 
             if list_label is None or list_label == 'inner_corners':
                 self.inner_corners = corners
@@ -262,6 +274,99 @@ class OpenCVHandler(object):
             console.log(error_message, console.LOG_ERROR, self.sort_chessboard_corners.__name__)
             return False
 
+    def assign_corners_to_grid(self, corners, pattern_size=(7, 7)):
+        """
+        This method orders the corners of a chessboard row by row (top to bottom), and every row from left to right.
+        The corners are first rotated by the board tilt (estimated from the nearest neighbour directions), then split
+        into rows at the largest vertical gaps and finally ordered with a single \"lexsort\" on (row, x).
+
+        :param corners: (numpy.ndarray) The (N, 2) array of corners, in any order
+        :param pattern_size: (Tuple) The number of (columns, rows) of the grid
+        :return: (numpy.ndarray) The (N, 2) ordered corners or False (if the corners do not form the expected grid)
+        """
+        try:
+            corners = np.asarray(corners, dtype=np.float64).reshape(-1, 2)
+            (columns, rows) = pattern_size
+
+            if len(corners) != columns * rows:
+                console.log('Invalid number of corners %d. It should be %d x %d.' % (len(corners), columns, rows),
+                            console.LOG_WARNING,
+                            self.assign_corners_to_grid.__name__)
+                return False
+
+            angle = self.get_grid_angle(corners)
+            rotation = np.array([[np.cos(angle), np.sin(angle)],
+                                 [-np.sin(angle), np.cos(angle)]])
+            aligned_corners = corners @ rotation.T
+
+            # cluster the corners into rows, using the (rows - 1) largest gaps between consecutive y values
+            y_order = np.argsort(aligned_corners[:, 1], kind='stable')
+            y_gaps = np.diff(aligned_corners[y_order, 1])
+            row_breaks = np.sort(np.argsort(y_gaps, kind='stable')[len(y_gaps) - (rows - 1):]) + 1
+
+            row_sizes = np.diff(np.concatenate(([0], row_breaks, [len(corners)])))
+            if (row_sizes != columns).any():
+                console.log('The corners could not be split into %d rows of %d corners (row sizes: %s).' %
+                            (rows, columns, str(row_sizes.tolist())),
+                            console.LOG_WARNING,
+                            self.assign_corners_to_grid.__name__)
+                return False
+
+            if rows > 1:
+                inner_gaps = np.delete(y_gaps, row_breaks - 1)
+                largest_inner_gap = inner_gaps.max() if len(inner_gaps) > 0 else 0
+                if y_gaps[row_breaks - 1].min() <= max(largest_inner_gap, self.sort_tolerance):
+                    console.log('The chessboard rows are not clearly separated.', console.LOG_WARNING,
+                                self.assign_corners_to_grid.__name__)
+                    return False
+
+            row_labels = np.empty(len(corners), dtype=int)
+            row_labels[y_order] = np.repeat(np.arange(rows), columns)
+
+            return corners[np.lexsort((aligned_corners[:, 0], row_labels))]
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.assign_corners_to_grid.__name__)
+            return False
+
+    @staticmethod
+    def get_grid_angle(corners):
+        """
+        This method estimates the tilt of a grid of corners (between -45 and 45 degrees) as the circular mean of the
+        directions between every corner and its nearest neighbour (taken modulo 90 degrees). The nearest neighbours
+        are found with a sweep over the corners sorted by x: the pairs k positions apart are compared for increasing k
+        until their x distance alone exceeds every current nearest distance (O(n log n) for a grid).
+
+        :param corners: (numpy.ndarray) The (N, 2) array of corners
+        :return: (Float) The tilt angle in radians
+        """
+        corners = corners[np.argsort(corners[:, 0], kind='stable')]
+        count = len(corners)
+
+        nearest_distances = np.full(count, np.inf)
+        nearest_indices = np.zeros(count, dtype=int)
+        indices = np.arange(count)
+        for offset in range(1, count):
+            x_distances = corners[offset:, 0] - corners[:-offset, 0]
+            if x_distances.min() > nearest_distances.max():
+                break
+
+            distances = np.linalg.norm(corners[offset:] - corners[:-offset], axis=1)
+
+            # the left corner of every pair
+            is_nearer = distances < nearest_distances[:-offset]
+            nearest_distances[:-offset][is_nearer] = distances[is_nearer]
+            nearest_indices[:-offset][is_nearer] = indices[offset:][is_nearer]
+
+            # the right corner of every pair
+            is_nearer = distances < nearest_distances[offset:]
+            nearest_distances[offset:][is_nearer] = distances[is_nearer]
+            nearest_indices[offset:][is_nearer] = indices[:-offset][is_nearer]
+
+        directions = corners[nearest_indices] - corners
+        angles = np.arctan2(directions[:, 1], directions[:, 0])
+
+        return np.angle(np.exp(4j * angles).sum()) / 4
+
     def get_chessboard_positions_location(self):
         """
         This method used the all corners parameter in order to get the location of every square from the chessboard
@@ -269,23 +374,188 @@ class OpenCVHandler(object):
         :return: Boolean (True or False)
         """
         try:
-            for i in range(8):
-                current_row = []
-                for j in range(8):
-                    current_row.append({
-                        'upper_left': self.all_corners[i * 9 + j],
-                        'upper_right': self.all_corners[i * 9 + j + 1],
-                        'lower_left': self.all_corners[(i + 1) * 9 + j],
-                        'lower_right': self.all_corners[(i + 1) * 9 + j + 1]
-                    })
-
-                self.chessboard_positions.append(current_row)
-
+            self.chessboard_positions = self.get_chessboard_positions(self.all_corners.reshape(9, 9, 2))
             return True
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, self.get_chessboard_positions_location.__name__)
             return False
 
+    @staticmethod
+    def get_chessboard_lattice(inner_corners):
+        """
+        This method extrapolates the sorted 7x7 inner corners to the full 9x9 lattice of the chessboard. Every border
+        corner is moved away from its inner neighbour by the mean spacing of the corresponding row (x) or column (y).
+
+        :param inner_corners: (numpy.ndarray) The (49, 2) sorted inner corners
+        :return: (numpy.ndarray) The (9, 9, 2) lattice, lattice[row, col] = [x, y]
+        """
+        grid = np.asarray(inner_corners, dtype=np.float64).reshape(7, 7, 2)
+        x_mean = np.abs(np.diff(grid[:, :, 0], axis=1)).mean(axis=1)
+        y_mean = np.abs(np.diff(grid[:, :, 1], axis=0)).mean(axis=0)
+
+        lattice = np.empty((9, 9, 2))
+        lattice[1:-1, 1:-1] = grid
+
+        # the first and the last row / column
+        lattice[0, 1:-1] = np.stack((grid[0, :, 0], grid[0, :, 1] - y_mean), axis=-1)
+        lattice[-1, 1:-1] = np.stack((grid[-1, :, 0], grid[-1, :, 1] + y_mean), axis=-1)
+        lattice[1:-1, 0] = np.stack((grid[:, 0, 0] - x_mean, grid[:, 0, 1]), axis=-1)
+        lattice[1:-1, -1] = np.stack((grid[:, -1, 0] + x_mean, grid[:, -1, 1]), axis=-1)
+
+        # the 4 extreme corners of the board
+        lattice[0, 0] = grid[0, 0] - (x_mean[0], y_mean[0])
+        lattice[0, -1] = grid[0, -1] + (x_mean[0], -y_mean[-1])
+        lattice[-1, 0] = grid[-1, 0] + (-x_mean[-1], y_mean[0])
+        lattice[-1, -1] = grid[-1, -1] + (x_mean[-1], y_mean[-1])
+
+        border_mask = np.ones((9, 9), dtype=bool)
+        border_mask[1:-1, 1:-1] = False
+        lattice[border_mask] = np.round(lattice[border_mask], 4)
+
+        return lattice
+
+    @staticmethod
+    def get_chessboard_positions(lattice):
+        """
+        This method gathers the 4 corners of every chessboard square from the lattice
+
+        :param lattice: (numpy.ndarray) The (9, 9, 2) lattice
+        :return: (numpy.ndarray) The (8, 8, 4, 2) square corners, in the order: upper_left, upper_right, lower_left,
+                 lower_right
+        """
+        windows = np.lib.stride_tricks.sliding_window_view(lattice, (2, 2), axis=(0, 1))
+        return windows.transpose(0, 1, 3, 4, 2).reshape(8, 8, 4, 2)
+
+    def get_board_homography(self, lattice=None):
+        """
+        This method returns the perspective transform from the image to the canonical top-down board
+        (\"rectified_size\" x \"rectified_size\" pixels, row 0 / col 0 at the top-left). The transform is cached and
+        only recomputed when one of the 4 outer board corners moves more than \"homography_tolerance\" pixels.
+
+        :param lattice: (numpy.ndarray) The (9, 9, 2) lattice (Default: \"self.lattice\")
+        :return: (numpy.ndarray) The (3, 3) homography or False
+        """
+        try:
+            lattice = self.lattice if lattice is None else lattice
+            board_corners = np.float32([lattice[0, 0], lattice[0, -1], lattice[-1, 0], lattice[-1, -1]])
+
+            if self.board_homography is not None and \
+                    np.abs(board_corners - self.board_homography_corners).max() <= self.homography_tolerance:
+                return self.board_homography
+
+            # the canonical board corners are the outer edges of the corner pixels
+            size = self.rectified_size - 1
+            canonical_corners = np.float32([[0, 0], [size, 0], [0, size], [size, size]])
+
+            self.board_homography = cv2.getPerspectiveTransform(board_corners, canonical_corners)
+            self.board_homography_corners = board_corners
+            self.number_of_homography_updates += 1
+            return self.board_homography
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.get_board_homography.__name__)
+            return False
+
+    def rectify_image(self, image=None, lattice=None):
+        """
+        This method warps an image once into the canonical top-down board, in which every square is a
+        (rectified_size / 8) x (rectified_size / 8) block
+
+        :param image: (numpy.ndarray) The image (Default: \"self.image\")
+        :param lattice: (numpy.ndarray) The (9, 9, 2) lattice of the image (Default: \"self.lattice\")
+        :return: (numpy.ndarray) The rectified image or False
+        """
+        try:
+            image = self.image if image is None else image
+            homography = self.get_board_homography(lattice)
+            if homography is False:
+                return False
+
+            self.rectified_image = cv2.warpPerspective(image, homography, (self.rectified_size, self.rectified_size),
+                                                       flags=cv2.INTER_LINEAR)
+            return self.rectified_image
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.rectify_image.__name__)
+            return False
+
+    def get_rectified_squares(self, rectified_image=None):
+        """
+        This method returns all the squares of the rectified board as one strided view (no pixel is copied)
+
+        :param rectified_image: (numpy.ndarray) The rectified image (Default: \"self.rectified_image\")
+        :return: (numpy.ndarray) The (8, 8, square_size, square_size[, channels]) view, squares[row, col] being the
+                 pixels of a square, or False
+        """
+        try:
+            rectified_image = self.rectified_image if rectified_image is None else rectified_image
+            square_size = rectified_image.shape[0] // 8
+
+            board = rectified_image[:8 * square_size, :8 * square_size]
+            squares = board.reshape((8, square_size, 8, square_size) + board.shape[2:])
+            return squares.swapaxes(1, 2)
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.get_rectified_squares.__name__)
+            return False
+
+    def get_rectified_square(self, row, col, rectified_image=None):
+        """
+        This method returns the pixels of one square of the rectified board (an array slice)
+
+        :param row: (Integer) The x chessboard position (Values: 0 - 7)
+        :param col: (Integer) The y chessboard position(Values: 0 - 7)
+        :param rectified_image: (numpy.ndarray) The rectified image (Default: \"self.rectified_image\")
+        :return: (numpy.ndarray) The (square_size, square_size[, channels]) view or False
+        """
+        try:
+            rectified_image = self.rectified_image if rectified_image is None else rectified_image
+            square_size = rectified_image.shape[0] // 8
+            return rectified_image[row * square_size:(row + 1) * square_size,
+                                   col * square_size:(col + 1) * square_size]
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.get_rectified_square.__name__)
+            return False
+
+    def get_corners(self, list_label='all_corners'):
+        """
+        This method returns the corners in the dictionary format used before the geometry was moved to NumPy arrays
+
+        :param list_label: (String) The corners that are returned ('inner_corners', 'outer_corners' or 'all_corners')
+        :return: (List) A list of dictionaries [{'x': <Float>, 'y': <Float>}] or False
+        """
+        try:
+            if list_label not in ('inner_corners', 'outer_corners', 'all_corners'):
+                console.log('Unrecognized list_label %s.' % str(list_label), console.LOG_WARNING,
+                            self.get_corners.__name__)
+                return False
+
+            return [{'x': x, 'y': y} for (x, y) in getattr(self, list_label).tolist()]
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.get_corners.__name__)
+            return False
+
+    def get_chessboard_position(self, row, col):
+        """
+        This method returns the corners of a chessboard square in the dictionary format
+
+        :param row: (Integer) The x chessboard position (Values: 0 - 7)
+        :param col: (Integer) The y chessboard position(Values: 0 - 7)
+        :return: (Dictionary) The square corners
+            {
+                'upper_left': {'x': <Float>, 'y': <Float>},
+                'upper_right': {'x': <Float>, 'y': <Float>},
+                'lower_left': {'x': <Float>, 'y': <Float>},
+                'lower_right': {'x': <Float>, 'y': <Float>}
+            }
+        """
+        try:
+            corners = self.chessboard_positions[row, col].tolist()
+            return {
+                label: {'x': x, 'y': y}
+                for (label, (x, y)) in zip(('upper_left', 'upper_right', 'lower_left', 'lower_right'), corners)
+            }
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.get_chessboard_position.__name__)
+            return False
+
     def highlight_position(self, row, col):
         """
         This method highlights a position on the chessboard
@@ -307,7 +577,7 @@ class OpenCVHandler(object):
                             self.highlight_position.__name__)
                 return False
 
-            high_pos = self.chessboard_positions[row][col]
+            high_pos = self.get_chessboard_position(row, col)
             cv2.rectangle(self.image,
                           (int(high_pos['lower_left']['x']), int(high_pos['lower_left']['y'])),
                           (int(high_pos['upper_right']['x']), int(high_pos['upper_right']['y'])),
@@ -0,0 +1,283 @@
+"""
+This file has the recording functionality (video clips recorded by background jobs, so that the REST handlers return
+right away)
+"""
+
+# region imports
+import datetime
+import os
+import threading
+import time
+import uuid
+
+from globals import console
+# endregion imports
+
+
+# region RecordingJob
+class RecordingJob(object):
+    """
+    This class holds a recording job (one clip recorded on its own camera splitter port) and its progress
+    """
+
+    def __init__(self, file_path, seconds, splitter_port):
+        """
+        This constructor initializes the recording job
+
+        :param file_path: (String) The file the clip is recorded to
+        :param seconds: (Float) The length of the clip
+        :param splitter_port: (Integer) The camera video port used by the recording
+        """
+        self.job_id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.seconds = seconds
+        self.splitter_port = splitter_port
+
+        self.status = 'queued'
+        self.error_message = None
+
+        self.created_time = time.time()
+        self.started_time = None
+        self.finished_time = None
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def is_active(self):
+        """
+        This method checks whether or not the job is still queued or running
+
+        :return: Boolean (True or False)
+        """
+        return self.status in ('queued', 'running')
+
+    def get_progress(self):
+        """
+        This method returns the current progress of the recording job
+
+        :return: (Dictionary) The job status, its progress and timing information
+        """
+        if self.started_time is None:
+            recorded_seconds = 0
+        else:
+            recorded_seconds = min((self.finished_time or time.time()) - self.started_time, self.seconds)
+
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'file_path': self.file_path,
+            'seconds': self.seconds,
+            'recorded_seconds': recorded_seconds,
+            'progress': (recorded_seconds / self.seconds) if self.seconds > 0 else 1.0,
+            'created_time': self.created_time,
+            'started_time': self.started_time,
+            'finished_time': self.finished_time,
+            'error_message': self.error_message
+        }
+
+
+# endregion RecordingJob
+
+
+# region RecordingHandler
+class RecordingHandler(object):
+    """
+    This class runs the recording jobs in background threads, at most \"max_concurrent_jobs\" at a time (every running
+    job owns one camera splitter port)
+    """
+
+    def __init__(self, camera_handler=None, splitter_ports=(1, 3), max_concurrent_jobs=2, max_seconds=600,
+                 max_finished_jobs=100, videos_folder='./videos'):
+        """
+        This constructor initializes the recording handler
+
+        :param camera_handler: (picamera.PiCamera / FileCamera) The camera (Default: the \"camera\" module camera,
+                               opened on the first recording)
+        :param splitter_ports: (Tuple) The camera video ports used by the recordings
+        :param max_concurrent_jobs: (Integer) The maximum number of recordings running at the same time
+        :param max_seconds: (Float) The maximum length of a clip
+        :param max_finished_jobs: (Integer) The number of finished jobs kept for progress queries
+        :param videos_folder: (String) The folder in which the clips are saved
+        """
+        try:
+            self.camera_handler = camera_handler
+            self.splitter_ports = splitter_ports
+            self.max_concurrent_jobs = min(max_concurrent_jobs, len(splitter_ports))
+            self.max_seconds = max_seconds
+            self.max_finished_jobs = max_finished_jobs
+            self.videos_folder = videos_folder
+
+            self.dict_jobs = {}
+            self.lock = threading.Lock()
+
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, 'RecordingHandler')
+
+    def get_camera_handler(self):
+        """
+        This method returns the camera used by the recordings
+
+        :return: (picamera.PiCamera / FileCamera) The camera
+        """
+        if self.camera_handler is None:
+            from camera import pi_camera_handler
+            self.camera_handler = pi_camera_handler.camera_handler
+
+        return self.camera_handler
+
+    def start_recording(self, input_json):
+        """
+        This method starts recording a clip in the background
+
+        :param input_json: (Dictionary) The JSON received that contains the recording
+            {
+                'seconds': <Number> (the length of the clip),
+                'file_name': <String> (Optional, saved in the \"videos\" folder)
+            }
+        :return: (String) The job id or False
+        """
+        try:
+            if 'seconds' not in input_json:
+                console.log('Invalid keys. The JSON should contain the \'seconds\' key.', console.LOG_WARNING,
+                            self.start_recording.__name__)
+                return False
+
+            seconds = float(input_json['seconds'])
+            if not 0 < seconds <= self.max_seconds:
+                console.log('Invalid length %s. It should be between (0 - %s] seconds.'
+                            % (str(seconds), str(self.max_seconds)),
+                            console.LOG_WARNING,
+                            self.start_recording.__name__)
+                return False
+
+            file_name = input_json.get('file_name',
+                                       'vid_%s.h264' % datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f'))
+            if os.path.basename(str(file_name)) != file_name or file_name in ('', '.', '..'):
+                console.log('Invalid file name %s.' % str(file_name), console.LOG_WARNING,
+                            self.start_recording.__name__)
+                return False
+
+            with self.lock:
+                active_jobs = [job for job in self.dict_jobs.values() if job.is_active()]
+                if len(active_jobs) >= self.max_concurrent_jobs:
+                    console.log('There are already %d recordings running.' % len(active_jobs), console.LOG_WARNING,
+                                self.start_recording.__name__)
+                    return False
+
+                busy_ports = {job.splitter_port for job in active_jobs}
+                splitter_port = [port for port in self.splitter_ports if port not in busy_ports][0]
+
+                job = RecordingJob(os.path.join(self.videos_folder, file_name), seconds, splitter_port)
+                self.remove_finished_jobs()
+                self.dict_jobs[job.job_id] = job
+
+            job.thread = threading.Thread(target=self.run_job, args=(job,), daemon=True)
+            job.thread.start()
+
+            return job.job_id
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.start_recording.__name__)
+            return False
+
+    def run_job(self, job):
+        """
+        This method records a clip. The camera is polled every half second, so that a cancelled job stops right away
+        and the recording errors are noticed.
+
+        :param job: (RecordingJob) The job that is being recorded
+        :return: Boolean (True or False)
+        """
+        camera_handler = None
+        try:
+            camera_handler = self.get_camera_handler()
+            camera_handler.start_recording(job.file_path, splitter_port=job.splitter_port)
+
+            job.status = 'running'
+            job.started_time = time.time()
+            end_time = time.monotonic() + job.seconds
+
+            while time.monotonic() < end_time:
+                camera_handler.wait_recording(0, splitter_port=job.splitter_port)
+                if job.stop_event.wait(min(0.5, max(end_time - time.monotonic(), 0))):
+                    job.status = 'cancelled'
+                    return False
+
+            job.status = 'finished'
+            return True
+        except Exception as error_message:
+            job.status = 'failed'
+            job.error_message = str(error_message)
+            console.log(error_message, console.LOG_ERROR, self.run_job.__name__)
+            return False
+        finally:
+            if job.started_time is not None:
+                try:
+                    camera_handler.stop_recording(splitter_port=job.splitter_port)
+                except Exception as error_message:
+                    console.log(error_message, console.LOG_ERROR, self.run_job.__name__)
+            job.finished_time = time.time()
+
+    def get_progress(self, job_id=None):
+        """
+        This method returns the progress of a recording job (or of all of them)
+
+        :param job_id: (String) The job id (if None, the progress of every job is returned)
+        :return: (Dictionary / List) The job progress or False
+        """
+        try:
+            if job_id is None:
+                return [job.get_progress() for job in list(self.dict_jobs.values())]
+
+            if job_id not in self.dict_jobs:
+                console.log('Unknown recording %s.' % str(job_id), console.LOG_WARNING, self.get_progress.__name__)
+                return False
+
+            return self.dict_jobs[job_id].get_progress()
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.get_progress.__name__)
+            return False
+
+    def cancel_recording(self, job_id):
+        """
+        This method stops a recording job (the clip keeps what was recorded so far)
+
+        :param job_id: (String) The job id
+        :return: Boolean (True or False)
+        """
+        try:
+            if job_id not in self.dict_jobs:
+                console.log('Unknown recording %s.' % str(job_id), console.LOG_WARNING,
+                            self.cancel_recording.__name__)
+                return False
+
+            job = self.dict_jobs[job_id]
+            job.stop_event.set()
+            if job.thread is not None:
+                job.thread.join()
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.cancel_recording.__name__)
+            return False
+
+    def remove_finished_jobs(self):
+        """
+        This method forgets the oldest finished jobs once there are more than \"max_finished_jobs\" of them
+
+        :return: Boolean (True or False)
+        """
+        try:
+            finished_jobs = [job for job in self.dict_jobs.values() if not job.is_active()]
+            finished_jobs.sort(key=lambda job: job.created_time)
+
+            for job in finished_jobs[:max(len(finished_jobs) - self.max_finished_jobs, 0)]:
+                del self.dict_jobs[job.job_id]
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.remove_finished_jobs.__name__)
+            return False
+
+
+recording_handler = RecordingHandler()
+# endregion RecordingHandler
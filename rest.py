@@ -6,19 +6,100 @@ Description: This file has the REST API functionality
 from unittest import loader
 
 import cherrypy
+import json
+import math
+import os
 import sys
+import time
 
 from obs import methods_handler
+from actuator import actuator_handler
+from trajectory import trajectory_handler
+from recording import recording_handler
+from video_ring_buffer import video_ring_buffer
+from live_stream import live_stream_handler
+from static_assets import static_asset_handler
+from metrics import metrics_registry, request_duration, request_stage_duration
 from globals import console, rest_error_message_handler
 # endregion imports
 
 
+# region RequestMetricsTool
+class RequestMetricsTool(cherrypy.Tool):
+    """
+    This tool times the REST requests: the body stage (reading and decoding the JSON body), the page handler and the
+    whole request, per mount point
+    """
+
+    def __init__(self):
+        super(RequestMetricsTool, self).__init__('on_start_resource', self.start_timer, priority=0)
+
+    def _setup(self):
+        super(RequestMetricsTool, self)._setup()
+        cherrypy.serving.request.hooks.attach('before_handler', self.start_handler_timer, priority=100)
+        cherrypy.serving.request.hooks.attach('before_finalize', self.stop_handler_timer, priority=0)
+        cherrypy.serving.request.hooks.attach('on_end_request', self.stop_timer, priority=100)
+
+    @staticmethod
+    def start_timer():
+        cherrypy.serving.request.metrics_start_time = time.perf_counter()
+
+    @staticmethod
+    def start_handler_timer():
+        request = cherrypy.serving.request
+        request.metrics_handler_start_time = time.perf_counter()
+        request_stage_duration.observe(request.metrics_handler_start_time - request.metrics_start_time,
+                                       (request.script_name or '/', 'body'))
+
+    @staticmethod
+    def stop_handler_timer():
+        request = cherrypy.serving.request
+        if hasattr(request, 'metrics_handler_start_time'):
+            request_stage_duration.observe(time.perf_counter() - request.metrics_handler_start_time,
+                                           (request.script_name or '/', 'handler'))
+
+    @staticmethod
+    def stop_timer():
+        request = cherrypy.serving.request
+        request_duration.observe(time.perf_counter() - request.metrics_start_time,
+                                 (request.script_name or '/', request.method, str(cherrypy.serving.response.status)[:3]))
+
+
+cherrypy.tools.request_metrics = RequestMetricsTool()
+# endregion RequestMetricsTool
+
+
+# region ErrorContextTool
+def reset_error_context():
+    """
+    This function resets the error context of a request: it starts without an error message nor an actuator timeout
+    (the worker threads, and so their error context, are reused)
+
+    :return: Boolean (True or False)
+    """
+    rest_error_message_handler.reset()
+    return actuator_handler.reset_timeout()
+
+
+def get_error_status(status):
+    """
+    This function returns the HTTP status of a failed request (504 if the actuator did not apply its command in time)
+
+    :param status: (Integer) The HTTP status of the other failures
+    :return: (Integer) The HTTP status
+    """
+    return 504 if actuator_handler.has_timed_out() else status
+
+
+cherrypy.tools.error_context = cherrypy.Tool('on_start_resource', reset_error_context, priority=0)
+# endregion ErrorContextTool
+
+
 # region Methods
 class Root(object):
     @cherrypy.expose
     def index(self):
-        tmpl = open('index.html')
-        return tmpl
+        return static_asset_handler.serve('index.html')
 
 
 @cherrypy.expose
@@ -36,14 +117,27 @@ class Methods(object):
         try:
             input_json = cherrypy.request.json
 
+            # with "wait": false the commands are only queued, their status is available at /api/commands/<id>
+            if isinstance(input_json, dict) and input_json.get('wait', True) is False:
+                command_id = methods_handler.submit_json(input_json)
+                if command_id is False:
+                    raise cherrypy.HTTPError(400, rest_error_message_handler.get_last_error_message())
+
+                cherrypy.response.status = 202
+                return {
+                    'command_id': command_id
+                }
+
             if methods_handler.interpret_json(input_json) is True:
                 return True
             else:
-                raise cherrypy.HTTPError(400, rest_error_message_handler.get_last_error_message())
+                raise cherrypy.HTTPError(get_error_status(400), rest_error_message_handler.get_last_error_message())
 
+        except cherrypy.HTTPError:
+            raise
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR)
-            raise cherrypy.HTTPError(400, str(rest_error_message_handler.get_last_error_message()))
+            raise cherrypy.HTTPError(get_error_status(400), str(rest_error_message_handler.get_last_error_message()))
 
     @cherrypy.tools.json_in()
     @cherrypy.tools.json_out()
@@ -54,7 +148,204 @@ class Methods(object):
 
     @cherrypy.tools.json_out()
     def DELETE(self):
-        raise cherrypy.HTTPError(400, 'Hello World')
+        # emergency stop: every motor is stopped before any queued command is applied
+        if methods_handler.emergency_stop() is True:
+            return True
+
+        raise cherrypy.HTTPError(get_error_status(500), str(rest_error_message_handler.get_last_error_message()))
+
+
+@cherrypy.expose
+class Commands(object):
+    @cherrypy.tools.json_out()
+    def GET(self, command_id=None):
+        command_status = methods_handler.get_command_status(command_id)
+        if command_status is False:
+            raise cherrypy.HTTPError(404, str(rest_error_message_handler.get_last_error_message()))
+
+        return command_status
+
+
+@cherrypy.expose
+class Motors(object):
+    @cherrypy.tools.json_out()
+    def GET(self):
+        motors_status = methods_handler.get_motors_status()
+        if motors_status is False:
+            raise cherrypy.HTTPError(500, str(rest_error_message_handler.get_last_error_message()))
+
+        return motors_status
+
+
+@cherrypy.expose
+class Trajectories(object):
+    @cherrypy.tools.json_out()
+    def GET(self, job_id=None):
+        progress = trajectory_handler.get_progress(job_id)
+        if progress is False:
+            raise cherrypy.HTTPError(404, str(rest_error_message_handler.get_last_error_message()))
+
+        return progress
+
+    @cherrypy.tools.json_in()
+    @cherrypy.tools.json_out()
+    def POST(self):
+        try:
+            input_json = cherrypy.request.json
+
+            job_id = trajectory_handler.start_trajectory(input_json)
+            if job_id is False:
+                raise cherrypy.HTTPError(400, str(rest_error_message_handler.get_last_error_message()))
+
+            return trajectory_handler.get_progress(job_id)
+
+        except cherrypy.HTTPError:
+            raise
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR)
+            raise cherrypy.HTTPError(400, str(rest_error_message_handler.get_last_error_message()))
+
+    @cherrypy.tools.json_out()
+    def DELETE(self, job_id):
+        if trajectory_handler.cancel_trajectory(job_id) is False:
+            raise cherrypy.HTTPError(404, str(rest_error_message_handler.get_last_error_message()))
+
+        return trajectory_handler.get_progress(job_id)
+
+
+@cherrypy.expose
+class Recordings(object):
+    @cherrypy.tools.json_out()
+    def GET(self, job_id=None):
+        progress = recording_handler.get_progress(job_id)
+        if progress is False:
+            raise cherrypy.HTTPError(404, str(rest_error_message_handler.get_last_error_message()))
+
+        return progress
+
+    @cherrypy.tools.json_in()
+    @cherrypy.tools.json_out()
+    def POST(self):
+        try:
+            input_json = cherrypy.request.json
+
+            job_id = recording_handler.start_recording(input_json)
+            if job_id is False:
+                raise cherrypy.HTTPError(400, str(rest_error_message_handler.get_last_error_message()))
+
+            return recording_handler.get_progress(job_id)
+
+        except cherrypy.HTTPError:
+            raise
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR)
+            raise cherrypy.HTTPError(400, str(rest_error_message_handler.get_last_error_message()))
+
+    @cherrypy.tools.json_out()
+    def DELETE(self, job_id):
+        if recording_handler.cancel_recording(job_id) is False:
+            raise cherrypy.HTTPError(404, str(rest_error_message_handler.get_last_error_message()))
+
+        return recording_handler.get_progress(job_id)
+
+
+@cherrypy.expose
+class Clips(object):
+    @cherrypy.tools.json_out()
+    def GET(self):
+        return video_ring_buffer.get_stats()
+
+    @cherrypy.tools.json_in()
+    @cherrypy.tools.json_out()
+    def POST(self):
+        try:
+            input_json = cherrypy.request.json
+
+            if video_ring_buffer.is_clip_limit_reached():
+                raise cherrypy.HTTPError(429, 'Too many clips are recording (%d). Try again later.' %
+                                         video_ring_buffer.max_pending_clips)
+
+            clip_status = video_ring_buffer.trigger(input_json.get('reason', 'rest'),
+                                                    input_json.get('seconds_before'),
+                                                    input_json.get('seconds_after', 5))
+            if clip_status is False:
+                raise cherrypy.HTTPError(400, str(rest_error_message_handler.get_last_error_message()))
+
+            return clip_status
+
+        except cherrypy.HTTPError:
+            raise
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR)
+            raise cherrypy.HTTPError(400, str(rest_error_message_handler.get_last_error_message()))
+
+
+@cherrypy.expose
+class Stream(object):
+    _cp_config = {'response.stream': True}
+
+    def GET(self, stats=None):
+        if stats is not None:
+            cherrypy.response.headers['Content-Type'] = 'application/json'
+            return json.dumps(live_stream_handler.get_stats()).encode()
+
+        cherrypy.response.headers['Content-Type'] = 'multipart/x-mixed-replace; boundary=%s' % \
+                                                    live_stream_handler.BOUNDARY
+        cherrypy.response.headers['Cache-Control'] = 'no-cache, no-store'
+        return live_stream_handler.generate_stream()
+
+
+@cherrypy.expose
+class MediaFolder(object):
+    _cp_config = {'response.stream': True}
+
+    def __init__(self, folder):
+        self.folder = os.path.abspath(folder)
+
+    def GET(self, *path):
+        # only the files directly inside the folder can be read (no folder listing, no hidden files)
+        if len(path) != 1 or path[0].startswith('.') or os.path.basename(path[0]) != path[0]:
+            raise cherrypy.NotFound()
+
+        return static_asset_handler.serve(os.path.join(self.folder, path[0]))
+
+
+@cherrypy.expose
+class Logs(object):
+    @cherrypy.tools.json_out()
+    def GET(self, level=None, limit=100):
+        try:
+            return {
+                'stats': console.get_stats(),
+                'records': console.get_records(level, int(limit))
+            }
+        except ValueError:
+            raise cherrypy.HTTPError(400, 'Invalid level %s or limit %s' % (str(level), str(limit)))
+
+
+@cherrypy.expose
+class Metrics(object):
+    def GET(self):
+        cherrypy.response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+        return metrics_registry.get_metrics_text().encode()
+
+
+@cherrypy.expose
+class Server(object):
+    @cherrypy.tools.json_out()
+    def GET(self):
+        # the worker thread pool state (the thread answering this request is counted as busy). Only the public
+        # attributes of the pool are read: it starts "min" threads and CherryPy does not resize it afterwards.
+        thread_pool = cherrypy.server.httpserver.requests
+        return {
+            'min_threads': thread_pool.min,
+            # an unbounded pool has an infinite "max", which is not valid JSON
+            'max_threads': thread_pool.max if math.isfinite(thread_pool.max) else None,
+            'number_of_threads': thread_pool.min,
+            'idle_threads': thread_pool.idle,
+            'busy_threads': max(thread_pool.min - thread_pool.idle, 0),
+            'queued_connections': thread_pool.qsize
+        }
 
 
 @cherrypy.expose
@@ -3,9 +3,14 @@ This file has all the methods used to control the servo motors (including all th
 """
 
 # region imports
-# noinspection PyUnresolvedReferences
-import RPi.GPIO as GPIO
+import time
 
+import numpy as np
+
+from gpio_backend import get_gpio_backend
+from actuator import actuator_handler, actuator_method
+from motion_profile import motion_profile_handler
+from metrics import metrics_registry, duty_cycle_write_duration
 from globals import console
 
 
@@ -18,6 +23,33 @@ class GPIOHandler(object):
     Description: This class is used in order to handle low level use of the GPIO pins
     """
 
+    def __init__(self, backend=None):
+        """
+        Description: This constructor initializes the GPIO handler
+
+        :param backend: (GPIOBackend) The GPIO backend (Default: selected by the \"ROBOTIC_ARM_GPIO_BACKEND\"
+                        environment variable)
+        """
+        try:
+            self.backend = backend if backend is not None else get_gpio_backend()
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, 'GPIOHandler')
+
+    def set_backend(self, backend):
+        """
+        Description: This method replaces the GPIO backend (e.g. with a simulated one for benchmarking)
+
+        :param backend: (GPIOBackend) The new GPIO backend
+        :return: Boolean (True or False)
+        """
+        try:
+            self.backend = backend
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.set_backend.__name__)
+            return False
+
+    @actuator_method
     def set_mode(self):
         """
         Description: This method is used to set the GPIO pin mode (The way in which the GPIO pins are mapped and called)
@@ -25,13 +57,14 @@ class GPIOHandler(object):
         :return: Boolean (True or False)
         """
         try:
-            GPIO.setmode(GPIO.BOARD)
-            # GPIO.setmode(GPIO.BCM)
+            self.backend.setmode(self.backend.BOARD)
+            # self.backend.setmode(self.backend.BCM)
             return True
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, self.set_mode.__name__)
             return False
 
+    @actuator_method
     def setup_input_pin(self, pin):
         """
         Description: This method sets a pin to be an \"INPUT\" pin
@@ -40,12 +73,13 @@ class GPIOHandler(object):
         :return: Boolean (True or False)
         """
         try:
-            GPIO.setup(pin, GPIO.IN)
+            self.backend.setup(pin, self.backend.IN)
             return True
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, self.setup_input_pin.__name__)
             return False
 
+    @actuator_method
     def cleanup(self):
         """
         Description This method cleans the memory allocation of any pins used throwout the project (required on exit)
@@ -53,12 +87,13 @@ class GPIOHandler(object):
         :return: Boolean (True or False)
         """
         try:
-            GPIO.cleanup()
+            self.backend.cleanup()
             return True
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, self.cleanup.__name__)
             return False
 
+    @actuator_method
     def setup_output_pin(self, pin):
         """
         Description: This method sets a pin to be an \"OUTPUT\" pin
@@ -67,12 +102,13 @@ class GPIOHandler(object):
         :return: Boolean (True or False)
         """
         try:
-            GPIO.setup(pin, GPIO.OUT)
+            self.backend.setup(pin, self.backend.OUT)
             return True
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, self.setup_output_pin.__name__)
             return False
 
+    @actuator_method
     def set_gpio_pin_pwm(self, pin, frequency):
         """
         Description: This method sets the pulse-width modulation frequency of the GPIO pin
@@ -82,7 +118,7 @@ class GPIOHandler(object):
         :return: Object (The GPIO.PWM object for a certain pin)
         """
         try:
-            return GPIO.PWM(pin, frequency)
+            return self.backend.PWM(pin, frequency)
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, self.set_gpio_pin_pwm.__name__)
             return False
@@ -94,6 +130,154 @@ gpio_handler = GPIOHandler()
 # endregion GPIOHandler
 
 
+# region DutyCycleWriter
+class DutyCycleWriter(object):
+    """
+    This class coalesces the duty cycle writes of a servo motor: at most one write reaches the PWM handler per PWM
+    period (the last requested duty cycle wins) and writes that would not change the duty cycle are skipped. The writer
+    is only used from the actuator thread (the deferred writes are scheduled actuator commands), so it needs no lock.
+    """
+
+    def __init__(self, servo_motor):
+        """
+        This constructor initializes the duty cycle writer
+
+        :param servo_motor: (ServoMotorHandler) The servo motor whose PWM handler is written
+        """
+        try:
+            self.servo_motor = servo_motor
+
+            self.applied_duty_cycle = None
+            self.pending_duty_cycle = None
+            self.last_write_time = None
+            self.flush_command = None
+
+            self.dict_counters = {
+                'requested': 0,
+                'applied': 0,
+                'coalesced': 0,
+                'dropped': 0
+            }
+
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, 'DutyCycleWriter')
+
+    def write(self, duty_cycle):
+        """
+        This method requests a new duty cycle. It is applied right away if the last write is older than one PWM period,
+        otherwise it is deferred until the end of the period (and replaced by any later request).
+
+        :param duty_cycle: (Integer: 0 - 100) The PWM duty cycle
+        :return: Boolean (True or False)
+        """
+        try:
+            self.dict_counters['requested'] += 1
+
+            # a flush cancelled by someone else (e.g. \"ActuatorHandler.cancel_queued_commands\") will never run
+            if self.flush_command is not None and self.flush_command.future.cancelled():
+                self.flush_command = None
+                self.pending_duty_cycle = None
+
+            if self.pending_duty_cycle is not None:
+                self.pending_duty_cycle = duty_cycle
+                self.dict_counters['coalesced'] += 1
+                return True
+
+            if duty_cycle == self.applied_duty_cycle:
+                self.dict_counters['dropped'] += 1
+                return True
+
+            period = 1 / self.servo_motor.frequency
+            elapsed_time = time.monotonic() - self.last_write_time if self.last_write_time is not None else period
+            if elapsed_time >= period:
+                return self.apply(duty_cycle)
+
+            self.pending_duty_cycle = duty_cycle
+            # the write has already been accepted, so a stop does not preempt it (\"reset\" cancels it for the
+            # stopped motors)
+            self.flush_command = actuator_handler.schedule(period - elapsed_time, 'duty_cycle_flush', self.flush,
+                                                           is_preemptible=False)
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.write.__name__)
+            return False
+
+    def flush(self):
+        """
+        This method applies the pending duty cycle (if any)
+
+        :return: Boolean (True or False)
+        """
+        try:
+            duty_cycle = self.pending_duty_cycle
+            self.pending_duty_cycle = None
+            self.flush_command = None
+
+            if duty_cycle is None:
+                return True
+
+            if duty_cycle == self.applied_duty_cycle:
+                self.dict_counters['dropped'] += 1
+                return True
+
+            return self.apply(duty_cycle)
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.flush.__name__)
+            return False
+
+    def apply(self, duty_cycle):
+        """
+        This method writes the duty cycle to the PWM handler
+
+        :param duty_cycle: (Integer: 0 - 100) The PWM duty cycle
+        :return: Boolean (True or False)
+        """
+        try:
+            start_time = time.perf_counter()
+            self.servo_motor.pwn_handler.ChangeDutyCycle(duty_cycle)
+            duty_cycle_write_duration.observe(time.perf_counter() - start_time, (str(self.servo_motor.pin),))
+            self.applied_duty_cycle = duty_cycle
+            self.last_write_time = time.monotonic()
+            self.dict_counters['applied'] += 1
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.apply.__name__)
+            return False
+
+    def reset(self):
+        """
+        This method discards the pending duty cycle and forgets the applied one (e.g. when the PWM handler changes)
+
+        :return: Boolean (True or False)
+        """
+        try:
+            if self.flush_command is not None:
+                self.flush_command.cancel()
+
+            self.flush_command = None
+            self.pending_duty_cycle = None
+            self.applied_duty_cycle = None
+            self.last_write_time = None
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.reset.__name__)
+            return False
+
+    def get_counters(self):
+        """
+        This method returns the writer counters
+
+        :return: (Dictionary) The number of requested, applied, coalesced and dropped (no-op) writes
+        """
+        return dict(self.dict_counters)
+
+
+# endregion DutyCycleWriter
+
+
 # region ServoMotor
 class ServoMotorHandler(object):
     """
@@ -116,6 +300,7 @@ class ServoMotorHandler(object):
             self.frequency = frequency
             self.duty_cycle = duty_cycle
             self.pwn_handler = None
+            self.duty_cycle_writer = DutyCycleWriter(self)
 
             self.lower_limit = lower_limit
             self.upper_limit = upper_limit
@@ -150,12 +335,15 @@ class ServoMotorHandler(object):
                 'lower': 0
             }
 
+            self.duty_cycle_table = None
+
             return
 
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, 'ServoMotorHandler')
             return
 
+    @actuator_method
     def initialize_gpio_pin_mode(self):
         """
         This method set the servo motor pin in output mode
@@ -169,6 +357,7 @@ class ServoMotorHandler(object):
             console.log(error_message, console.LOG_ERROR, self.initialize_gpio_pin_mode.__name__)
             return False
 
+    @actuator_method
     def set_gpio_pin_pwn(self):
         """
         This method sets the servo motor PWM (\"pulse-width modulation\") handler
@@ -177,27 +366,56 @@ class ServoMotorHandler(object):
         """
         try:
             self.pwn_handler = gpio_handler.set_gpio_pin_pwm(self.pin, self.frequency)
+            self.duty_cycle_writer.reset()
             return True
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, self.set_gpio_pin_pwn.__name__)
             return False
 
+    @staticmethod
+    def is_valid_duty_cycle(duty_cycle):
+        """
+        This method checks a PWM duty cycle (the lower and upper limits are pulse widths, they only bound the jogs)
+
+        :param duty_cycle: (Float) The PWM duty cycle
+        :return: Boolean (True or False)
+        """
+        return 0 <= duty_cycle <= 100
+
+    @actuator_method
     def set_gpio_pin_duty_cycle(self, duty_cycle):
         """
-        This method updates the PWM handler \"duty cycle\"
+        This method updates the PWM handler \"duty cycle\" (the write goes through the duty cycle writer, so it may
+        be coalesced with the other writes from the same PWM period). The duty cycle is validated here, since a
+        deferred write is applied after the caller has been answered.
 
         :param duty_cycle: (Integer: 0 - 100) The PWM duty cycle
         :return: Boolean (True or False)
         """
         try:
+            if self.pwn_handler is None:
+                console.log('The PWM handler of the pin %d has not been initialized' % self.pin, console.LOG_WARNING,
+                            self.set_gpio_pin_duty_cycle.__name__)
+                return False
+
+            if not self.is_valid_duty_cycle(duty_cycle):
+                console.log('Invalid duty cycle %s for the pin %d. It should be between [0 - 100].'
+                            % (str(duty_cycle), self.pin),
+                            console.LOG_WARNING,
+                            self.set_gpio_pin_duty_cycle.__name__)
+                return False
+
+            if self.duty_cycle_writer.write(duty_cycle) is False:
+                return False
+
             self.duty_cycle = duty_cycle
-            self.pwn_handler.ChangeDutyCycle(duty_cycle)
             return True
 
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, self.set_gpio_pin_duty_cycle.__name__)
             return False
 
+    @actuator_method
     def set_gpio_pin_frequency(self, frequency):
         """
         This method updates the PWM handler \"frequency\"
@@ -234,6 +452,7 @@ class ServoMotorHandler(object):
             console.log(error_message, console.LOG_ERROR, self.set_gpio_pwm_limits.__name__)
             return False
 
+    @actuator_method
     def rotate_left(self):
         """
         This method rotated the servo motor to the left side
@@ -249,13 +468,12 @@ class ServoMotorHandler(object):
                 return False
 
             duty_cycle = ((current_time_period - self.step) * 100) / pulse_width_time_period
-            self.set_gpio_pin_duty_cycle(duty_cycle)
-
-            return True
+            return self.set_gpio_pin_duty_cycle(duty_cycle)
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR, self.rotate_left.__name__)
             return False
 
+    @actuator_method
     def rotate_right(self):
         """
         This method rotated the servo motor to the right side
@@ -271,22 +489,56 @@ class ServoMotorHandler(object):
                 return False
 
             duty_cycle = ((current_time_period + self.step) * 100) / pulse_width_time_period
-            self.set_gpio_pin_duty_cycle(duty_cycle)
+            return self.set_gpio_pin_duty_cycle(duty_cycle)
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.rotate_left.__name__)
+            return False
+
+    def move_to(self, duty_cycle, max_velocity, max_acceleration, profile_type='trapezoidal'):
+        """
+        This method moves the servo motor smoothly to a new duty cycle, following a precomputed motion profile (one
+        sample per PWM period)
+
+        :param duty_cycle: (Integer: 0 - 100) The PWM duty cycle that should be reached
+        :param max_velocity: (Float) The maximum velocity (duty cycle units per second)
+        :param max_acceleration: (Float) The maximum acceleration (duty cycle units per second squared)
+        :param profile_type: (String) The profile type (\"trapezoidal\" or \"minimum_jerk\")
+        :return: Boolean (True or False)
+        """
+        try:
+            profile = motion_profile_handler.get_profile(self.duty_cycle, duty_cycle, max_velocity, max_acceleration,
+                                                         profile_type, self.frequency)
+            if profile is False:
+                return False
+
+            start_time = time.monotonic()
+            for (index, sample) in enumerate(profile.tolist()):
+                delay = start_time + index / self.frequency - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+                if self.set_gpio_pin_duty_cycle(sample) is False:
+                    return False
 
             return True
         except Exception as error_message:
-            console.log(error_message, console.LOG_ERROR, self.rotate_left.__name__)
+            console.log(error_message, console.LOG_ERROR, self.move_to.__name__)
             return False
 
+    @actuator_method
     def stop_pwm_handler(self):
         """
         This method stops the PWM handler and cleans the memory allocation of any pins used throwout the
-                     project (required on exit)
+                     project (required on exit). The PWM handler is dropped, so the later duty cycle writes fail until
+                     the motor is initialized again.
 
         :return: Boolean (True or False)
         """
         try:
-            self.pwn_handler.stop()
+            self.duty_cycle_writer.reset()
+            if self.pwn_handler is not None:
+                self.pwn_handler.stop()
+                self.pwn_handler = None
             gpio_handler.cleanup()
 
             return True
@@ -294,6 +546,24 @@ class ServoMotorHandler(object):
             console.log(error_message, console.LOG_WARNING, self.stop_pwm_handler.__name__)
             return False
 
+    def get_status(self):
+        """
+        This method returns the current state of the servo motor
+
+        :return: (Dictionary) The servo motor settings and the duty cycle writer counters
+        """
+        try:
+            return {
+                'pin': self.pin,
+                'frequency': self.frequency,
+                'duty_cycle': self.duty_cycle,
+                'is_initialized': self.pwn_handler is not None,
+                'writes': self.duty_cycle_writer.get_counters()
+            }
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.get_status.__name__)
+            return False
+
     def set_dict_duty_cycle__xy_consts(self, dict_duty_cycle_xy_consts):
         """
         This method initializes the duty cycle constants necessary in order to reach the extreme corners of the
@@ -342,6 +612,8 @@ class ServoMotorHandler(object):
             self.dict_duty_cycle_xy_consts = dict_duty_cycle_xy_consts
             if 'percentage' not in self.dict_duty_cycle_xy_consts.keys():
                 self.dict_duty_cycle_xy_consts['percentage'] = 1.7
+
+            self.duty_cycle_table = None
                 
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR)
@@ -402,6 +674,60 @@ class ServoMotorHandler(object):
             console.log(error_message, console.LOG_ERROR)
             return False
 
+    def compute_duty_cycles(self, x, y):
+        """
+        This method calculates the horizontal and vertical duty cycles for the given board coordinates. It works both on
+        numbers and on NumPy arrays (element-wise).
+
+        :param x: (Number / numpy.ndarray) The x chessboard position (Default: [1 - 8])
+        :param y: (Number / numpy.ndarray) The y chessboard position (Default: [1 - 8])
+        :return: (Tuple) The x and y duty cycles
+        """
+        # retrieve the dict_duty_cycle_xy_consts values
+        [xul, yul, xur, yur, xll, yll, xlr, ylr] = self.get_dict_duty_cycle_xy_consts_values()
+        p = self.dict_duty_cycle_xy_consts['percentage']
+
+        dict_upper = {
+            'x': self.rule_of_three(xul, xur, x),
+            'y': self.rule_of_three(yul, yur, y)
+        }
+
+        dict_lower = {
+            'x': self.rule_of_three(xll, xlr, x),
+            'y': self.rule_of_three(yll, ylr, y)
+        }
+
+        return (
+            (p * (x - 1) * dict_upper['x']) + ((1 - p) * (x - 1) * dict_lower['x']),
+            (p * (y - 1) * dict_upper['y']) + ((1 - p) * (y - 1) * dict_lower['y'])
+        )
+
+    def get_duty_cycle_table(self):
+        """
+        This method returns the duty cycles of all the 64 chessboard squares. The table is calculated in one vectorized
+        pass and cached until \"set_dict_duty_cycle__xy_consts\" is called again (changing the constants dictionary
+        in place does not rebuild it).
+
+        :return: (numpy.ndarray) A read-only array with the shape (8, 8, 2): table[x - 1, y - 1] = [x duty cycle,
+                 y duty cycle]
+        """
+        try:
+            if self.duty_cycle_table is None:
+                positions = np.arange(1, 9, dtype=float)
+                (x_duty_cycles, y_duty_cycles) = self.compute_duty_cycles(positions, positions)
+
+                duty_cycle_table = np.empty((8, 8, 2))
+                duty_cycle_table[:, :, 0] = x_duty_cycles[:, np.newaxis]
+                duty_cycle_table[:, :, 1] = y_duty_cycles[np.newaxis, :]
+                duty_cycle_table.flags.writeable = False
+
+                self.duty_cycle_table = duty_cycle_table
+
+            return self.duty_cycle_table
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.get_duty_cycle_table.__name__)
+            return False
+
     def find_duty_cycles(self, position):
         """
         This method determines the duty cycle necessary to reach the current position, both for horizontal and vertical
@@ -425,30 +751,47 @@ class ServoMotorHandler(object):
                 console.log('Invalid dictionary keys. They should be %s.' % str(mandatory_keys), console.LOG_WARNING)
                 return False
 
-            # retrieve the dict_duty_cycle_xy_consts values
-            [xul, yul, xur, yur, xll, yll, xlr, ylr] = self.get_dict_duty_cycle_xy_consts_values()
-            p = self.dict_duty_cycle_xy_consts['percentage']
-
             [x, y] = [position['x'], position['y']]
-            dict_upper = {
-                'x': self.rule_of_three(xul, xur, x),
-                'y': self.rule_of_three(yul, yur, y)
-            }
-
-            dict_lower = {
-                'x': self.rule_of_three(xll, xlr, x),
-                'y': self.rule_of_three(yll, ylr, y)
-            }
-
+            if x in range(1, 9) and y in range(1, 9):
+                duty_cycle_table = self.get_duty_cycle_table()
+                return {
+                    'x': float(duty_cycle_table[int(x) - 1, 0, 0]),
+                    'y': float(duty_cycle_table[0, int(y) - 1, 1])
+                }
+
+            (x_duty_cycle, y_duty_cycle) = self.compute_duty_cycles(x, y)
             return {
-                'x': (p * (x - 1) * dict_upper['x']) + ((1 - p) * (x - 1) * dict_lower['x']),
-                'y': (p * (y - 1) * dict_upper['y']) + ((1 - p) * (y - 1) * dict_lower['y'])
+                'x': x_duty_cycle,
+                'y': y_duty_cycle
             }
 
         except Exception as error_message:
             console.log(error_message, console.LOG_ERROR)
             return False
 
+    def find_duty_cycles_bulk(self, positions):
+        """
+        This method determines the duty cycles of several chessboard squares at once, using the cached table
+
+        :param positions: (List / numpy.ndarray) The chessboard positions, either as [{'x': <Integer>, 'y': <Integer>}]
+                          or as an array with the shape (N, 2) (Default: [1 - 8])
+        :return: (numpy.ndarray) An array with the shape (N, 2) containing the x and y duty cycles of every position
+        """
+        try:
+            if len(positions) > 0 and isinstance(positions[0], dict):
+                positions = [(position['x'], position['y']) for position in positions]
+
+            positions = np.asarray(positions, dtype=int).reshape(-1, 2)
+            if positions.size > 0 and (positions.min() < 1 or positions.max() > 8):
+                console.log('Invalid positions. They should be between [1 - 8].', console.LOG_WARNING,
+                            self.find_duty_cycles_bulk.__name__)
+                return False
+
+            return self.get_duty_cycle_table()[positions[:, 0] - 1, positions[:, 1] - 1]
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.find_duty_cycles_bulk.__name__)
+            return False
+
     def set_duty_cycle_z_consts(self, duty_cycle_z_consts):
         """
         This method initializes the duty cycle constants necessary in order to lift or lower a chesspiece
@@ -483,4 +826,36 @@ dict_servo_motors = {
     'claw_left': ServoMotorHandler(pin=5, frequency=50, duty_cycle=5, lower_limit=2, upper_limit=10, step=0.1),
     'claw': ServoMotorHandler(pin=0, frequency=50, duty_cycle=5, lower_limit=2, upper_limit=10, step=0.1)
 }
+
+
+def get_duty_cycle_write_counters():
+    """
+    This function returns the duty cycle writer counters of all the motors (exported as metrics)
+
+    :return: (Dictionary) The (motor name, counter name) keys and the counter values
+    """
+    return {(name, counter_name): value
+            for (name, servo_motor) in dict_servo_motors.items()
+            for (counter_name, value) in servo_motor.duty_cycle_writer.get_counters().items()}
+
+
+metrics_registry.counter('robotic_arm_duty_cycle_writes',
+                         'The duty cycle writes per motor (requested, applied, coalesced and dropped)',
+                         ('motor', 'result'),
+                         get_duty_cycle_write_counters)
+
+
+def find_all_duty_cycles(positions):
+    """
+    This function determines the duty cycles of several chessboard squares for every servo motor
+
+    :param positions: (List / numpy.ndarray) The chessboard positions (see \"ServoMotorHandler.find_duty_cycles_bulk\")
+    :return: (Dictionary) The motor names and their (N, 2) duty cycle arrays
+    """
+    try:
+        return {name: servo_motor.find_duty_cycles_bulk(positions)
+                for (name, servo_motor) in dict_servo_motors.items()}
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, find_all_duty_cycles.__name__)
+        return False
 # endregion servos
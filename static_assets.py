@@ -0,0 +1,313 @@
+"""
+This file has the static asset functionality (the index page and the media folders, served with conditional GETs, a
+memory cache for the small assets and range requests for the large ones)
+"""
+
+# region imports
+import collections
+import email.utils
+import gzip
+import mimetypes
+import os
+import threading
+
+import cherrypy
+from cherrypy.lib import static
+
+from globals import console
+# endregion imports
+
+
+# region StaticAsset
+class StaticAsset(object):
+    """
+    This class holds a small asset in memory (with its gzip variant, if it is worth sending)
+    """
+
+    def __init__(self, file_path, file_stat, content, min_gzip_size=512):
+        """
+        This constructor initializes the asset
+
+        :param file_path: (String) The file path
+        :param file_stat: (os.stat_result) The file stat (used to notice that the file has changed)
+        :param content: (Bytes) The file content
+        :param min_gzip_size: (Integer) The minimum size of a compressed asset
+        """
+        self.file_path = file_path
+        self.modified_time = file_stat.st_mtime_ns
+        self.size = file_stat.st_size
+        self.content = content
+        self.content_type = get_content_type(file_path)
+
+        self.gzip_content = None
+        if self.size >= min_gzip_size and is_compressible(self.content_type):
+            gzip_content = gzip.compress(content, 9)
+            if len(gzip_content) < self.size:
+                self.gzip_content = gzip_content
+
+    def is_valid(self, file_stat):
+        """
+        This method checks whether or not the file has changed since it was read
+
+        :param file_stat: (os.stat_result) The current file stat
+        :return: Boolean (True or False)
+        """
+        return self.modified_time == file_stat.st_mtime_ns and self.size == file_stat.st_size
+
+
+# endregion StaticAsset
+
+
+# region StaticAssetHandler
+class StaticAssetHandler(object):
+    """
+    This class serves the static files. The small ones are kept in memory (the least recently used ones are evicted
+    once the cache is full) until their modification time changes, the large ones are streamed from the disk (with range requests). Every answer has an ETag and a Last-Modified header,
+    so the clients that poll get \"304 Not Modified\" answers.
+    """
+
+    def __init__(self, max_cached_size=256 * 1024, max_cache_bytes=8 * 1024 * 1024, min_gzip_size=512):
+        """
+        This constructor initializes the static asset handler
+
+        :param max_cached_size: (Integer) The maximum size of an asset kept in memory, in bytes
+        :param max_cache_bytes: (Integer) The maximum size of the memory cache, in bytes
+        :param min_gzip_size: (Integer) The minimum size of a compressed asset, in bytes
+        """
+        try:
+            self.max_cached_size = max_cached_size
+            self.max_cache_bytes = max_cache_bytes
+            self.min_gzip_size = min_gzip_size
+
+            self.dict_assets = collections.OrderedDict()
+            self.cached_bytes = 0
+            self.lock = threading.Lock()
+
+            self.number_of_hits = 0
+            self.number_of_misses = 0
+            self.number_of_not_modified = 0
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, 'StaticAssetHandler')
+
+    def get_asset(self, file_path, file_stat):
+        """
+        This method returns the cached asset, reading the file again if it has changed. The least recently used assets
+        are evicted to make room for the new ones.
+
+        :param file_path: (String) The absolute file path
+        :param file_stat: (os.stat_result) The current file stat
+        :return: (StaticAsset) The asset
+        """
+        with self.lock:
+            asset = self.dict_assets.get(file_path)
+            if asset is not None:
+                if asset.is_valid(file_stat):
+                    self.dict_assets.move_to_end(file_path)
+                    self.number_of_hits += 1
+                    return asset
+
+                # the file has changed: the stale content is not kept until it is read again
+                del self.dict_assets[file_path]
+                self.cached_bytes -= asset.size
+
+        with open(file_path, 'rb') as file_handler:
+            asset = StaticAsset(file_path, file_stat, file_handler.read(), self.min_gzip_size)
+
+        with self.lock:
+            self.number_of_misses += 1
+            previous_asset = self.dict_assets.pop(file_path, None)
+            if previous_asset is not None:
+                self.cached_bytes -= previous_asset.size
+
+            if asset.size <= self.max_cache_bytes:
+                while self.cached_bytes + asset.size > self.max_cache_bytes:
+                    (_, evicted_asset) = self.dict_assets.popitem(last=False)
+                    self.cached_bytes -= evicted_asset.size
+
+                self.dict_assets[file_path] = asset
+                self.cached_bytes += asset.size
+
+        return asset
+
+    def serve(self, file_path):
+        """
+        This method answers the current CherryPy request with a file
+
+        :param file_path: (String) The file path
+        :return: (Bytes / file object) The response body
+        """
+        file_path = os.path.abspath(file_path)
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            raise cherrypy.NotFound()
+
+        if not os.path.isfile(file_path):
+            raise cherrypy.NotFound()
+
+        request = cherrypy.serving.request
+        response = cherrypy.serving.response
+        is_gzip_accepted = is_encoding_accepted(request.headers.get('Accept-Encoding', ''), 'gzip')
+
+        if file_stat.st_size <= self.max_cached_size:
+            asset = self.get_asset(file_path, file_stat)
+            is_gzip = is_gzip_accepted and asset.gzip_content is not None
+            self.set_validators(file_stat, is_gzip, asset.gzip_content is not None)
+            if self.is_not_modified(file_stat):
+                return b''
+
+            response.headers['Content-Type'] = asset.content_type
+            if is_gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+            content = asset.gzip_content if is_gzip else asset.content
+            response.headers['Content-Length'] = len(content)
+            return content
+
+        # a precompressed variant (\"<file>.gz\", newer than the file) is sent as is to the clients that accept it
+        gzip_file_path = file_path + '.gz'
+        is_gzip = is_gzip_accepted and 'Range' not in request.headers and os.path.isfile(gzip_file_path) and \
+            os.stat(gzip_file_path).st_mtime_ns >= file_stat.st_mtime_ns
+        self.set_validators(file_stat, is_gzip, os.path.isfile(gzip_file_path))
+        if self.is_not_modified(file_stat):
+            return b''
+
+        if is_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+            body = static.serve_file(gzip_file_path, get_content_type(file_path))
+            # \"serve_file\" sets the modification time of the \".gz\" file, the validators are the ones of the asset
+            response.headers['Last-Modified'] = email.utils.formatdate(file_stat.st_mtime, usegmt=True)
+            return body
+
+        return static.serve_file(file_path, get_content_type(file_path))
+
+    @staticmethod
+    def set_validators(file_stat, is_gzip, has_gzip_variant):
+        """
+        This method sets the ETag, Last-Modified and caching headers of the current response
+
+        :param file_stat: (os.stat_result) The file stat
+        :param is_gzip: (Boolean) Whether or not the gzip variant is sent
+        :param has_gzip_variant: (Boolean) Whether or not the answer depends on the \"Accept-Encoding\" header
+        :return: Boolean (True or False)
+        """
+        headers = cherrypy.serving.response.headers
+        headers['ETag'] = '"%x-%x%s"' % (file_stat.st_mtime_ns, file_stat.st_size, '-gzip' if is_gzip else '')
+        headers['Last-Modified'] = email.utils.formatdate(file_stat.st_mtime, usegmt=True)
+        # the clients may keep the file, but they have to revalidate it (which is answered with a 304)
+        headers['Cache-Control'] = 'no-cache'
+        if has_gzip_variant:
+            headers['Vary'] = 'Accept-Encoding'
+
+        return True
+
+    def is_not_modified(self, file_stat):
+        """
+        This method checks the conditional headers of the current request (\"If-None-Match\" first, then
+        \"If-Modified-Since\") and turns the response into a \"304 Not Modified\" if the client copy is current
+
+        :param file_stat: (os.stat_result) The file stat
+        :return: Boolean (True or False)
+        """
+        request = cherrypy.serving.request
+        response = cherrypy.serving.response
+        if request.method not in ('GET', 'HEAD'):
+            return False
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            list_etags = [etag.strip() for etag in if_none_match.split(',')]
+            list_etags = [etag[2:] if etag.startswith('W/') else etag for etag in list_etags]
+            is_not_modified = '*' in list_etags or response.headers['ETag'] in list_etags
+        else:
+            try:
+                since = email.utils.parsedate_to_datetime(request.headers.get('If-Modified-Since', ''))
+                is_not_modified = int(file_stat.st_mtime) <= since.timestamp()
+            except (TypeError, ValueError):
+                is_not_modified = False
+
+        if is_not_modified:
+            with self.lock:
+                self.number_of_not_modified += 1
+            response.status = 304
+            response.headers.pop('Content-Type', None)
+
+        return is_not_modified
+
+    def get_stats(self):
+        """
+        This method returns the static asset statistics
+
+        :return: (Dictionary) The cache size and the number of hits, misses and \"304\" answers
+        """
+        with self.lock:
+            return {
+                'cached_assets': len(self.dict_assets),
+                'cached_bytes': self.cached_bytes,
+                'number_of_hits': self.number_of_hits,
+                'number_of_misses': self.number_of_misses,
+                'number_of_not_modified': self.number_of_not_modified
+            }
+
+
+static_asset_handler = StaticAssetHandler()
+# endregion StaticAssetHandler
+
+
+# region local functions
+def get_content_type(file_path):
+    """
+    This function guesses the content type of a file from its extension
+
+    :param file_path: (String) The file path
+    :return: (String) The content type
+    """
+    if file_path.lower().endswith('.mjpeg'):
+        return 'video/x-motion-jpeg'
+    if file_path.lower().endswith('.h264'):
+        return 'video/h264'
+
+    content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+    return content_type + '; charset=utf-8' if content_type == 'text/html' else content_type
+
+
+def is_encoding_accepted(accept_encoding, encoding):
+    """
+    This function checks whether or not an \"Accept-Encoding\" header accepts a content coding (its quality value,
+    or the one of \"*\" if it is not listed, is above 0)
+
+    :param accept_encoding: (String) The \"Accept-Encoding\" header (e.g. \"gzip;q=0, deflate\")
+    :param encoding: (String) The content coding
+    :return: Boolean (True or False)
+    """
+    dict_qualities = {}
+    for coding in accept_encoding.split(','):
+        (name, _, parameters) = coding.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+
+        quality = 1.0
+        for parameter in parameters.split(';'):
+            (key, _, value) = parameter.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        dict_qualities[name] = quality
+
+    return dict_qualities.get(encoding, dict_qualities.get('*', 0.0)) > 0
+
+
+def is_compressible(content_type):
+    """
+    This function checks whether or not a content type is worth compressing (text, JSON, JavaScript, SVG)
+
+    :param content_type: (String) The content type
+    :return: Boolean (True or False)
+    """
+    return content_type.startswith('text/') or content_type.split(';')[0] in ('application/json',
+                                                                              'application/javascript',
+                                                                              'image/svg+xml')
+# endregion local functions
@@ -0,0 +1,527 @@
+"""
+This file has the trajectory functionality (timed keyframe sequences that are played by a server-side scheduler)
+"""
+
+# region imports
+import math
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from servo import ServoMotorHandler, dict_servo_motors
+from actuator import actuator_handler
+from motion_profile import motion_profile_handler
+from globals import console, rest_error_message_handler
+# endregion imports
+
+
+# region TrajectoryJob
+class TrajectoryJob(object):
+    """
+    This class holds a compiled trajectory (one duty cycle sample per motor for every scheduler tick) and its progress
+    """
+
+    def __init__(self, motor_names, samples, rate):
+        """
+        This constructor initializes the trajectory job
+
+        :param motor_names: (List) The names of the motors (keys of \"dict_servo_motors\") driven by the trajectory
+        :param samples: (numpy.ndarray) The duty cycles with the shape (number of ticks, number of motors)
+        :param rate: (Float) The scheduler rate in Hz
+        """
+        self.job_id = uuid.uuid4().hex
+        self.motor_names = motor_names
+        self.samples = samples
+        self.rate = rate
+
+        self.status = 'queued'
+        self.current_tick = 0
+        self.skipped_ticks = 0
+        self.error_message = None
+
+        self.created_time = time.time()
+        self.started_time = None
+        self.finished_time = None
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def is_active(self):
+        """
+        This method checks whether or not the job is still queued or running
+
+        :return: Boolean (True or False)
+        """
+        return self.status in ('queued', 'running')
+
+    def get_progress(self):
+        """
+        This method returns the current progress of the trajectory job
+
+        :return: (Dictionary) The job status, its progress and timing information
+        """
+        number_of_ticks = len(self.samples)
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'motors': self.motor_names,
+            'rate': self.rate,
+            'current_tick': self.current_tick,
+            'number_of_ticks': number_of_ticks,
+            'skipped_ticks': self.skipped_ticks,
+            'progress': (self.current_tick / (number_of_ticks - 1)) if number_of_ticks > 1 else 1.0,
+            'duration': (number_of_ticks - 1) / self.rate,
+            'created_time': self.created_time,
+            'started_time': self.started_time,
+            'finished_time': self.finished_time,
+            'error_message': self.error_message
+        }
+
+
+# endregion TrajectoryJob
+
+
+# region TrajectoryHandler
+class TrajectoryHandler(object):
+    """
+    This class compiles keyframe sequences into duty cycle samples and plays them on a fixed-rate scheduler
+    """
+
+    def __init__(self, rate=50, max_finished_jobs=100, max_duration=600, max_ticks=30001):
+        """
+        This constructor initializes the trajectory handler
+
+        :param rate: (Float) The default scheduler rate in Hz (one PWM period at 50 Hz)
+        :param max_finished_jobs: (Integer) The number of finished jobs kept for progress queries
+        :param max_duration: (Float) The maximum duration of a trajectory, in seconds
+        :param max_ticks: (Integer) The maximum number of scheduler ticks (samples) of a trajectory
+        """
+        try:
+            self.rate = rate
+            self.max_finished_jobs = max_finished_jobs
+            self.max_duration = max_duration
+            self.max_ticks = max_ticks
+
+            self.dict_jobs = {}
+            self.lock = threading.Lock()
+
+            self.fault_listeners = []
+
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, 'TrajectoryHandler')
+
+    def compile_keyframes(self, keyframes, rate):
+        """
+        This method turns a list of keyframes into one duty cycle sample per motor for every scheduler tick. Every motor
+        is linearly interpolated between the keyframes that mention it and holds its value outside of them.
+
+        :param keyframes: (List) The keyframes, ordered by time
+            [{
+                'time': <Number> (seconds from the start of the trajectory),
+                'motors': [{
+                    'name': <String>,
+                    'duty_cycle': <Number>
+                }]
+            }]
+        :param rate: (Float) The scheduler rate in Hz
+        :return: (Tuple) The motor names and the samples (numpy.ndarray) or False
+        """
+        try:
+            if not isinstance(keyframes, list) or len(keyframes) == 0:
+                console.log('The trajectory should contain at least one keyframe.', console.LOG_WARNING,
+                            self.compile_keyframes.__name__)
+                return False
+
+            dict_tracks = {}
+            last_time = -1
+            for keyframe in keyframes:
+                mandatory_keys = {'time', 'motors'}
+                if not mandatory_keys.issubset(keyframe):
+                    console.log('Invalid keyframe keys. They should be %s.' % str(mandatory_keys), console.LOG_WARNING,
+                                self.compile_keyframes.__name__)
+                    return False
+
+                keyframe_time = float(keyframe['time'])
+                if not math.isfinite(keyframe_time) or keyframe_time < 0 or keyframe_time <= last_time:
+                    console.log('The keyframe times should be positive and strictly increasing.', console.LOG_WARNING,
+                                self.compile_keyframes.__name__)
+                    return False
+                last_time = keyframe_time
+
+                for motor in keyframe['motors']:
+                    if motor['name'] not in dict_servo_motors:
+                        console.log('Unknown motor %s.' % str(motor['name']), console.LOG_WARNING,
+                                    self.compile_keyframes.__name__)
+                        return False
+
+                    duty_cycle = float(motor['duty_cycle'])
+                    if not ServoMotorHandler.is_valid_duty_cycle(duty_cycle):
+                        console.log('Invalid duty cycle %s for motor %s. It should be between [0 - 100].'
+                                    % (str(duty_cycle), motor['name']),
+                                    console.LOG_WARNING,
+                                    self.compile_keyframes.__name__)
+                        return False
+
+                    dict_tracks.setdefault(motor['name'], ([], []))
+                    dict_tracks[motor['name']][0].append(keyframe_time)
+                    dict_tracks[motor['name']][1].append(duty_cycle)
+
+            if len(dict_tracks) == 0:
+                console.log('The trajectory does not drive any motor.', console.LOG_WARNING,
+                            self.compile_keyframes.__name__)
+                return False
+
+            if self.check_duration(last_time, rate) is False:
+                return False
+
+            number_of_ticks = int(np.ceil(last_time * rate)) + 1
+            tick_times = np.minimum(np.arange(number_of_ticks) / rate, last_time)
+
+            motor_names = list(dict_tracks.keys())
+            samples = np.empty((number_of_ticks, len(motor_names)))
+            for (index, name) in enumerate(motor_names):
+                (track_times, track_duty_cycles) = dict_tracks[name]
+                if track_times[0] > 0:
+                    # the motor starts moving from wherever it currently is
+                    track_times = [0.0] + track_times
+                    track_duty_cycles = [float(dict_servo_motors[name].duty_cycle)] + track_duty_cycles
+
+                samples[:, index] = np.interp(tick_times, track_times, track_duty_cycles)
+
+            return motor_names, samples
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.compile_keyframes.__name__)
+            return False
+
+    def compile_moves(self, moves, rate):
+        """
+        This method turns a list of simultaneous moves into one duty cycle sample per motor for every scheduler tick.
+        Every motor follows its own (cached) motion profile and holds the target once it is reached.
+
+        :param moves: (List) The moves, at most one per motor
+            [{
+                'name': <String>,
+                'duty_cycle': <Number> (the target duty cycle),
+                'max_velocity': <Number> (duty cycle units per second),
+                'max_acceleration': <Number> (duty cycle units per second squared),
+                'profile': <String> (Optional: \"trapezoidal\" or \"minimum_jerk\")
+            }]
+        :param rate: (Float) The scheduler rate in Hz
+        :return: (Tuple) The motor names and the samples (numpy.ndarray) or False
+        """
+        try:
+            if not isinstance(moves, list) or len(moves) == 0:
+                console.log('The trajectory should contain at least one move.', console.LOG_WARNING,
+                            self.compile_moves.__name__)
+                return False
+
+            motor_names = []
+            profiles = []
+            for move in moves:
+                mandatory_keys = {'name', 'duty_cycle', 'max_velocity', 'max_acceleration'}
+                if not mandatory_keys.issubset(move):
+                    console.log('Invalid move keys. They should be %s.' % str(mandatory_keys), console.LOG_WARNING,
+                                self.compile_moves.__name__)
+                    return False
+
+                if move['name'] not in dict_servo_motors or move['name'] in motor_names:
+                    console.log('Unknown or duplicated motor %s.' % str(move['name']), console.LOG_WARNING,
+                                self.compile_moves.__name__)
+                    return False
+
+                target_duty_cycle = float(move['duty_cycle'])
+                if not ServoMotorHandler.is_valid_duty_cycle(target_duty_cycle):
+                    console.log('Invalid duty cycle %s for motor %s. It should be between [0 - 100].'
+                                % (str(target_duty_cycle), move['name']),
+                                console.LOG_WARNING,
+                                self.compile_moves.__name__)
+                    return False
+
+                # the duration is bounded before the samples are computed
+                start_duty_cycle = float(dict_servo_motors[move['name']].duty_cycle)
+                duration = motion_profile_handler.get_duration(abs(target_duty_cycle - start_duty_cycle),
+                                                               float(move['max_velocity']),
+                                                               float(move['max_acceleration']),
+                                                               move.get('profile', 'trapezoidal'))
+                if duration is False or self.check_duration(duration, rate) is False:
+                    return False
+
+                profile = motion_profile_handler.get_profile(start_duty_cycle,
+                                                             target_duty_cycle,
+                                                             float(move['max_velocity']),
+                                                             float(move['max_acceleration']),
+                                                             move.get('profile', 'trapezoidal'),
+                                                             rate)
+                if profile is False:
+                    return False
+
+                motor_names.append(move['name'])
+                profiles.append(profile)
+
+            samples = np.empty((max(len(profile) for profile in profiles), len(motor_names)))
+            for (index, profile) in enumerate(profiles):
+                samples[:len(profile), index] = profile
+                samples[len(profile):, index] = profile[-1]
+
+            return motor_names, samples
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.compile_moves.__name__)
+            return False
+
+    def check_duration(self, duration, rate):
+        """
+        This method checks that a trajectory of \"duration\" seconds, played at \"rate\" Hz, is short enough (it holds
+        its motors while it plays, and its samples are allocated at once)
+
+        :param duration: (Float) The duration in seconds
+        :param rate: (Float) The scheduler rate in Hz
+        :return: Boolean (True or False)
+        """
+        if not 0 <= duration <= self.max_duration:
+            console.log('The trajectory lasts %s seconds. It should last at most %s seconds.'
+                        % (str(duration), str(self.max_duration)),
+                        console.LOG_WARNING,
+                        self.check_duration.__name__)
+            return False
+
+        # at a low rate, the last tick may come much later than the end of the trajectory
+        number_of_ticks = int(np.ceil(duration * rate)) + 1
+        if number_of_ticks > self.max_ticks or (number_of_ticks - 1) / rate > self.max_duration:
+            console.log('The trajectory has %d ticks at %s Hz. It should have at most %d ticks and last at most %s '
+                        'seconds.' % (number_of_ticks, str(rate), self.max_ticks, str(self.max_duration)),
+                        console.LOG_WARNING,
+                        self.check_duration.__name__)
+            return False
+
+        return True
+
+    def start_trajectory(self, input_json):
+        """
+        This method compiles a trajectory and starts playing it in the background
+
+        :param input_json: (Dictionary) The JSON received that contains the trajectory
+            {
+                'keyframes': <List> (see \"compile_keyframes\") or 'moves': <List> (see \"compile_moves\"),
+                'rate': <Number> (Optional, in Hz, at most the PWM frequency of the motors)
+            }
+        :return: (String) The job id or False
+        """
+        try:
+            if 'keyframes' not in input_json and 'moves' not in input_json:
+                console.log('Invalid keys. The JSON should contain either the \'keyframes\' or the \'moves\' key.',
+                            console.LOG_WARNING,
+                            self.start_trajectory.__name__)
+                return False
+
+            rate = float(input_json.get('rate', self.rate))
+            if not rate > 0:
+                console.log('Invalid rate %s. It should be positive.' % str(rate), console.LOG_WARNING,
+                            self.start_trajectory.__name__)
+                return False
+
+            # the motors are not updated more than once per PWM period
+            rate = min(rate, min(servo_motor.frequency for servo_motor in dict_servo_motors.values()))
+
+            if 'keyframes' in input_json:
+                compiled_trajectory = self.compile_keyframes(input_json['keyframes'], rate)
+            else:
+                compiled_trajectory = self.compile_moves(input_json['moves'], rate)
+
+            if compiled_trajectory is False:
+                return False
+
+            (motor_names, samples) = compiled_trajectory
+            for name in motor_names:
+                if dict_servo_motors[name].pwn_handler is None:
+                    console.log('The motor %s has not been initialized.' % name, console.LOG_WARNING,
+                                self.start_trajectory.__name__)
+                    return False
+
+            job = TrajectoryJob(motor_names, samples, rate)
+            with self.lock:
+                for other_job in self.dict_jobs.values():
+                    busy_motors = set(other_job.motor_names).intersection(motor_names)
+                    if other_job.is_active() and len(busy_motors) > 0:
+                        console.log('The motors %s are already used by the trajectory %s.'
+                                    % (str(sorted(busy_motors)), other_job.job_id),
+                                    console.LOG_WARNING,
+                                    self.start_trajectory.__name__)
+                        return False
+
+                self.remove_finished_jobs()
+                self.dict_jobs[job.job_id] = job
+
+            job.thread = threading.Thread(target=self.run_job, args=(job,), daemon=True)
+            job.thread.start()
+
+            return job.job_id
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.start_trajectory.__name__)
+            return False
+
+    def run_job(self, job):
+        """
+        This method plays a trajectory job. Every tick is scheduled against the start time (not the previous tick), so
+        late ticks are skipped instead of delaying the rest of the motion.
+
+        :param job: (TrajectoryJob) The job that is being played
+        :return: Boolean (True or False)
+        """
+        try:
+            motors = [dict_servo_motors[name] for name in job.motor_names]
+            number_of_ticks = len(job.samples)
+
+            job.status = 'running'
+            job.started_time = time.time()
+            start_time = time.monotonic()
+
+            tick = 0
+            while tick < number_of_ticks:
+                if actuator_handler.execute('trajectory_tick', self.apply_tick, motors,
+                                            job.samples[tick].tolist()) is False:
+                    if job.stop_event.is_set():
+                        # the tick has been cancelled by a stop
+                        job.status = 'cancelled'
+                        return False
+
+                    raise RuntimeError('Could not update the duty cycles of the motors %s: %s' %
+                                       (str(job.motor_names), str(rest_error_message_handler.get_last_error_message())))
+                job.current_tick = tick
+
+                if tick == number_of_ticks - 1:
+                    break
+
+                next_tick = max(tick + 1, int((time.monotonic() - start_time) * job.rate))
+                next_tick = min(next_tick, number_of_ticks - 1)
+                job.skipped_ticks += next_tick - tick - 1
+                tick = next_tick
+
+                delay = start_time + tick / job.rate - time.monotonic()
+                if job.stop_event.wait(max(delay, 0)):
+                    job.status = 'cancelled'
+                    return False
+
+            job.status = 'finished'
+            return True
+        except Exception as error_message:
+            job.status = 'failed'
+            job.error_message = str(error_message)
+            console.log(error_message, console.LOG_ERROR, self.run_job.__name__)
+            for listener in list(self.fault_listeners):
+                listener(job)
+            return False
+        finally:
+            job.finished_time = time.time()
+
+    @staticmethod
+    def apply_tick(motors, duty_cycles):
+        """
+        This method applies the duty cycles of one trajectory tick (it runs in the actuator thread)
+
+        :param motors: (List) The servo motors
+        :param duty_cycles: (List) The duty cycles (one per motor)
+        :return: Boolean (True or False)
+        """
+        for (motor, duty_cycle) in zip(motors, duty_cycles):
+            if motor.set_gpio_pin_duty_cycle(duty_cycle) is False:
+                return False
+
+        return True
+
+    def get_progress(self, job_id=None):
+        """
+        This method returns the progress of a trajectory job (or of all of them)
+
+        :param job_id: (String) The job id (if None, the progress of every job is returned)
+        :return: (Dictionary / List) The job progress or False
+        """
+        try:
+            if job_id is None:
+                return [job.get_progress() for job in list(self.dict_jobs.values())]
+
+            if job_id not in self.dict_jobs:
+                console.log('Unknown trajectory %s.' % str(job_id), console.LOG_WARNING, self.get_progress.__name__)
+                return False
+
+            return self.dict_jobs[job_id].get_progress()
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.get_progress.__name__)
+            return False
+
+    def cancel_trajectory(self, job_id):
+        """
+        This method stops a trajectory job (the motors keep their last duty cycle)
+
+        :param job_id: (String) The job id
+        :return: Boolean (True or False)
+        """
+        try:
+            if job_id not in self.dict_jobs:
+                console.log('Unknown trajectory %s.' % str(job_id), console.LOG_WARNING,
+                            self.cancel_trajectory.__name__)
+                return False
+
+            job = self.dict_jobs[job_id]
+            job.stop_event.set()
+            if job.thread is not None:
+                job.thread.join()
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.cancel_trajectory.__name__)
+            return False
+
+    def stop_trajectories(self):
+        """
+        This method tells every active trajectory job to stop, without waiting for their threads (used by the
+        emergency stop, which cancels their queued ticks)
+
+        :return: (Integer) The number of stopped jobs
+        """
+        try:
+            list_jobs = [job for job in list(self.dict_jobs.values()) if job.is_active()]
+            for job in list_jobs:
+                job.stop_event.set()
+
+            return len(list_jobs)
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.stop_trajectories.__name__)
+            return False
+
+    def add_fault_listener(self, listener):
+        """
+        This method registers a function that is called with the job whenever a trajectory fails on a motor
+
+        :param listener: (Function) The function, called as listener(job)
+        :return: Boolean (True or False)
+        """
+        try:
+            self.fault_listeners.append(listener)
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.add_fault_listener.__name__)
+            return False
+
+    def remove_finished_jobs(self):
+        """
+        This method forgets the oldest finished jobs once there are more than \"max_finished_jobs\" of them
+
+        :return: Boolean (True or False)
+        """
+        try:
+            finished_jobs = [job for job in self.dict_jobs.values() if not job.is_active()]
+            finished_jobs.sort(key=lambda job: job.created_time)
+
+            for job in finished_jobs[:max(len(finished_jobs) - self.max_finished_jobs, 0)]:
+                del self.dict_jobs[job.job_id]
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.remove_finished_jobs.__name__)
+            return False
+
+
+trajectory_handler = TrajectoryHandler()
+# endregion TrajectoryHandler
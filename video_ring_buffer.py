@@ -0,0 +1,318 @@
+"""
+This file has the video ring buffer (the camera keeps recording the last seconds into memory, and a trigger saves them,
+along with the following seconds, into the \"videos\" folder)
+"""
+
+# region imports
+import collections
+import datetime
+import os
+import queue
+import threading
+import time
+
+from globals import console
+# endregion imports
+
+
+# region VideoClip
+class VideoClip(object):
+    """
+    This class holds the frames of a triggered clip until it is complete and saved
+    """
+
+    def __init__(self, file_path, reason, frames, end_time):
+        """
+        This constructor initializes the clip
+
+        :param file_path: (String) The file the clip is saved to
+        :param reason: (String) Why the clip was triggered (e.g. \"rest\", \"move\", \"motor_fault\")
+        :param frames: (List) The (timestamp, JPEG bytes) frames recorded before the trigger
+        :param end_time: (Float) The monotonic time at which the clip ends
+        """
+        self.file_path = file_path
+        self.reason = reason
+        self.frames = frames
+        self.end_time = end_time
+        self.status = 'recording'
+        self.number_of_saved_frames = None
+
+    def get_status(self):
+        """
+        This method returns the clip status
+
+        :return: (Dictionary) The file path, the reason, the status and the number of frames
+        """
+        number_of_frames = len(self.frames) if self.number_of_saved_frames is None else self.number_of_saved_frames
+        return {
+            'file_path': self.file_path,
+            'reason': self.reason,
+            'status': self.status,
+            'number_of_frames': number_of_frames
+        }
+
+
+# endregion VideoClip
+
+
+# region VideoRingBuffer
+class VideoRingBuffer(object):
+    """
+    This class records the JPEG frames of the live stream producer into a circular buffer that is limited both in duration
+    and in bytes, so its memory use does not grow with the server uptime. The frames held by the clips that are not
+    saved yet count against the same byte budget.
+    """
+
+    def __init__(self, seconds=10, max_bytes=32 * 1024 * 1024, videos_folder='./videos', max_seconds_after=30,
+                 max_pending_clips=4):
+        """
+        This constructor initializes the video ring buffer
+
+        :param seconds: (Float) The number of seconds kept in memory
+        :param max_bytes: (Integer) The maximum size of the buffered frames, in bytes
+        :param videos_folder: (String) The folder in which the clips are saved
+        :param max_seconds_after: (Float) The maximum number of seconds a clip records after its trigger
+        :param max_pending_clips: (Integer) The maximum number of clips recording at the same time
+        """
+        try:
+            self.seconds = seconds
+            self.max_bytes = max_bytes
+            self.videos_folder = videos_folder
+            self.max_seconds_after = max_seconds_after
+            self.max_pending_clips = max_pending_clips
+
+            self.frames = collections.deque()
+            self.buffered_bytes = 0
+            self.number_of_frames = 0
+            self.number_of_evicted_frames = 0
+
+            self.pending_clips = []
+            self.unsaved_clips = []
+            self.clip_bytes = 0
+            self.dict_clips = collections.OrderedDict()
+            self.max_clips = 100
+            self.write_queue = queue.Queue()
+
+            self.lock = threading.Lock()
+            self.frame_source = None
+            self.writer_thread = None
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, 'VideoRingBuffer')
+
+    def start(self, frame_source):
+        """
+        This method starts recording into the ring buffer. The frames come from the live stream producer, so the ring
+        buffer does not need a camera video port of its own.
+
+        :param frame_source: (LiveStreamHandler) The producer of the JPEG frames
+        :return: Boolean (True or False)
+        """
+        try:
+            if self.frame_source is not None:
+                console.log('The video ring buffer is already recording.', console.LOG_WARNING, self.start.__name__)
+                return False
+
+            if self.writer_thread is None:
+                self.writer_thread = threading.Thread(target=self.write_clips, daemon=True)
+                self.writer_thread.start()
+
+            self.frame_source = frame_source
+            return self.frame_source.add_listener(self.add_frame)
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.start.__name__)
+            return False
+
+    def stop(self):
+        """
+        This method stops the recording (the triggered clips are saved with the frames recorded so far)
+
+        :return: Boolean (True or False)
+        """
+        try:
+            if self.frame_source is not None:
+                self.frame_source.remove_listener(self.add_frame)
+                self.frame_source = None
+
+            with self.lock:
+                for clip in self.pending_clips:
+                    self.write_queue.put(clip)
+                self.pending_clips = []
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.stop.__name__)
+            return False
+
+    def add_frame(self, timestamp, frame):
+        """
+        This method appends a frame to the ring buffer, evicting the frames that are too old or over the byte budget,
+        and hands it to the clips that are still recording. The evicted frames that an unsaved clip still holds move to
+        the clip bytes. If the budget is still exceeded, the recording clips are ended early.
+
+        :param timestamp: (Float) The monotonic capture time
+        :param frame: (Bytes) The JPEG frame
+        :return: Boolean (True or False)
+        """
+        with self.lock:
+            self.frames.append((timestamp, frame))
+            self.buffered_bytes += len(frame)
+            self.number_of_frames += 1
+
+            # evicting a frame held by a clip does not free any memory, so only the old frames are evicted then
+            while len(self.frames) > 1 and (self.frames[0][0] < timestamp - self.seconds or
+                                            (self.buffered_bytes + self.clip_bytes > self.max_bytes and
+                                             not self.is_held_by_clip(self.frames[0][0]))):
+                (evicted_timestamp, evicted_frame) = self.frames.popleft()
+                self.buffered_bytes -= len(evicted_frame)
+                self.number_of_evicted_frames += 1
+                if self.is_held_by_clip(evicted_timestamp):
+                    self.clip_bytes += len(evicted_frame)
+
+            is_over_budget = self.buffered_bytes + self.clip_bytes > self.max_bytes
+            for clip in list(self.pending_clips):
+                if timestamp <= clip.end_time and not is_over_budget:
+                    clip.frames.append((timestamp, frame))
+                else:
+                    if is_over_budget:
+                        console.log('The clip %s has been ended early, the video buffer is full (%d bytes).' %
+                                    (clip.file_path, self.buffered_bytes + self.clip_bytes),
+                                    console.LOG_WARNING,
+                                    self.add_frame.__name__)
+                    self.pending_clips.remove(clip)
+                    clip.status = 'writing'
+                    self.write_queue.put(clip)
+
+        return True
+
+    def is_held_by_clip(self, timestamp, excluded_clip=None):
+        """
+        This method checks if a frame is held by a clip that is not saved yet (a clip holds every frame recorded
+        between its first and its last frame). The lock must be held.
+
+        :param timestamp: (Float) The monotonic capture time of the frame
+        :param excluded_clip: (VideoClip) A clip that is not checked
+        :return: Boolean (True or False)
+        """
+        return any(len(clip.frames) > 0 and clip.frames[0][0] <= timestamp <= clip.frames[-1][0]
+                   for clip in self.unsaved_clips if clip is not excluded_clip)
+
+    def release_clip(self, clip):
+        """
+        This method releases the frames of a saved clip that are neither in the ring buffer nor in another unsaved clip
+
+        :param clip: (VideoClip) The saved clip
+        :return: Boolean (True or False)
+        """
+        with self.lock:
+            oldest_timestamp = self.frames[0][0] if len(self.frames) > 0 else float('inf')
+            for (timestamp, frame) in clip.frames:
+                if timestamp < oldest_timestamp and not self.is_held_by_clip(timestamp, clip):
+                    self.clip_bytes -= len(frame)
+
+            self.unsaved_clips.remove(clip)
+            clip.number_of_saved_frames = len(clip.frames)
+            clip.frames = []
+
+        return True
+
+    def trigger(self, reason='rest', seconds_before=None, seconds_after=5):
+        """
+        This method saves the last \"seconds_before\" seconds and the next \"seconds_after\" seconds into a clip. It
+        returns right away, the clip is saved in the background once it is complete.
+
+        :param reason: (String) Why the clip was triggered (part of the file name)
+        :param seconds_before: (Float) The seconds recorded before the trigger (Default: the whole buffer)
+        :param seconds_after: (Float) The seconds recorded after the trigger
+        :return: (Dictionary) The clip status or False
+        """
+        try:
+            if self.frame_source is None:
+                console.log('The video ring buffer is not recording.', console.LOG_WARNING, self.trigger.__name__)
+                return False
+
+            seconds_before = self.seconds if seconds_before is None else min(float(seconds_before), self.seconds)
+            seconds_after = min(max(float(seconds_after), 0), self.max_seconds_after)
+
+            current_time = time.monotonic()
+            file_name = 'clip_%s_%s.mjpeg' % (datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f'),
+                                              ''.join(character for character in str(reason)
+                                                      if character.isalnum() or character in '-_'))
+
+            with self.lock:
+                if self.is_clip_limit_reached():
+                    console.log('Too many clips are recording (%d). The clip has not been triggered.' %
+                                len(self.pending_clips),
+                                console.LOG_WARNING,
+                                self.trigger.__name__)
+                    return False
+
+                frames = [(timestamp, frame) for (timestamp, frame) in self.frames
+                          if timestamp >= current_time - seconds_before]
+                clip = VideoClip(os.path.join(self.videos_folder, file_name), reason, frames,
+                                 current_time + seconds_after)
+                self.pending_clips.append(clip)
+                self.unsaved_clips.append(clip)
+
+                self.dict_clips[clip.file_path] = clip
+                while len(self.dict_clips) > self.max_clips:
+                    self.dict_clips.popitem(last=False)
+
+            return clip.get_status()
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.trigger.__name__)
+            return False
+
+    def is_clip_limit_reached(self):
+        """
+        This method checks if the maximum number of clips are recording
+
+        :return: Boolean (True or False)
+        """
+        return len(self.pending_clips) >= self.max_pending_clips
+
+    def write_clips(self):
+        """
+        This method saves the completed clips as a stream of JPEG frames (it runs in the writer thread)
+
+        :return: Boolean (True or False)
+        """
+        while True:
+            clip = self.write_queue.get()
+            try:
+                with open(clip.file_path, 'wb') as file_handler:
+                    for (_, frame) in clip.frames:
+                        file_handler.write(frame)
+
+                clip.status = 'saved'
+                console.log('The clip %s has been saved (%d frames).' % (clip.file_path, len(clip.frames)),
+                            console.LOG_SUCCESS,
+                            self.write_clips.__name__)
+            except Exception as error_message:
+                clip.status = 'failed'
+                console.log(error_message, console.LOG_ERROR, self.write_clips.__name__)
+            finally:
+                self.release_clip(clip)
+                self.write_queue.task_done()
+
+    def get_stats(self):
+        """
+        This method returns the ring buffer statistics and the status of the last clips
+
+        :return: (Dictionary) The ring buffer statistics
+        """
+        with self.lock:
+            return {
+                'is_recording': self.frame_source is not None,
+                'buffered_frames': len(self.frames),
+                'buffered_bytes': self.buffered_bytes,
+                'buffered_seconds': (self.frames[-1][0] - self.frames[0][0]) if len(self.frames) > 1 else 0,
+                'clip_bytes': self.clip_bytes,
+                'pending_clips': len(self.pending_clips),
+                'number_of_frames': self.number_of_frames,
+                'number_of_evicted_frames': self.number_of_evicted_frames,
+                'clips': [clip.get_status() for clip in self.dict_clips.values()]
+            }
+
+
+video_ring_buffer = VideoRingBuffer()
+# endregion VideoRingBuffer
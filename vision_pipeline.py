@@ -0,0 +1,538 @@
+"""
+This file has the streaming vision pipeline (capture -> decode / resize -> corner detection -> geometry), in which
+every stage runs in its own thread and is connected to the next one by a bounded frame queue
+"""
+
+# region imports
+import collections
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from opencv import openCV_handler
+from corner_tracker import CornerTracker
+from globals import console
+# endregion imports
+
+
+# region Frame
+class Frame(object):
+    """
+    This class holds a frame while it moves through the pipeline stages
+    """
+
+    def __init__(self, index, source, data):
+        """
+        This constructor initializes the frame
+
+        :param index: (Integer) The index of the frame in its source
+        :param source: (String) The name of the frame source (\"camera\", an image path or a video path)
+        :param data: (numpy.ndarray / String) The raw frame (an image array or the path of an image file)
+        """
+        self.index = index
+        self.source = source
+        self.data = data
+        self.captured_time = time.monotonic()
+
+        self.image = None
+        self.inner_corners = None
+        self.lattice = None
+        self.chessboard_positions = None
+        self.rectified_image = None
+
+    def get_latency(self):
+        """
+        This method returns the time elapsed since the frame was captured
+
+        :return: (Float) The latency in seconds
+        """
+        return time.monotonic() - self.captured_time
+
+
+# endregion Frame
+
+
+# region FrameQueue
+class FrameQueue(object):
+    """
+    This class is a bounded queue between two pipeline stages. When it is full, it either drops the oldest queued frame
+    (\"drop_oldest\", the consumer always sees the latest frames) or the incoming one (\"drop_newest\").
+    """
+    POLICIES = ('drop_oldest', 'drop_newest')
+
+    def __init__(self, max_size=2, policy='drop_oldest'):
+        """
+        This constructor initializes the frame queue
+
+        :param max_size: (Integer) The maximum number of queued frames
+        :param policy: (String) The backpressure policy (\"drop_oldest\" or \"drop_newest\")
+        """
+        if policy not in self.POLICIES:
+            raise ValueError('Invalid policy %s. It should be one of %s.' % (str(policy), str(self.POLICIES)))
+
+        self.max_size = max(int(max_size), 1)
+        self.policy = policy
+
+        self.frames = collections.deque()
+        self.condition = threading.Condition()
+        self.is_closed = False
+
+        self.put_frames = 0
+        self.dropped_frames = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def put(self, frame):
+        """
+        This method queues a frame, applying the backpressure policy if the queue is full
+
+        :param frame: (Frame) The frame
+        :return: Boolean (True if the frame was queued, False if it was dropped)
+        """
+        with self.condition:
+            if self.is_closed:
+                return False
+
+            self.put_frames += 1
+            if len(self.frames) >= self.max_size:
+                self.dropped_frames += 1
+                if self.policy == 'drop_newest':
+                    return False
+                self.frames.popleft()
+
+            self.frames.append(frame)
+            self.condition.notify()
+            return True
+
+    def close(self):
+        """
+        This method closes the queue. The consumer still receives the queued frames, then its iteration stops.
+
+        :return: Boolean (True or False)
+        """
+        with self.condition:
+            self.is_closed = True
+            self.condition.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """
+        This method waits for the next queued frame
+
+        :param timeout: (Float) The maximum number of seconds to wait (None waits until a frame is queued or the queue
+        is closed)
+        :return: (Frame) The frame, or None if the timeout expired or the queue is closed and empty
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: len(self.frames) > 0 or self.is_closed, timeout):
+                return None
+
+            if len(self.frames) == 0:
+                return None
+            return self.frames.popleft()
+
+    def __iter__(self):
+        """
+        This generator yields the queued frames until the queue is closed and empty
+        """
+        while True:
+            frame = self.get()
+            if frame is None:
+                return
+
+            yield frame
+
+    def get_stats(self):
+        """
+        This method returns the queue counters
+
+        :return: (Dictionary) The queue size, policy and the number of queued / dropped frames
+        """
+        return {
+            'size': len(self.frames),
+            'max_size': self.max_size,
+            'policy': self.policy,
+            'put_frames': self.put_frames,
+            'dropped_frames': self.dropped_frames
+        }
+
+
+# endregion FrameQueue
+
+
+# region frame sources
+def camera_frames(camera_handler, resolution=(1024, 768)):
+    """
+    This generator yields BGR frames from the Pi camera video port (the frames are copied out of one reused buffer)
+
+    :param camera_handler: (picamera.PiCamera) The camera
+    :param resolution: (Tuple) The (width, height) of the camera frames
+    """
+    (width, height) = resolution
+    buffer = np.empty((height, width, 3), dtype=np.uint8)
+
+    for (index, _) in enumerate(camera_handler.capture_continuous(buffer, format='bgr', use_video_port=True)):
+        yield Frame(index, 'camera', buffer.copy())
+
+
+def image_directory_frames(directory_path, extensions=('.jpg', '.jpeg', '.png', '.bmp'), loop=False):
+    """
+    This generator yields the image files of a directory (in name order). The files are decoded by the decode stage.
+
+    :param directory_path: (String) The image directory (e.g. \"./images\")
+    :param extensions: (Tuple) The accepted file extensions
+    :param loop: (Boolean) Whether or not the directory is replayed once all the images were yielded
+    """
+    file_paths = sorted(os.path.join(directory_path, file_name) for file_name in os.listdir(directory_path)
+                        if os.path.splitext(file_name)[1].lower() in extensions)
+    if len(file_paths) == 0:
+        return
+
+    index = 0
+    while True:
+        for file_path in file_paths:
+            yield Frame(index, file_path, file_path)
+            index += 1
+
+        if not loop:
+            return
+
+
+def video_file_frames(video_path, loop=False):
+    """
+    This generator yields the decoded frames of a video file (e.g. a recording from the \"videos\" folder)
+
+    :param video_path: (String) The video file path
+    :param loop: (Boolean) Whether or not the video is replayed once it ends
+    """
+    video_capture = cv2.VideoCapture(video_path)
+    try:
+        index = 0
+        while video_capture.isOpened():
+            (ret, image) = video_capture.read()
+            if not ret:
+                if loop and index > 0:
+                    video_capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                return
+
+            yield Frame(index, video_path, image)
+            index += 1
+    finally:
+        video_capture.release()
+
+
+def get_frame_source(source, loop=False):
+    """
+    This function returns the frame generator of a source
+
+    :param source: (String) \"camera\", an image directory or a video file path
+    :param loop: (Boolean) Whether or not a local source is replayed once it ends
+    :return: (Generator) The frame generator or False
+    """
+    try:
+        if source == 'camera':
+            from camera import pi_camera_handler
+            return camera_frames(pi_camera_handler.camera_handler, tuple(pi_camera_handler.camera_handler.resolution))
+
+        if os.path.isdir(source):
+            return image_directory_frames(source, loop=loop)
+
+        if os.path.isfile(source):
+            return video_file_frames(source, loop=loop)
+
+        console.log('Unknown frame source %s. It should be \'camera\', an image directory or a video file.'
+                    % str(source),
+                    console.LOG_WARNING,
+                    get_frame_source.__name__)
+        return False
+    except Exception as error_message:
+        console.log(error_message, console.LOG_ERROR, get_frame_source.__name__)
+        return False
+
+
+def paced_frames(frames, frame_rate):
+    """
+    This generator limits a local frame source to the camera frame rate
+
+    :param frames: (Generator) The frame generator
+    :param frame_rate: (Float) The frame rate in Hz
+    """
+    start_time = time.monotonic()
+    for (index, frame) in enumerate(frames):
+        delay = start_time + index / frame_rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        frame.captured_time = time.monotonic()
+        yield frame
+
+
+# endregion frame sources
+
+
+# region stages
+def decode_stage(frames, size=(800, 600), is_RGB=False):
+    """
+    This generator decodes (if needed), converts and resizes the frames to the size used by the corner detection
+
+    :param frames: (Iterable) The captured frames
+    :param size: (Tuple) The (width, height) of the processed images
+    :param is_RGB: (Boolean) Whether or not the colour is kept (grayscale otherwise)
+    """
+    for frame in frames:
+        if isinstance(frame.data, str):
+            image = cv2.imread(frame.data, cv2.IMREAD_COLOR if is_RGB else cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                console.log('The image %s could not be read.' % frame.data, console.LOG_WARNING,
+                            decode_stage.__name__)
+                continue
+        elif not is_RGB and frame.data.ndim == 3:
+            image = cv2.cvtColor(frame.data, cv2.COLOR_BGR2GRAY)
+        else:
+            image = frame.data
+
+        frame.image = cv2.resize(image, size)
+        frame.data = None
+        yield frame
+
+
+def detection_stage(frames, pattern_size=(7, 7), corner_tracker=None):
+    """
+    This generator finds the sorted inner chessboard corners of every frame (frames without a chessboard are dropped)
+
+    :param frames: (Iterable) The decoded frames
+    :param pattern_size: (Tuple) The number of (columns, rows) of inner corners
+    :param corner_tracker: (CornerTracker) The tracker used between full detections (None: detect every frame)
+    """
+    for frame in frames:
+        if corner_tracker is not None:
+            inner_corners = corner_tracker.track(frame.image)
+        else:
+            inner_corners = openCV_handler.detect_chessboard_inner_corners(frame.image, pattern_size)
+        if inner_corners is False:
+            continue
+
+        frame.inner_corners = inner_corners
+        yield frame
+
+
+def geometry_stage(frames, rectify=False):
+    """
+    This generator computes the chessboard lattice and the square corners of every frame
+
+    :param frames: (Iterable) The frames with inner corners
+    :param rectify: (Boolean) Whether or not every frame is also warped into the canonical top-down board
+    """
+    for frame in frames:
+        frame.lattice = openCV_handler.get_chessboard_lattice(frame.inner_corners)
+        frame.chessboard_positions = openCV_handler.get_chessboard_positions(frame.lattice)
+        if rectify:
+            rectified_image = openCV_handler.rectify_image(frame.image, frame.lattice)
+            frame.rectified_image = rectified_image if rectified_image is not False else None
+        yield frame
+
+
+# endregion stages
+
+
+# region VisionPipeline
+class VisionPipeline(object):
+    """
+    This class runs the capture, decode / resize, corner detection and geometry stages in their own threads. Every
+    stage reads from a bounded input queue, so a slow stage drops frames instead of growing the memory.
+    """
+    STAGES = ('capture', 'decode', 'detection', 'geometry')
+
+    def __init__(self, source='./images', frame_rate=None, queue_size=2, policy='drop_oldest', loop=False,
+                 size=(800, 600), is_RGB=False, pattern_size=(7, 7), tracking=False,
+                 rectify=False):
+        """
+        This constructor initializes the vision pipeline
+
+        :param source: (String) \"camera\", an image directory or a video file path
+        :param frame_rate: (Float) The rate at which a local source is replayed (None: as fast as possible)
+        :param queue_size: (Integer) The size of every stage queue
+        :param policy: (String) The backpressure policy of the queues (\"drop_oldest\" or \"drop_newest\")
+        :param loop: (Boolean) Whether or not a local source is replayed once it ends
+        :param size: (Tuple) The (width, height) of the processed images
+        :param is_RGB: (Boolean) Whether or not the colour is kept (grayscale otherwise)
+        :param pattern_size: (Tuple) The number of (columns, rows) of inner corners
+        :param tracking: (Boolean) Whether or not the corners are tracked between frames instead of being detected
+                         again on every frame
+        :param rectify: (Boolean) Whether or not every frame is warped into the canonical top-down board
+        """
+        self.source = source
+        self.frame_rate = frame_rate
+        self.loop = loop
+        self.size = size
+        self.is_RGB = is_RGB
+        self.pattern_size = pattern_size
+        self.corner_tracker = CornerTracker(pattern_size) if tracking else None
+        self.rectify = rectify
+
+        self.dict_queues = {stage: FrameQueue(queue_size, policy) for stage in self.STAGES[1:] + ('output',)}
+        self.dict_processed_frames = {stage: 0 for stage in self.STAGES}
+
+        self.latest_frame = None
+        self.latest_latency = None
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.started_time = None
+
+    def get_stage_generator(self, stage):
+        """
+        This method chains the generator of a stage to its input
+
+        :param stage: (String) The stage name
+        :return: (Generator) The stage generator or False
+        """
+        if stage == 'capture':
+            frames = get_frame_source(self.source, self.loop)
+            if frames is False:
+                return False
+            if self.frame_rate is not None and self.source != 'camera':
+                frames = paced_frames(frames, self.frame_rate)
+            return frames
+
+        if stage == 'decode':
+            return decode_stage(self.dict_queues['decode'], self.size, self.is_RGB)
+        if stage == 'detection':
+            return detection_stage(self.dict_queues['detection'], self.pattern_size, self.corner_tracker)
+        return geometry_stage(self.dict_queues['geometry'], self.rectify)
+
+    def run_stage(self, stage, frames, output_queue):
+        """
+        This method moves the frames of a stage generator into the next queue, until the source ends or the pipeline
+        is stopped
+
+        :param stage: (String) The stage name
+        :param frames: (Generator) The stage generator
+        :param output_queue: (FrameQueue) The input queue of the next stage
+        :return: Boolean (True or False)
+        """
+        try:
+            for frame in frames:
+                self.dict_processed_frames[stage] += 1
+                output_queue.put(frame)
+
+                if self.stop_event.is_set():
+                    break
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.run_stage.__name__)
+            return False
+        finally:
+            output_queue.close()
+
+    def start(self):
+        """
+        This method starts the stage threads
+
+        :return: Boolean (True or False)
+        """
+        try:
+            if len(self.threads) > 0:
+                console.log('The vision pipeline has already been started.', console.LOG_WARNING,
+                            self.start.__name__)
+                return False
+
+            output_queues = [self.dict_queues[stage] for stage in self.STAGES[1:] + ('output',)]
+            generators = [self.get_stage_generator(stage) for stage in self.STAGES]
+            if generators[0] is False:
+                return False
+
+            self.started_time = time.monotonic()
+            for (stage, frames, output_queue) in zip(self.STAGES, generators, output_queues):
+                thread = threading.Thread(target=self.run_stage, args=(stage, frames, output_queue), daemon=True)
+                self.threads.append(thread)
+                thread.start()
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.start.__name__)
+            return False
+
+    def stop(self):
+        """
+        This method stops the pipeline (the frames that are still queued are discarded)
+
+        :return: Boolean (True or False)
+        """
+        try:
+            self.stop_event.set()
+            for frame_queue in self.dict_queues.values():
+                frame_queue.close()
+
+            return True
+        except Exception as error_message:
+            console.log(error_message, console.LOG_ERROR, self.stop.__name__)
+            return False
+
+    def results(self):
+        """
+        This generator yields the frames that went through every stage (with their corners and chessboard geometry),
+        until the source ends or the pipeline is stopped
+        """
+        for frame in self.dict_queues['output']:
+            self.latest_frame = frame
+            self.latest_latency = frame.get_latency()
+            yield frame
+
+            if self.stop_event.is_set():
+                return
+
+    def get_result(self, timeout=None):
+        """
+        This method waits for the next frame that went through every stage
+
+        :param timeout: (Float) The maximum number of seconds to wait (None waits until a frame is available or the
+        pipeline ends)
+        :return: (Frame) The frame, or None if the timeout expired or the pipeline ended
+        """
+        if self.stop_event.is_set():
+            return None
+
+        frame = self.dict_queues['output'].get(timeout)
+        if frame is not None:
+            self.latest_frame = frame
+            self.latest_latency = frame.get_latency()
+        return frame
+
+    def is_finished(self):
+        """
+        This method checks if the pipeline will not produce any other frame (its source ended or it was stopped)
+
+        :return: Boolean (True or False)
+        """
+        output_queue = self.dict_queues['output']
+        return self.stop_event.is_set() or (output_queue.is_closed and len(output_queue) == 0)
+
+    def get_stats(self):
+        """
+        This method returns the number of frames processed by every stage and the queue counters
+
+        :return: (Dictionary) The pipeline statistics
+        """
+        elapsed_time = (time.monotonic() - self.started_time) if self.started_time is not None else 0
+        return {
+            'source': self.source,
+            'elapsed_time': elapsed_time,
+            'processed_frames': dict(self.dict_processed_frames),
+            'frame_rates': {
+                stage: (processed_frames / elapsed_time) if elapsed_time > 0 else 0
+                for (stage, processed_frames) in self.dict_processed_frames.items()
+            },
+            'queues': {stage: frame_queue.get_stats() for (stage, frame_queue) in self.dict_queues.items()},
+            'latest_latency': self.latest_latency,
+            'tracking': self.corner_tracker.get_stats() if self.corner_tracker is not None else None,
+            'homography_updates': openCV_handler.number_of_homography_updates
+        }
+
+
+# endregion VisionPipeline